@@ -0,0 +1,1578 @@
+"""Redis Cache. Requires redis-py >= 3.5."""
+# pylint: disable=relative-import, missing-docstring, too-few-public-methods
+
+import collections
+import itertools
+import re
+import time
+
+import redis
+import six
+
+from chassis.services import data_context
+from chassis.services.cache import instrumentation
+from chassis.services.cache import replication
+from chassis.services.cache import sharding
+
+try:
+    from redis import cluster as redis_cluster
+except ImportError:  # redis-py < 4.1
+    redis_cluster = None  # pylint: disable=invalid-name
+
+
+class CacheConnectionError(data_context.DataSourceConnectionError):
+    """Cache Connection Error"""
+
+
+WRITE_MODES = (None, 'nx', 'xx')
+
+# Prepended to an object's first redis key (or hash key), wrapped in a hash
+# tag unless it has one, to name the tombstone marking it absent. Tombstones
+# thus live in their own namespace, on the same shard or slot as the key.
+TOMBSTONE_PREFIX = 'absent:'
+
+
+class _Absent(object):
+    """Type of ABSENT."""
+    # pylint: disable=too-few-public-methods
+
+    def __bool__(self):
+        return False
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return 'ABSENT'
+
+
+# Returned by retrieve_object for objects marked absent with mark_absent.
+ABSENT = _Absent()
+
+
+class Template(dict):
+    """A key template that carries options for the objects it describes.
+
+    Accepted anywhere a template dictionary is. Example:
+
+        USER = Template({'username': 'user:%(id)s:username',
+                         'session': 'user:%(id)s:session'},
+                        ttl={'username': 86400, 'session': 900})
+
+    Objects can also be packed into a single Redis hash per object, which
+    saves the per-key overhead of storing every field as its own key:
+
+        USER = Template.hash('user:%(id)s', ['username', 'email'], ttl=3600)
+
+    Arguments:
+        fields: a dictionary of object keys to redis key templates, or to
+            hash field names when hash_key is given.
+        ttl: the time to live in seconds of every key, or a dictionary
+            mapping object keys to their time to live. Keys without a time
+            to live are kept until deleted.
+        hash_key: a redis key template. When given, each object is stored
+            in the hash under that key. A hash has a single time to live,
+            so ttl cannot be a dictionary.
+        negative_ttl: when given, objects can be marked absent for that
+            many seconds with mark_absent, and retrieve_object checks for
+            the mark, in the same round trip, before reporting a miss.
+            Setting an object clears its mark. retrieve_objects ignores
+            marks.
+
+    """
+
+    def __init__(self, fields, ttl=None, hash_key=None, negative_ttl=None):
+        if hash_key is not None and isinstance(ttl, dict):
+            raise ValueError('Hash templates take a single ttl')
+        super(Template, self).__init__(fields)
+        self.ttl = ttl
+        self.hash_key = hash_key
+        self.negative_ttl = negative_ttl
+
+    @classmethod
+    def hash(cls, hash_key, keys, ttl=None, negative_ttl=None):
+        """Return a hash template storing each object key as a field."""
+        return cls(dict((key, key) for key in keys), ttl=ttl,
+                   hash_key=hash_key, negative_ttl=negative_ttl)
+
+
+# Joins the key templates of a CompiledTemplate so that all its keys are
+# interpolated at once; it never appears in real keys.
+_KEY_SEPARATOR = '\x00'
+
+
+class CompiledTemplate(Template):
+    """A Template with its redis keys precompiled.
+
+    Accepted anywhere a template dictionary is. The object keys are put in
+    a fixed order once, and the redis keys of an object are built with a
+    single interpolation (or, for hash templates, by appending the
+    precomputed field suffixes to the hash key) instead of one per key:
+
+        USER = CompiledTemplate({'username': 'user:%(id)s:username',
+                                 'email': 'user:%(id)s:email'},
+                                ttl=3600, prefix='myapp:')
+
+    Arguments:
+        fields, ttl, hash_key, negative_ttl: see Template.
+        prefix: prepended to every key template (to the hash key for hash
+            templates), e.g. to namespace an application's keys.
+
+    A CompiledTemplate must not be modified once built.
+
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, fields, ttl=None, hash_key=None, prefix='',
+                 negative_ttl=None):
+        if hash_key is None:
+            fields = dict((key, prefix + value)
+                          for (key, value) in fields.items())
+        else:
+            hash_key = prefix + hash_key
+        super(CompiledTemplate, self).__init__(fields, ttl=ttl,
+                                               hash_key=hash_key,
+                                               negative_ttl=negative_ttl)
+        self.order = tuple(self.keys())
+        self.key_set = frozenset(self.order)
+        self._positions = dict((key, position)
+                               for (position, key) in enumerate(self.order))
+        templates = [self[key] for key in self.order]
+        self._joined = None
+        if hash_key is None and not any(_KEY_SEPARATOR in template
+                                        for template in templates):
+            self._joined = _KEY_SEPARATOR.join(templates)
+        self._suffixes = tuple('#%s' % field for field in templates)
+
+    @classmethod
+    def compile(cls, template, prefix=''):
+        """Return a CompiledTemplate for a template dictionary."""
+        return cls(template, ttl=getattr(template, 'ttl', None),
+                   hash_key=getattr(template, 'hash_key', None),
+                   prefix=prefix,
+                   negative_ttl=getattr(template, 'negative_ttl', None))
+
+    def redis_keys(self, indexes, keys=None):
+        """Return the redis keys of an object's values, for keys or for
+        every key in order."""
+        if self.hash_key is not None:
+            hash_key = self.hash_key % indexes
+            redis_keys = [hash_key + suffix for suffix in self._suffixes]
+        elif self._joined is not None:
+            redis_keys = (self._joined % indexes).split(_KEY_SEPARATOR)
+            if len(redis_keys) != len(self.order):
+                # An index value contained the separator.
+                redis_keys = [self[key] % indexes for key in self.order]
+        else:
+            redis_keys = [self[key] % indexes for key in self.order]
+        if keys is None or keys is self.order:
+            return redis_keys
+        return [redis_keys[self._positions[key]] for key in keys]
+
+    def present_keys(self, data):
+        """Return the object keys found in data, in order."""
+        if self.key_set.issubset(data):
+            return self.order
+        return tuple(key for key in self.order if key in data)
+
+
+class Cache(data_context.DatasourceContext):
+    """Cache context manager
+
+    Stores configuration properties and opens a new connection when called from
+    a handler or service using with.
+
+    Pass a chassis.services.cache.local.LocalCache as `local_cache` to keep
+    an in-process copy of the values read and written through the helpers
+    in this module, and attach a chassis.services.cache.invalidation
+    .Invalidator to keep those copies coherent across processes. Reads
+    fetch the remaining time to live of the keys they copy in the same
+    round trip, so local copies never outlive their Redis keys.
+
+    Pass a chassis.services.cache.codecs.Codec as `codec` to have the
+    helpers serialize the values they write and deserialize the values they
+    read, instead of storing str(value). Connections must then return bytes
+    (the default, decode_responses=False).
+
+    Pass a chassis.services.metrics.Metrics as `metrics` to also record
+    pool checkouts and the latency of every command and pipeline; see
+    chassis.services.cache.instrumentation.
+
+    Pass `pool_timeout` to bound the pool at the `max_connections` setting
+    (50 by default): commands then wait up to pool_timeout seconds for a
+    free connection and raise redis.ConnectionError when none frees up,
+    instead of opening ever more connections to a struggling Redis. Pair it
+    with a `circuit_breaker` (see DatasourceContext) to fail fast with
+    CacheConnectionError once Redis keeps failing.
+
+    To spread keys over several Redis servers, pass a list of settings (or
+    of Cache instances, to configure shards individually) instead of a
+    single settings dictionary; see chassis.services.cache.sharding. The
+    helpers in this module split their keys per shard and run the shards'
+    pipelines concurrently; `with` blocks must pick a shard with
+    shard_for. Other keyword arguments apply to every shard, and
+    `replicas` sets the number of virtual nodes per shard. Each shard gets
+    its own copy of the `circuit_breaker`, so that one shard failing does
+    not cut the others off, and labels its pool gauges with its name.
+
+    To use a Redis Cluster, pass `cluster=True` and RedisCluster settings
+    (host and port of a node, or `startup_nodes` as a list of host and port
+    dictionaries). Commands are then routed by redis-py, and the helpers
+    avoid multi-key commands spanning slots. Requires redis-py >= 4.1.
+
+    To read from replicas, pass their settings (or Cache instances) as
+    `read_replicas`; see chassis.services.cache.replication. The read
+    helpers then spread their reads over the replicas per `read_strategy`
+    (replication.ROUND_ROBIN or replication.LEAST_LATENCY) and read from
+    the primary when called with consistent=True, or when the replicas
+    fail or lag more than `max_replica_lag` seconds (checked every
+    `replica_check` seconds). A failed replica is skipped for
+    `replica_retry` seconds. Sharded caches take their replicas per shard,
+    as Cache instances.
+
+    """
+
+    connection_errors = (redis.ConnectionError, redis.TimeoutError)
+
+    connection_error_class = CacheConnectionError
+
+    shards = None
+
+    cluster = False
+
+    read_replicas = None
+
+    def __init__(self, *args, **kwargs):
+        self.settings = args[0]
+        self.local_cache = kwargs.pop('local_cache', None)
+        self.codec = kwargs.pop('codec', None)
+        pool_timeout = kwargs.pop('pool_timeout', None)
+        metrics_label = kwargs.pop('metrics_label', None)
+        cluster = kwargs.pop('cluster', False)
+        replicas = kwargs.pop('replicas', 160)
+        read_replicas = kwargs.pop('read_replicas', None)
+        replication_settings = dict(
+            strategy=kwargs.pop('read_strategy', replication.ROUND_ROBIN),
+            max_lag=kwargs.pop('max_replica_lag', None),
+            check=kwargs.pop('replica_check', 1),
+            retry=kwargs.pop('replica_retry', 5))
+        self.invalidator = None
+        super(Cache, self).__init__(*args, **kwargs)
+        if read_replicas:
+            if isinstance(self.settings, (list, tuple)) or cluster:
+                raise ValueError('Give sharded caches read_replicas per '
+                                 'shard; clusters route reads themselves')
+            self.read_replicas = replication.Replicas(
+                self, [replica if isinstance(replica, Cache) else Cache(
+                    replica, codec=self.codec, pool_timeout=pool_timeout,
+                    metrics=self.metrics,
+                    metrics_label=('replica', sharding.shard_name(replica)))
+                       for replica in read_replicas], **replication_settings)
+        if isinstance(self.settings, (list, tuple)):
+            self.shards = sharding.Shards(
+                [shard if isinstance(shard, Cache) else self._shard(
+                    shard, pool_timeout, kwargs)
+                 for shard in self.settings], replicas)
+            return
+        if cluster:
+            if redis_cluster is None:
+                raise ImportError('cluster=True requires redis-py >= 4.1')
+            settings = dict(self.settings)
+            if 'startup_nodes' in settings:
+                settings['startup_nodes'] = [
+                    redis_cluster.ClusterNode(**node)
+                    for node in settings['startup_nodes']]
+            self.cluster = True
+            self._client = redis_cluster.RedisCluster(**settings)
+            return
+        settings = dict(self.settings)
+        if pool_timeout is None:
+            pool_classes = (redis.ConnectionPool,
+                            instrumentation.InstrumentedConnectionPool)
+        else:
+            pool_classes = (redis.BlockingConnectionPool,
+                            instrumentation.InstrumentedBlockingConnectionPool)
+            settings['timeout'] = pool_timeout
+        if self.metrics is None:
+            self._pool = pool_classes[0](**settings)
+            self._client_class = redis.StrictRedis
+        else:
+            self._pool = pool_classes[1](self.metrics,
+                                         metrics_label=metrics_label,
+                                         **settings)
+            self._client_class = instrumentation.InstrumentedStrictRedis
+
+    def _shard(self, settings, pool_timeout, kwargs):
+        """Return the Cache of a shard, with its own circuit breaker."""
+        kwargs = dict(kwargs)
+        if self.circuit_breaker is not None:
+            kwargs['circuit_breaker'] = self.circuit_breaker.copy()
+        return Cache(settings, local_cache=self.local_cache,
+                     codec=self.codec, pool_timeout=pool_timeout,
+                     metrics_label=('shard', sharding.shard_name(settings)),
+                     **kwargs)
+
+    def _get_connection(self):
+        if self.shards is not None:
+            raise TypeError('A sharded Cache has no single connection; '
+                            'use shard_for(redis_key)')
+        if self.cluster:
+            return self._client
+        return self._client_class(connection_pool=self._pool)
+
+    def shard_for(self, redis_key):
+        """Return the Cache holding redis_key: its shard, or this cache
+        when it is not sharded."""
+        if self.shards is None:
+            return self
+        return self.shards.shard_for(redis_key)
+
+    def _close_connection(self):
+        """Finish up.
+
+        No need to close the connection:
+        http://stackoverflow.com/questions/12967107/managing-connection-to-redis-from-python
+        """
+        pass
+
+    def insert(self, query, params):
+        """Nothing to implement"""
+        # noop
+        return
+
+    def read_many(self, keys):
+        """Return the values of keys, as multi_get does; lets request
+        scopes batch their reads into one MGET."""
+        return multi_get(self, keys)
+
+
+def _hash_key(template, indexes):
+    """Return the key of the hash holding an object, or None."""
+    hash_key = getattr(template, 'hash_key', None)
+    return None if hash_key is None else hash_key % indexes
+
+
+def _template_keys(template):
+    """Return the object keys of a template, in order."""
+    if isinstance(template, CompiledTemplate):
+        return template.order
+    return list(template.keys())
+
+
+def _object_keys(template, indexes, keys=None):
+    """Return object keys of a template and the redis keys of their values.
+
+    The values of hash templates are identified as '<hash key>#<field>' in
+    the local tier and in invalidations.
+    """
+    if keys is None:
+        keys = _template_keys(template)
+    if isinstance(template, CompiledTemplate):
+        return keys, template.redis_keys(indexes, keys)
+    hash_key = _hash_key(template, indexes)
+    if hash_key is None:
+        return keys, [template[key] % indexes for key in keys]
+    return keys, ['%s#%s' % (hash_key, template[key]) for key in keys]
+
+
+def _tombstone_key(template, indexes, redis_keys=None):
+    """Return the key of the tombstone marking an object absent, or None
+    if its template does not use tombstones."""
+    if getattr(template, 'negative_ttl', None) is None:
+        return None
+    hash_key = _hash_key(template, indexes)
+    if hash_key is None:
+        if redis_keys is None:
+            redis_keys = _object_keys(template, indexes)[1]
+        hash_key = min(redis_keys)
+    if sharding.hash_tag(hash_key) == hash_key:
+        hash_key = '{%s}' % hash_key
+    return TOMBSTONE_PREFIX + hash_key
+
+
+def _queue_clear_tombstones(pipe, template, list_of_indexes):
+    """Queue the deletion of the tombstones of objects being written, after
+    the writes. Their results are left unread."""
+    tombstones = [_tombstone_key(template, indexes)
+                  for indexes in list_of_indexes]
+    for tombstone in tombstones:
+        if tombstone is not None:
+            pipe.delete(tombstone)
+
+
+def _resolve_ttl(template, ttl):
+    """Return the per-call ttl, or the template's when there is none."""
+    if ttl is None:
+        return getattr(template, 'ttl', None)
+    return ttl
+
+
+def _field_ttl(ttl, key):
+    """Return the time to live of one object key."""
+    if isinstance(ttl, dict):
+        return ttl.get(key)
+    return ttl
+
+
+def _object_values(template, indexes, data, ttl=None):
+    """Return the object keys present in data and their values as
+    (redis key, value, ttl) items."""
+    if isinstance(ttl, dict) and _hash_key(template, indexes) is not None:
+        raise ValueError('Hash templates take a single ttl')
+    if isinstance(template, CompiledTemplate):
+        keys = template.present_keys(data)
+    else:
+        keys = [key for key in template.keys() if key in data]
+    keys, redis_keys = _object_keys(template, indexes, keys)
+    if isinstance(ttl, dict):
+        ttls = [ttl.get(key) for key in keys]
+    else:
+        ttls = itertools.repeat(ttl)
+    return keys, [(redis_key, _string(data[key]), key_ttl)
+                  for (key, redis_key, key_ttl) in zip(keys, redis_keys, ttls)]
+
+
+def _read(cache, func, consistent=False):
+    """Return func(redis_connection), run on a read replica when the
+    cache has some and consistent is False."""
+    if cache.read_replicas is None:
+        with cache as redis_connection:
+            return func(redis_connection)
+    return cache.read_replicas.read(func, consistent)
+
+
+def _is_cluster(connection):
+    """Return whether a client or pipeline talks to a Redis Cluster."""
+    return (redis_cluster is not None
+            and isinstance(connection, redis_cluster.RedisCluster))
+
+
+def _string(value):
+    """Convert a value to store to a string, leaving bytes untouched."""
+    return value if isinstance(value, six.binary_type) else str(value)
+
+
+def _write_flags(mode):
+    """Return the SET keyword arguments for a write mode."""
+    if mode not in WRITE_MODES:
+        raise ValueError('mode must be one of %s' % (WRITE_MODES, ))
+    return {'nx': mode == 'nx', 'xx': mode == 'xx'}
+
+
+def _queue_set(pipe, items, mode):
+    """Queue a SET for each (redis key, value, ttl) onto a pipeline.
+
+    The time to live and the write mode ride on the SET command itself, so
+    they cost no extra commands.
+    """
+    flags = _write_flags(mode)
+    for (redis_key, value, ttl) in items:
+        pipe.set(redis_key, value, ex=ttl, **flags)
+
+
+def _queue_get(pipe, template, indexes, keys, redis_keys):
+    """Queue the reads of some of an object's values onto a pipeline.
+
+    redis_keys are the redis keys of keys, as returned by _object_keys.
+
+    Returns a function that takes an iterator over the pipeline results and
+    returns the values, in the order of keys.
+    """
+    hash_key = _hash_key(template, indexes)
+    if hash_key is None:
+        for redis_key in redis_keys:
+            pipe.get(redis_key)
+        return lambda results: [next(results) for _ in keys]
+    pipe.hmget(hash_key, [template[key] for key in keys])
+    return next
+
+
+def _queue_mget(pipe, redis_keys, chunk_size=None):
+    """Queue the reads of string keys onto a pipeline, with MGET commands of
+    chunk_size keys (one for all keys when chunk_size is None).
+
+    Returns a function that takes an iterator over the pipeline results and
+    returns the values, in the order of redis_keys.
+    """
+    if _is_cluster(pipe):
+        # Keys in different slots cannot share an MGET.
+        for redis_key in redis_keys:
+            pipe.get(redis_key)
+        return lambda results: [next(results) for _ in redis_keys]
+    chunks = _chunks(redis_keys, chunk_size)
+    for chunk in chunks:
+        pipe.mget(chunk)
+    return lambda results: [value for _ in chunks for value in next(results)]
+
+
+def _queue_ttls(pipe, cache, ttl_keys):
+    """Queue a PTTL of each distinct key of ttl_keys onto a pipeline when
+    the cache has a local tier, so that read-through fills of the local
+    tier expire no later than the Redis keys they copy.
+
+    Returns a function that takes an iterator over the pipeline results and
+    returns, for each of ttl_keys, its remaining time to live in seconds
+    (0 if it is gone, None if it has none), or None for all keys when the
+    cache has no local tier.
+    """
+    if cache.local_cache is None:
+        return lambda results: None
+    distinct = list(collections.OrderedDict.fromkeys(ttl_keys))
+    for key in distinct:
+        pipe.pttl(key)
+
+    def take(results):
+        remaining = {}
+        for key in distinct:
+            milliseconds = next(results)
+            remaining[key] = (None if milliseconds == -1
+                              else max(milliseconds, 0) / 1000.)
+        return [remaining[key] for key in ttl_keys]
+    return take
+
+
+def _value_ttl_keys(template, list_of_indexes, width, redis_keys,
+                    positions):
+    """Return the redis key holding the value at each of positions of
+    objects of width values laid out one after another with their
+    redis_keys: the hash of hash templates, the value's own key otherwise.
+    """
+    hash_key = getattr(template, 'hash_key', None)
+    if hash_key is None:
+        return [redis_keys[position] for position in positions]
+    return [hash_key % list_of_indexes[position // width]
+            for position in positions]
+
+
+def _queue_get_many(pipe, template, list_of_indexes, keys, redis_keys,
+                    missing, chunk_size):
+    """Queue the reads of the values at the missing positions of several
+    objects, laid out one after another in the order of keys with their
+    redis_keys.
+
+    Returns a function that takes an iterator over the pipeline results and
+    returns the values, in the order of missing.
+    """
+    width = len(keys)
+    if getattr(template, 'hash_key', None) is None:
+        return _queue_mget(pipe, [redis_keys[position]
+                                  for position in missing], chunk_size)
+    takes = []
+    for (index, positions) in itertools.groupby(
+            missing, lambda position: position // width):
+        takes.append(_queue_get(pipe, template, list_of_indexes[index],
+                                [keys[position % width]
+                                 for position in positions], None))
+    return lambda results: [value for take in takes
+                            for value in take(results)]
+
+
+def _queue_set_object(pipe, template, indexes, keys, items, mode):
+    """Queue the writes of an object's (redis key, value, ttl) items.
+
+    Returns a function that takes an iterator over the pipeline results and
+    returns whether each item was written.
+    """
+    hash_key = _hash_key(template, indexes)
+    if hash_key is None:
+        _queue_set(pipe, items, mode)
+        return lambda results: [next(results) for _ in items]
+    if mode == 'xx':
+        raise ValueError('Hash templates do not support mode "xx"')
+    _write_flags(mode)
+    if mode == 'nx':
+        for (key, item) in zip(keys, items):
+            pipe.hsetnx(hash_key, template[key], item[1])
+    else:
+        pipe.hset(hash_key, mapping=dict(
+            (template[key], item[1]) for (key, item) in zip(keys, items)))
+    ttl = items[0][2]
+    if ttl is not None:
+        pipe.expire(hash_key, ttl)
+
+    def take(results):
+        if mode == 'nx':
+            written = [next(results) for _ in items]
+        else:
+            next(results)
+            written = [True] * len(items)
+        if ttl is not None:
+            next(results)
+        return written
+    return take
+
+
+def _queue_delete_object(pipe, template, indexes, redis_keys):
+    """Queue the deletion of an object onto a pipeline."""
+    hash_key = _hash_key(template, indexes)
+    if hash_key is not None:
+        pipe.delete(hash_key)
+        return
+    for redis_key in redis_keys:
+        pipe.delete(redis_key)
+
+
+def _queue_refresh(pipe, template, indexes, keys, ttl):
+    """Queue an EXPIRE for each of an object's keys with a time to live."""
+    hash_key = _hash_key(template, indexes)
+    if hash_key is not None:
+        if ttl is not None:
+            pipe.expire(hash_key, ttl)
+        return
+    for key in keys:
+        key_ttl = _field_ttl(ttl, key)
+        if key_ttl is not None:
+            pipe.expire(template[key] % indexes, key_ttl)
+
+
+def _object_writes(template, list_of_indexes, list_of_data, ttl):
+    """Return (indexes, object keys, items) for each object with values to
+    write, and all their items."""
+    writes = []
+    for (indexes, data) in zip(list_of_indexes, list_of_data):
+        keys, items = _object_values(template, indexes, data, ttl)
+        if items:
+            writes.append((indexes, keys, items))
+    return writes, [item for (_, _, items) in writes for item in items]
+
+
+def _queue_set_objects(pipe, template, writes, items, mode, chunk_size):
+    """Queue the writes of several objects onto a pipeline.
+
+    Plain writes of string templates are sent as MSET commands of at most
+    chunk_size keys. Returns a function that takes an iterator over the
+    pipeline results and returns whether each item was written.
+    """
+    if (getattr(template, 'hash_key', None) is None and mode is None
+            and not _is_cluster(pipe)
+            and all(item[2] is None for item in items)):
+        chunks = _chunks(items, chunk_size)
+        for chunk in chunks:
+            pipe.mset(dict((redis_key, value)
+                           for (redis_key, value, _) in chunk))
+
+        def take_mset(results):
+            for _ in chunks:
+                next(results)
+            return [True] * len(items)
+        return take_mset
+    takes = [_queue_set_object(pipe, template, indexes, keys, object_items,
+                               mode)
+             for (indexes, keys, object_items) in writes]
+    return lambda results: [written for take in takes
+                            for written in take(results)]
+
+
+def _chunks(items, chunk_size):
+    """Split items into lists of at most chunk_size (None for one list)."""
+    if chunk_size is None:
+        return [items]
+    return [items[start:start + chunk_size]
+            for start in range(0, len(items), chunk_size)]
+
+
+def _collect_object(cache, keys, results):
+    """Build an object from pipeline results, or None if any are missing."""
+    if None in results:
+        return None
+    return dict(zip(keys, _decode(cache, results)))
+
+
+def _collect_partial(cache, keys, results):
+    """Build (object, missing keys) from pipeline results, the object
+    holding the values found."""
+    found = [position for (position, value) in enumerate(results)
+             if value is not None]
+    return (dict(zip([keys[position] for position in found],
+                     _decode(cache, [results[position]
+                                     for position in found]))),
+            [key for (key, value) in zip(keys, results) if value is None])
+
+
+def _object_result(cache, keys, results, absent, partial):
+    """Return what retrieve_object returns for its pipeline results."""
+    if absent:
+        return (ABSENT, []) if partial else ABSENT
+    if partial:
+        return _collect_partial(cache, keys, results)
+    return _collect_object(cache, keys, results)
+
+
+def _encode_object(cache, template, data):
+    """Encode the values of data that the template stores."""
+    if cache.codec is None:
+        return data
+    return dict((key, cache.codec.encode(value))
+                for (key, value) in data.items() if key in template)
+
+
+def _encode(cache, value):
+    """Encode a value to store."""
+    return value if cache.codec is None else cache.codec.encode(value)
+
+
+def _decode(cache, values):
+    """Decode a list of values read from Redis."""
+    if cache.codec is None:
+        return values
+    return [cache.codec.decode(value) for value in values]
+
+
+def _get_encoder(cache, redis_key):
+    """Return the encoder of the client storing redis_key."""
+    # pylint: disable=protected-access
+    if getattr(cache, 'shards', None) is not None:
+        cache = cache.shard_for(redis_key)
+    if getattr(cache, 'cluster', False):
+        return cache._client.get_encoder()
+    return cache._pool.get_encoder()
+
+
+def _stored_value(cache, value, redis_key=''):
+    """Return value the way a read of redis_key will hand it back."""
+    encoder = _get_encoder(cache, redis_key)
+    return encoder.decode(encoder.encode(value))
+
+
+def _lookup_local(cache, redis_keys):
+    """Look redis_keys up in the local tier of cache.
+
+    Returns a list of results holding the locally cached values (None where
+    there was no entry) and the positions of the keys that must be fetched
+    from Redis.
+    """
+    if cache.local_cache is None:
+        return [None] * len(redis_keys), list(range(len(redis_keys)))
+    results = [cache.local_cache.get(key) for key in redis_keys]
+    return results, [position for (position, value) in enumerate(results)
+                     if value is None]
+
+
+def _fill_local(cache, redis_keys, results, missing, fetched, ttls=None):
+    """Merge values fetched from Redis into results and the local tier.
+
+    ttls are the remaining times to live of the fetched values, as taken by
+    _queue_ttls; local entries never outlive them.
+    """
+    local_cache = cache.local_cache
+    if ttls is None:
+        ttls = itertools.repeat(None)
+    for (position, value, ttl) in zip(missing, fetched, ttls):
+        results[position] = value
+        if local_cache is None or value is None:
+            continue
+        if ttl is None:
+            local_cache.set(redis_keys[position], value)
+        elif ttl > 0:
+            if local_cache.ttl is not None:
+                ttl = min(ttl, local_cache.ttl)
+            local_cache.set(redis_keys[position], value, ttl=ttl)
+    return results
+
+
+def _store_local(cache, items):
+    """Write (redis key, value, ttl) items through to the local tier.
+
+    Local entries never outlive the Redis keys they copy.
+    """
+    local_cache = cache.local_cache
+    if local_cache is not None:
+        for (redis_key, value, ttl) in items:
+            if local_cache.ttl is not None and ttl is not None:
+                ttl = min(ttl, local_cache.ttl)
+            local_cache.set(redis_key, _stored_value(cache, value, redis_key),
+                            ttl=ttl)
+    if cache.invalidator is not None:
+        cache.invalidator.publish([item[0] for item in items])
+
+
+def _store_written(cache, items, results):
+    """Update the local tier after queued SETs ran.
+
+    Items whose SET was skipped because of the write mode are evicted
+    rather than written through. Returns True if every item was written.
+    """
+    written = [item for (item, result) in zip(items, results) if result]
+    _store_local(cache, written)
+    if len(written) == len(items):
+        return True
+    _evict_local(cache, [item[0] for (item, result) in zip(items, results)
+                         if not result])
+    return False
+
+
+def _evict_local(cache, redis_keys):
+    """Invalidate redis_keys in the local tier."""
+    if cache.local_cache is not None:
+        cache.local_cache.delete(*redis_keys)
+    if cache.invalidator is not None:
+        cache.invalidator.publish(redis_keys)
+
+
+def _shard_template(cache, template, indexes):
+    """Return (shard, template) pairs covering an object's keys.
+
+    Objects of hash templates, and objects whose keys share a hash tag, live
+    on a single shard and keep their template.
+    """
+    hash_key = _hash_key(template, indexes)
+    if hash_key is not None:
+        return [(cache.shards.shard_for(hash_key), template)]
+    keys, redis_keys = _object_keys(template, indexes)
+    groups = cache.shards.group(redis_keys)
+    if len(groups) == 1:
+        return [(groups[0][0], template)]
+    ttl = getattr(template, 'ttl', None)
+    return [(shard, Template(dict((keys[position], template[keys[position]])
+                                  for position in positions), ttl=ttl))
+            for (shard, positions) in groups]
+
+
+def _merge_objects(parts):
+    """Merge the parts of an object read from several shards."""
+    merged = {}
+    for part in parts:
+        if part is None:
+            return None
+        merged.update(part)
+    return merged
+
+
+def _sharded_objects(cache, template, list_of_indexes):
+    """Plan the shard calls for several objects.
+
+    Returns (shard, template, positions) for each call to make: one per
+    shard for the objects living on a single shard, and one per part of the
+    other objects.
+    """
+    whole = collections.OrderedDict()
+    parts = []
+    for (position, indexes) in enumerate(list_of_indexes):
+        pairs = _shard_template(cache, template, indexes)
+        if len(pairs) == 1:
+            whole.setdefault(pairs[0][0], []).append(position)
+        else:
+            parts.extend((shard, part, [position])
+                         for (shard, part) in pairs)
+    return [(shard, template, positions)
+            for (shard, positions) in whole.items()] + parts
+
+
+def retrieve_object(cache, template, indexes, ttl=None, refresh_ttl=False,
+                    consistent=False, partial=False):
+    """Retrieve an object from Redis using a pipeline.
+
+    Arguments:
+        template: a dictionary containg the keys for the object and
+            template strings for the corresponding redis keys. The template
+            string uses named string interpolation format. Example:
+
+            {
+                'username': 'user:$(id)s:username',
+                'email': 'user:$(id)s:email',
+                'phone': 'user:$(id)s:phone'
+            }
+
+        indexes: a dictionary containing the values to use to cosntruct the
+            redis keys: Example:
+
+            {
+                'id': 342
+            }
+
+    Returns: a dictionary with the same keys as template, but containing
+        the values retrieved from redis, if all the values are retrieved.
+        If any value is missing, returns None. Example:
+
+        {
+            'username': 'bob',
+            'email': 'bob@example.com',
+            'phone': '555-555-5555'
+        }
+
+        ttl: the time to live used by refresh_ttl, in seconds or as a
+            dictionary per object key. Defaults to the template's.
+
+        refresh_ttl: if True, reset the time to live of the keys read from
+            Redis in the same pipeline, keeping frequently read objects
+            alive. Values served by the local tier are not refreshed.
+            The keys are then read from the primary.
+
+        consistent: if True, read from the primary rather than from a
+            read replica.
+
+        partial: if True, return (object, missing keys) instead, the
+            object holding the values found, so that callers can backfill
+            only the missing keys.
+
+    Returns ABSENT (or (ABSENT, []) when partial) instead if the template
+    has a negative_ttl and the object was marked absent with mark_absent.
+    ABSENT is false.
+
+    """
+    # pylint: disable=too-many-arguments, too-many-locals
+    if cache.shards is not None:
+        tombstone = _tombstone_key(template, indexes)
+        if tombstone is not None and _read(
+                cache.shard_for(tombstone),
+                lambda redis_connection: redis_connection.exists(tombstone),
+                consistent):
+            return (ABSENT, []) if partial else ABSENT
+        parts = cache.shards.run([
+            (retrieve_object,
+             (shard, part, indexes, ttl, refresh_ttl, consistent, partial))
+            for (shard, part) in _shard_template(cache, template, indexes)])
+        if not partial:
+            return _merge_objects(parts)
+        if any(part is ABSENT for (part, _) in parts):
+            return (ABSENT, [])
+        return (_merge_objects([part for (part, _) in parts]),
+                [key for (_, missing) in parts for key in missing])
+    keys, redis_keys = _object_keys(template, indexes)
+    tombstone = _tombstone_key(template, indexes, redis_keys)
+    results, missing = _lookup_local(cache, redis_keys)
+    absent = False
+    if missing:
+        missing_keys = [keys[position] for position in missing]
+
+        def fetch(redis_connection):
+            pipe = redis_connection.pipeline()
+            if tombstone is not None:
+                pipe.exists(tombstone)
+            take = _queue_get(pipe, template, indexes, missing_keys,
+                              [redis_keys[position] for position in missing])
+            take_ttls = _queue_ttls(pipe, cache, _value_ttl_keys(
+                template, [indexes], len(keys), redis_keys, missing))
+            if refresh_ttl:
+                _queue_refresh(pipe, template, indexes, missing_keys,
+                               _resolve_ttl(template, ttl))
+            results = iter(pipe.execute())
+            return (tombstone is not None and bool(next(results)),
+                    take(results), take_ttls(results))
+
+        absent, fetched, ttls = _read(cache, fetch,
+                                      consistent or refresh_ttl)
+        _fill_local(cache, redis_keys, results, missing, fetched, ttls)
+    return _object_result(cache, keys, results, absent, partial)
+
+
+def set_object(cache, template, indexes, data, ttl=None, mode=None):
+    """Set an object in Redis using a pipeline.
+
+    Only sets the fields that are present in both the template and the data.
+
+    Arguments:
+        template: a dictionary containg the keys for the object and
+            template strings for the corresponding redis keys. The template
+            string uses named string interpolation format. Example:
+
+            {
+                'username': 'user:%(id)s:username',
+                'email': 'user:%(id)s:email',
+                'phone': 'user:%(id)s:phone'
+            }
+
+        indexes: a dictionary containing the values to use to cosntruct the
+            redis keys: Example:
+
+            {
+                'id': 342
+            }
+
+        data: a dictionary returning the data to store. Example:
+
+        {
+            'username': 'bob',
+            'email': 'bob@example.com',
+            'phone': '555-555-5555'
+        }
+
+        ttl: the time to live of the keys in seconds, or a dictionary
+            mapping object keys to their time to live. Defaults to the
+            template's (see Template); None keeps the keys until deleted.
+
+        mode: None to always write, 'nx' to only write keys that do not
+            exist yet, or 'xx' to only write keys that already exist.
+
+    Returns: True if every field was written.
+
+    """
+    if cache.shards is not None:
+        tombstone = _tombstone_key(template, indexes)
+        if tombstone is not None:
+            delete_value(cache, tombstone)
+        return all(cache.shards.run([
+            (set_object, (shard, part, indexes, data, ttl, mode))
+            for (shard, part) in _shard_template(cache, template, indexes)]))
+    keys, items = _object_values(template, indexes,
+                                 _encode_object(cache, template, data),
+                                 _resolve_ttl(template, ttl))
+    if not items:
+        return True
+    with cache as redis_connection:
+        pipe = redis_connection.pipeline()
+        take = _queue_set_object(pipe, template, indexes, keys, items, mode)
+        _queue_clear_tombstones(pipe, template, [indexes])
+        results = take(iter(pipe.execute()))
+    return _store_written(cache, items, results)
+
+
+def delete_object(cache, template, indexes):
+    """Delete an object in Redis using a pipeline.
+
+    Deletes all fields defined by the template.
+
+    Arguments:
+        template: a dictionary containg the keys for the object and
+            template strings for the corresponding redis keys. The template
+            string uses named string interpolation format. Example:
+
+            {
+                'username': 'user:%(id)s:username',
+                'email': 'user:%(id)s:email',
+                'phone': 'user:%(id)s:phone'
+            }
+
+        indexes: a dictionary containing the values to use to construct the
+            redis keys: Example:
+
+            {
+                'id': 342
+            }
+
+
+    """
+    if cache.shards is not None:
+        cache.shards.run([
+            (delete_object, (shard, part, indexes))
+            for (shard, part) in _shard_template(cache, template, indexes)])
+        return
+    redis_keys = _object_keys(template, indexes)[1]
+    with cache as redis_connection:
+        pipe = redis_connection.pipeline()
+        _queue_delete_object(pipe, template, indexes, redis_keys)
+        pipe.execute()
+    _evict_local(cache, redis_keys)
+
+
+def mark_absent(cache, template, indexes, ttl=None):
+    """Mark an object absent, e.g. after its database lookup found nothing.
+
+    Deletes the object and sets its tombstone, which retrieve_object then
+    reports as ABSENT, until it expires or the object is set.
+
+    Arguments:
+        template: a Template with a negative_ttl.
+
+        indexes: see retrieve_object.
+
+        ttl: the time to live of the tombstone in seconds. Defaults to the
+            template's negative_ttl.
+
+    """
+    tombstone = _tombstone_key(template, indexes)
+    if tombstone is None:
+        raise ValueError('Only templates with a negative_ttl mark objects '
+                         'absent')
+    delete_object(cache, template, indexes)
+    if ttl is None:
+        ttl = template.negative_ttl
+    with cache.shard_for(tombstone) as redis_connection:
+        redis_connection.set(tombstone, 1, ex=ttl)
+
+
+def retrieve_objects(cache, template, list_of_indexes, chunk_size=None,
+                     consistent=False):
+    """Retrieve several objects sharing a template in one round trip.
+
+    All the redis keys are fetched with MGET commands sent in a single
+    pipeline, one command per chunk_size keys (one command for all keys
+    when chunk_size is None). Objects of hash templates are fetched with
+    one HMGET each in the same pipeline.
+
+    Arguments:
+        template: see retrieve_object.
+
+        list_of_indexes: a list of indexes dictionaries, one per object:
+
+            [{'id': 342}, {'id': 343}]
+
+        consistent: if True, read from the primary rather than from a
+            read replica.
+
+    Returns: a list with, for each indexes dictionary, what retrieve_object
+        would return: the object, or None if any of its values is missing.
+
+    """
+    if cache.shards is not None:
+        calls = _sharded_objects(cache, template, list_of_indexes)
+        results = [{} for _ in list_of_indexes]
+        for ((_, _, positions), objects) in zip(calls, cache.shards.run([
+                (retrieve_objects,
+                 (shard, part, [list_of_indexes[position]
+                                for position in positions], chunk_size,
+                  consistent))
+                for (shard, part, positions) in calls])):
+            for (position, obj) in zip(positions, objects):
+                results[position] = _merge_objects([results[position], obj])
+        return results
+    keys = _template_keys(template)
+    if not keys:
+        return [{} for _ in list_of_indexes]
+    redis_keys = [redis_key for indexes in list_of_indexes
+                  for redis_key in _object_keys(template, indexes, keys)[1]]
+    results, missing = _lookup_local(cache, redis_keys)
+    if missing:
+        def fetch(redis_connection):
+            pipe = redis_connection.pipeline()
+            take = _queue_get_many(pipe, template, list_of_indexes, keys,
+                                   redis_keys, missing, chunk_size)
+            take_ttls = _queue_ttls(pipe, cache, _value_ttl_keys(
+                template, list_of_indexes, len(keys), redis_keys, missing))
+            results = iter(pipe.execute())
+            return take(results), take_ttls(results)
+
+        fetched, ttls = _read(cache, fetch, consistent)
+        _fill_local(cache, redis_keys, results, missing, fetched, ttls)
+    width = len(keys)
+    return [_collect_object(cache, keys, results[start:start + width])
+            for start in range(0, len(results), width)]
+
+
+def set_objects(cache, template, list_of_indexes, list_of_data,
+                chunk_size=None, ttl=None, mode=None):
+    """Set several objects sharing a template in one round trip.
+
+    The values are written with MSET commands sent in a single pipeline, one
+    command per chunk_size keys (one command for all keys when chunk_size is
+    None). When a time to live or write mode applies, or for hash
+    templates, each object is written as set_object would, in the same
+    pipeline. As with set_object, only the fields present in both the
+    template and an object's data are set.
+
+    Arguments:
+        template: see set_object.
+
+        list_of_indexes: a list of indexes dictionaries, one per object.
+
+        list_of_data: a list of data dictionaries, in the same order as
+            list_of_indexes.
+
+        ttl, mode: see set_object.
+
+    Returns: True if every field of every object was written.
+
+    """
+    if cache.shards is not None:
+        tombstones = [tombstone for tombstone in (
+            _tombstone_key(template, indexes) for indexes in list_of_indexes)
+            if tombstone is not None]
+        if tombstones:
+            delete_value(cache, *tombstones)
+        return all(cache.shards.run([
+            (set_objects,
+             (shard, part, [list_of_indexes[position]
+                            for position in positions],
+              [list_of_data[position] for position in positions],
+              chunk_size, ttl, mode))
+            for (shard, part, positions)
+            in _sharded_objects(cache, template, list_of_indexes)]))
+    writes, items = _object_writes(
+        template, list_of_indexes,
+        [_encode_object(cache, template, data) for data in list_of_data],
+        _resolve_ttl(template, ttl))
+    if not items:
+        return True
+    with cache as redis_connection:
+        pipe = redis_connection.pipeline()
+        take = _queue_set_objects(pipe, template, writes, items, mode,
+                                  chunk_size)
+        _queue_clear_tombstones(pipe, template,
+                                [indexes for (indexes, _, _) in writes])
+        results = take(iter(pipe.execute()))
+    return _store_written(cache, items, results)
+
+
+def migrate_objects(cache, source, target, list_of_indexes, delete=True,
+                    chunk_size=100):
+    """Copy objects from one template layout to another.
+
+    Typically used to move objects stored as one key per field to a hash
+    template:
+
+        migrate_objects(cache, USER_KEYS,
+                        Template.hash('user:%(id)s', USER_KEYS.keys()),
+                        [{'id': user_id} for user_id in user_ids])
+
+    Each chunk of chunk_size objects takes two round trips: one to read them
+    with the source template and one to write them with the target
+    template (and delete the source keys when delete is True). Fields
+    missing from the source are skipped. The target's time to live applies.
+
+    Returns: the number of objects that had at least one field to copy.
+
+    """
+    keys = _template_keys(source)
+    ttl = getattr(target, 'ttl', None)
+    migrated = 0
+    for chunk in _chunks(list_of_indexes, chunk_size):
+        source_keys = [redis_key for indexes in chunk for redis_key
+                       in _object_keys(source, indexes, keys)[1]]
+        with cache as redis_connection:
+            pipe = redis_connection.pipeline()
+            take = _queue_get_many(pipe, source, chunk, keys, source_keys,
+                                   list(range(len(source_keys))), None)
+            values = take(iter(pipe.execute()))
+            list_of_data = [
+                dict((key, value) for (key, value)
+                     in zip(keys, values[start:start + len(keys)])
+                     if value is not None)
+                for start in range(0, len(values), len(keys))]
+            writes, items = _object_writes(target, chunk, list_of_data, ttl)
+            if not writes:
+                continue
+            pipe = redis_connection.pipeline()
+            _queue_set_objects(pipe, target, writes, items, None, None)
+            stale = []
+            for (indexes, _, _) in writes:
+                redis_keys = _object_keys(source, indexes)[1]
+                stale.extend(redis_keys)
+                if delete:
+                    _queue_delete_object(pipe, source, indexes, redis_keys)
+            pipe.execute()
+        _evict_local(cache, stale + [item[0] for item in items])
+        migrated += len(writes)
+    return migrated
+
+
+# A named interpolation of a key template, e.g. '%(id)s', or '%%'.
+_INTERPOLATION = re.compile(r'%(?:\((\w+)\)[#0 +-]*\d*(?:\.\d+)?([a-zA-Z])|%)')
+
+
+def _glob_escape(text):
+    """Escape the characters SCAN MATCH patterns give a meaning to."""
+    return re.sub(r'([\\*?\[\]])', r'\\\1', text)
+
+
+def _scan_key(template):
+    """Return the key template found once per object of a template: its
+    hash key, or the key template of its first object key."""
+    hash_key = getattr(template, 'hash_key', None)
+    if hash_key is not None:
+        return hash_key
+    keys = _template_keys(template)
+    if not keys:
+        raise ValueError('An empty template has no keys to scan')
+    return template[keys[0]]
+
+
+def _key_matcher(key_template, match):
+    """Return the SCAN pattern of the redis keys built from key_template
+    with the indexes in match, and a function returning the indexes of a
+    redis key, or None if it does not match or is a tombstone."""
+    pattern, regex, named, integers = [], [], set(), set()
+    end = 0
+    for found in _INTERPOLATION.finditer(key_template):
+        literal = key_template[end:found.start()]
+        pattern.append(_glob_escape(literal))
+        regex.append(re.escape(literal))
+        end = found.end()
+        name = found.group(1)
+        if name is None:
+            pattern.append('%')
+            regex.append('%')
+        elif name in match:
+            value = found.group(0) % match
+            pattern.append(_glob_escape(value))
+            regex.append(re.escape(value))
+        elif name in named:
+            pattern.append('*')
+            regex.append('(?P=%s)' % name)
+        else:
+            named.add(name)
+            pattern.append('*')
+            if found.group(2) in 'di':
+                integers.add(name)
+                regex.append(r'(?P<%s>-?\d+)' % name)
+            else:
+                regex.append('(?P<%s>.*?)' % name)
+    pattern.append(_glob_escape(key_template[end:]))
+    regex.append(re.escape(key_template[end:]) + r'\Z')
+    compiled = re.compile(''.join(regex), re.DOTALL)
+
+    tombstones = not key_template.startswith(TOMBSTONE_PREFIX)
+
+    def parse(redis_key):
+        if isinstance(redis_key, six.binary_type):
+            redis_key = redis_key.decode('utf-8')
+        if tombstones and redis_key.startswith(TOMBSTONE_PREFIX):
+            return None
+        found = compiled.match(redis_key)
+        if found is None:
+            return None
+        indexes = dict(match)
+        for (name, value) in found.groupdict().items():
+            indexes[name] = int(value) if name in integers else value
+        return indexes
+
+    return ''.join(pattern), parse
+
+
+def _scan_pages(cache, pattern, count):
+    """Yield the pages of redis keys matching pattern returned by SCAN,
+    on every shard or cluster node in turn."""
+    if cache.shards is not None:
+        for shard in cache.shards:
+            for page in _scan_pages(shard, pattern, count):
+                yield page
+        return
+    with cache as redis_connection:
+        if _is_cluster(redis_connection):
+            servers = [redis_connection.get_redis_connection(node)
+                       for node in redis_connection.get_primaries()]
+        else:
+            servers = [None]
+    for server in servers:
+        cursor = 0
+        while True:
+            if server is None:
+                with cache as redis_connection:
+                    cursor, page = redis_connection.scan(
+                        cursor, match=pattern, count=count)
+            else:
+                cursor, page = server.scan(cursor, match=pattern, count=count)
+            if page:
+                yield [redis_key.decode('utf-8')
+                       if isinstance(redis_key, six.binary_type)
+                       else redis_key for redis_key in page]
+            if not cursor:
+                break
+
+
+def _delete_objects(cache, template, list_of_indexes):
+    """Delete several objects sharing a template in one round trip."""
+    if cache.shards is not None:
+        cache.shards.run([
+            (_delete_objects,
+             (shard, part, [list_of_indexes[position]
+                            for position in positions]))
+            for (shard, part, positions)
+            in _sharded_objects(cache, template, list_of_indexes)])
+        return
+    stale = []
+    with cache as redis_connection:
+        pipe = redis_connection.pipeline()
+        for indexes in list_of_indexes:
+            redis_keys = _object_keys(template, indexes)[1]
+            _queue_delete_object(pipe, template, indexes, redis_keys)
+            stale.extend(redis_keys)
+        pipe.execute()
+    _evict_local(cache, stale)
+
+
+def scan_objects(cache, template, match=None, count=100):
+    """Iterate over the objects of a template stored in Redis.
+
+    Walks the keyspace with SCAN instead of KEYS, so Redis is never blocked
+    and only one page of objects is held at a time. Objects are found by
+    their hash key, or by the redis key of the template's first object key,
+    and each page of objects is fetched as retrieve_objects does:
+
+        for (indexes, user) in scan_objects(cache, USER, count=500):
+            ...
+
+    Arguments:
+        template: see retrieve_object.
+
+        match: a dictionary of index values the objects must have, e.g.
+            {'org': 7} for a template keyed by 'org:%(org)s:user:%(id)s'.
+            Other indexes match any value.
+
+        count: the COUNT hint of each SCAN call, about the number of keys
+            looked at per page.
+
+    Yields: (indexes, object) pairs, the indexes parsed from the redis key
+        (as strings, or as integers for %d interpolations). Objects with a
+        missing value are skipped. As with SCAN, an object may be yielded
+        twice if the keyspace changes during the iteration.
+
+    """
+    pattern, parse = _key_matcher(_scan_key(template), match or {})
+    for page in _scan_pages(cache, pattern, count):
+        list_of_indexes = [indexes for indexes in map(parse, page)
+                           if indexes is not None]
+        if not list_of_indexes:
+            continue
+        for (indexes, obj) in zip(list_of_indexes, retrieve_objects(
+                cache, template, list_of_indexes)):
+            if obj is not None:
+                yield indexes, obj
+
+
+def delete_matching(cache, template, match=None, count=1000, rate=None):
+    """Delete the objects of a template, or the keys matching a pattern.
+
+    Keys are found with SCAN, as scan_objects does, and each page is deleted
+    in one round trip before the next one is scanned:
+
+        delete_matching(cache, USER, match={'org': 7}, rate=5000)
+        delete_matching(cache, 'session:*')
+
+    Arguments:
+        template: a template, whose objects are deleted as delete_object
+            does, or a SCAN MATCH pattern of the redis keys to delete.
+
+        match: for templates, see scan_objects.
+
+        count: the COUNT hint of each SCAN call.
+
+        rate: if set, the maximum number of objects (or keys) deleted per
+            second; pages are then spaced out to spare a busy Redis.
+
+    Returns: the number of objects (or keys) deleted.
+
+    """
+    if isinstance(template, six.string_types):
+        pattern, parse = template, None
+    else:
+        pattern, parse = _key_matcher(_scan_key(template), match or {})
+    deleted = 0
+    start = time.time()
+    for page in _scan_pages(cache, pattern, count):
+        if parse is None:
+            deleted += delete_value(cache, *page)
+        else:
+            list_of_indexes = [indexes for indexes in map(parse, page)
+                               if indexes is not None]
+            if list_of_indexes:
+                _delete_objects(cache, template, list_of_indexes)
+                deleted += len(list_of_indexes)
+        if rate:
+            delay = deleted / float(rate) - (time.time() - start)
+            if delay > 0:
+                time.sleep(delay)
+    return deleted
+
+
+def multi_get(cache, local_list, consistent=False):
+    """Get multiple records by a list of keys.
+
+    Arguments:
+        cache:
+            instance of Cache
+
+        local_list:
+            [
+                'user:342:username',
+                'user:342:email',
+                'user:342:phone'
+            ]
+
+        consistent:
+            if True, read from the primary rather than from a read replica.
+    """
+    if cache.shards is not None:
+        groups = cache.shards.group(local_list)
+        results = [None] * len(local_list)
+        for ((_, positions), values) in zip(groups, cache.shards.run([
+                (multi_get, (shard, [local_list[position]
+                                     for position in positions], consistent))
+                for (shard, positions) in groups])):
+            for (position, value) in zip(positions, values):
+                results[position] = value
+        return results
+    results, missing = _lookup_local(cache, local_list)
+    if missing:
+        keys = [local_list[position] for position in missing]
+
+        def fetch(redis_connection):
+            if cache.local_cache is None:
+                if _is_cluster(redis_connection):
+                    return redis_connection.mget_nonatomic(keys), None
+                return redis_connection.mget(keys), None
+            pipe = redis_connection.pipeline()
+            take = _queue_mget(pipe, keys)
+            take_ttls = _queue_ttls(pipe, cache, keys)
+            results = iter(pipe.execute())
+            return take(results), take_ttls(results)
+
+        fetched, ttls = _read(cache, fetch, consistent)
+        _fill_local(cache, local_list, results, missing, fetched, ttls)
+    return _decode(cache, results)
+
+
+def set_value(cache, key, value, ttl=None, mode=None):
+    """Set a value by key.
+
+    Arguments:
+        cache:
+            instance of Cache
+
+        key:
+            'user:342:username',
+
+        ttl:
+            time to live in seconds, or None to keep the key until deleted.
+
+        mode:
+            None to always write, 'nx' to only write if the key does not
+            exist yet, or 'xx' to only write if it already exists.
+    """
+    cache = cache.shard_for(key)
+    flags = _write_flags(mode)
+    value = _encode(cache, value)
+    with cache as redis_connection:
+        result = redis_connection.set(key, value, ex=ttl, **flags)
+    _store_written(cache, [(key, value, ttl)], [result])
+    return result
+
+
+def delete_value(cache, *key):
+    """Delete a value by key.
+
+    Arguments:
+        cache:
+            instance of Cache
+
+        key:
+            'user:342:username',
+    """
+    if cache.shards is not None:
+        return sum(cache.shards.run([
+            (delete_value, [shard] + [key[position] for position in positions])
+            for (shard, positions) in cache.shards.group(key)]))
+    with cache as redis_connection:
+        result = redis_connection.delete(*key)
+    _evict_local(cache, key)
+    return result
+
+
+def get_value(cache, key, consistent=False):
+    """Get a value by key.
+
+    Arguments:
+        cache:
+            instance of Cache
+
+        key:
+            'user:342:username',
+
+        consistent:
+            if True, read from the primary rather than from a read replica.
+    """
+    cache = cache.shard_for(key)
+    result = None
+    if cache.local_cache is not None:
+        result = cache.local_cache.get(key)
+    if result is None:
+        def fetch(redis_connection):
+            if cache.local_cache is None:
+                return redis_connection.get(key), None
+            pipe = redis_connection.pipeline()
+            pipe.get(key)
+            take_ttls = _queue_ttls(pipe, cache, [key])
+            results = iter(pipe.execute())
+            return next(results), take_ttls(results)
+
+        fetched, ttls = _read(cache, fetch, consistent)
+        result = _fill_local(cache, [key], [None], [0], [fetched], ttls)[0]
+    return _decode(cache, [result])[0]
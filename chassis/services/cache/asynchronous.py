@@ -0,0 +1,382 @@
+"""Asynchronous Redis Cache.
+
+Coroutine versions of the chassis.services.cache helpers. They share the
+template and index semantics of the synchronous helpers, but talk to Redis
+through redis.asyncio so a round trip never blocks the Tornado IOLoop.
+
+Usage from a handler:
+
+    value = yield asynchronous.get_value(cache, 'user:342:username')
+
+or, on Python 3.5+:
+
+    async with cache as redis_connection:
+        value = await redis_connection.get('user:342:username')
+"""
+# pylint: disable=protected-access, too-few-public-methods
+
+import time
+
+import redis
+from tornado import concurrent
+from tornado import gen
+
+from chassis.services import cache as cache_module
+from chassis.services import data_context
+from chassis.services.cache import compute
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:  # redis-py < 4.2
+    aioredis = None
+
+
+class AsyncCache(data_context.DatasourceContext):
+    """Asynchronous cache context manager
+
+    Stores configuration properties and hands out a redis.asyncio client
+    backed by a shared connection pool when used with `with` or
+    `async with`.
+
+    `metrics` is recorded as for any DatasourceContext; unlike Cache, the
+    pool and the commands are not instrumented. `pool_timeout` and
+    `circuit_breaker` work as for Cache.
+
+    """
+
+    connection_errors = cache_module.Cache.connection_errors
+
+    connection_error_class = cache_module.CacheConnectionError
+
+    blocking = False
+
+    def __init__(self, *args, **kwargs):
+        if aioredis is None:
+            raise ImportError('AsyncCache requires redis-py >= 4.2')
+        self.settings = args[0]
+        self.local_cache = kwargs.pop('local_cache', None)
+        self.codec = kwargs.pop('codec', None)
+        pool_timeout = kwargs.pop('pool_timeout', None)
+        self.invalidator = None
+        if pool_timeout is None:
+            self._pool = aioredis.ConnectionPool(**self.settings)
+        else:
+            self._pool = aioredis.BlockingConnectionPool(
+                timeout=pool_timeout, **self.settings)
+        super(AsyncCache, self).__init__(*args, **kwargs)
+
+    def _get_connection(self):
+        return aioredis.StrictRedis(connection_pool=self._pool)
+
+    def _close_connection(self):
+        """Connections are returned to the pool after every command."""
+        pass
+
+    def insert(self, query, params):
+        """Nothing to implement"""
+        # noop
+        return
+
+    def read_many(self, keys):
+        """Return a Future resolving to the values of keys, as multi_get
+        does; lets request scopes batch their reads into one MGET."""
+        return multi_get(self, keys)
+
+
+@gen.coroutine
+def retrieve_object(cache, template, indexes, ttl=None, refresh_ttl=False,
+                    partial=False):
+    """Retrieve an object from Redis using a pipeline.
+
+    See chassis.services.cache.retrieve_object.
+    """
+    # pylint: disable=too-many-arguments
+    keys, redis_keys = cache_module._object_keys(template, indexes)
+    tombstone = cache_module._tombstone_key(template, indexes, redis_keys)
+    results, missing = cache_module._lookup_local(cache, redis_keys)
+    absent = False
+    if missing:
+        missing_keys = [keys[position] for position in missing]
+        with cache as redis_connection:
+            pipe = redis_connection.pipeline()
+            if tombstone is not None:
+                pipe.exists(tombstone)
+            take = cache_module._queue_get(
+                pipe, template, indexes, missing_keys,
+                [redis_keys[position] for position in missing])
+            take_ttls = cache_module._queue_ttls(
+                pipe, cache, cache_module._value_ttl_keys(
+                    template, [indexes], len(keys), redis_keys, missing))
+            if refresh_ttl:
+                cache_module._queue_refresh(
+                    pipe, template, indexes, missing_keys,
+                    cache_module._resolve_ttl(template, ttl))
+            fetched = iter((yield pipe.execute()))
+        absent = tombstone is not None and bool(next(fetched))
+        cache_module._fill_local(cache, redis_keys, results, missing,
+                                 take(fetched), take_ttls(fetched))
+    raise gen.Return(cache_module._object_result(cache, keys, results,
+                                                 absent, partial))
+
+
+@gen.coroutine
+def set_object(cache, template, indexes, data, ttl=None, mode=None):
+    """Set an object in Redis using a pipeline.
+
+    See chassis.services.cache.set_object.
+    """
+    keys, items = cache_module._object_values(
+        template, indexes, cache_module._encode_object(cache, template, data),
+        cache_module._resolve_ttl(template, ttl))
+    if not items:
+        raise gen.Return(True)
+    with cache as redis_connection:
+        pipe = redis_connection.pipeline()
+        take = cache_module._queue_set_object(pipe, template, indexes, keys,
+                                              items, mode)
+        cache_module._queue_clear_tombstones(pipe, template, [indexes])
+        results = yield pipe.execute()
+    raise gen.Return(cache_module._store_written(cache, items,
+                                                 take(iter(results))))
+
+
+@gen.coroutine
+def delete_object(cache, template, indexes):
+    """Delete an object in Redis using a pipeline.
+
+    See chassis.services.cache.delete_object.
+    """
+    redis_keys = cache_module._object_keys(template, indexes)[1]
+    with cache as redis_connection:
+        pipe = redis_connection.pipeline()
+        cache_module._queue_delete_object(pipe, template, indexes, redis_keys)
+        yield pipe.execute()
+    cache_module._evict_local(cache, redis_keys)
+
+
+@gen.coroutine
+def mark_absent(cache, template, indexes, ttl=None):
+    """Mark an object absent.
+
+    See chassis.services.cache.mark_absent.
+    """
+    tombstone = cache_module._tombstone_key(template, indexes)
+    if tombstone is None:
+        raise ValueError('Only templates with a negative_ttl mark objects '
+                         'absent')
+    yield delete_object(cache, template, indexes)
+    if ttl is None:
+        ttl = template.negative_ttl
+    with cache as redis_connection:
+        yield redis_connection.set(tombstone, 1, ex=ttl)
+
+
+@gen.coroutine
+def retrieve_objects(cache, template, list_of_indexes, chunk_size=None):
+    """Retrieve several objects sharing a template in one round trip.
+
+    See chassis.services.cache.retrieve_objects.
+    """
+    keys = cache_module._template_keys(template)
+    if not keys:
+        raise gen.Return([{} for _ in list_of_indexes])
+    redis_keys = [
+        redis_key for indexes in list_of_indexes
+        for redis_key in cache_module._object_keys(template, indexes, keys)[1]]
+    results, missing = cache_module._lookup_local(cache, redis_keys)
+    if missing:
+        with cache as redis_connection:
+            pipe = redis_connection.pipeline()
+            take = cache_module._queue_get_many(
+                pipe, template, list_of_indexes, keys, redis_keys, missing,
+                chunk_size)
+            take_ttls = cache_module._queue_ttls(
+                pipe, cache, cache_module._value_ttl_keys(
+                    template, list_of_indexes, len(keys), redis_keys,
+                    missing))
+            fetched = iter((yield pipe.execute()))
+        cache_module._fill_local(cache, redis_keys, results, missing,
+                                 take(fetched), take_ttls(fetched))
+    width = len(keys)
+    raise gen.Return([
+        cache_module._collect_object(cache, keys,
+                                     results[start:start + width])
+        for start in range(0, len(results), width)])
+
+
+@gen.coroutine
+def set_objects(cache, template, list_of_indexes, list_of_data,
+                chunk_size=None, ttl=None, mode=None):
+    """Set several objects sharing a template in one round trip.
+
+    See chassis.services.cache.set_objects.
+    """
+    writes, items = cache_module._object_writes(
+        template, list_of_indexes,
+        [cache_module._encode_object(cache, template, data)
+         for data in list_of_data],
+        cache_module._resolve_ttl(template, ttl))
+    if not items:
+        raise gen.Return(True)
+    with cache as redis_connection:
+        pipe = redis_connection.pipeline()
+        take = cache_module._queue_set_objects(pipe, template, writes, items,
+                                               mode, chunk_size)
+        cache_module._queue_clear_tombstones(
+            pipe, template, [indexes for (indexes, _, _) in writes])
+        results = yield pipe.execute()
+    raise gen.Return(cache_module._store_written(cache, items,
+                                                 take(iter(results))))
+
+
+@gen.coroutine
+def multi_get(cache, local_list):
+    """Get multiple records by a list of keys."""
+    results, missing = cache_module._lookup_local(cache, local_list)
+    if missing:
+        keys = [local_list[position] for position in missing]
+        ttls = None
+        with cache as redis_connection:
+            if cache.local_cache is None:
+                fetched = yield redis_connection.mget(keys)
+            else:
+                pipe = redis_connection.pipeline()
+                pipe.mget(keys)
+                take_ttls = cache_module._queue_ttls(pipe, cache, keys)
+                replies = iter((yield pipe.execute()))
+                fetched = next(replies)
+                ttls = take_ttls(replies)
+        cache_module._fill_local(cache, local_list, results, missing,
+                                 fetched, ttls)
+    raise gen.Return(cache_module._decode(cache, results))
+
+
+@gen.coroutine
+def set_value(cache, key, value, ttl=None, mode=None):
+    """Set a value by key.
+
+    See chassis.services.cache.set_value.
+    """
+    flags = cache_module._write_flags(mode)
+    value = cache_module._encode(cache, value)
+    with cache as redis_connection:
+        result = yield redis_connection.set(key, value, ex=ttl, **flags)
+    cache_module._store_written(cache, [(key, value, ttl)], [result])
+    raise gen.Return(result)
+
+
+@gen.coroutine
+def delete_value(cache, *key):
+    """Delete a value by key."""
+    with cache as redis_connection:
+        result = yield redis_connection.delete(*key)
+    cache_module._evict_local(cache, key)
+    raise gen.Return(result)
+
+
+@gen.coroutine
+def get_value(cache, key):
+    """Get a value by key."""
+    result = None
+    if cache.local_cache is not None:
+        result = cache.local_cache.get(key)
+    if result is None:
+        ttls = None
+        with cache as redis_connection:
+            if cache.local_cache is None:
+                result = yield redis_connection.get(key)
+            else:
+                pipe = redis_connection.pipeline()
+                pipe.get(key)
+                take_ttls = cache_module._queue_ttls(pipe, cache, [key])
+                fetched = iter((yield pipe.execute()))
+                result = next(fetched)
+                ttls = take_ttls(fetched)
+        result = cache_module._fill_local(cache, [key], [None], [0],
+                                          [result], ttls)[0]
+    raise gen.Return(cache_module._decode(cache, [result])[0])
+
+
+# (id(cache), lookup name) -> Future of the get_or_compute call in flight.
+_IN_FLIGHT = {}
+
+
+@gen.coroutine
+def get_or_compute(cache, key_or_template, indexes, loader, ttl=None,
+                   beta=1.0, lock=False, lock_timeout=10, lock_wait=0.05):
+    """Get a value or object from the cache, computing it on a miss.
+
+    See chassis.services.cache.compute.get_or_compute. loader may return a
+    Future; concurrent misses on the IOLoop share a single call to it.
+    """
+    # pylint: disable=too-many-arguments
+    lookup = compute.lookup(key_or_template, indexes, ttl)
+    stale = yield retrieve_object(cache, lookup.template, lookup.indexes)
+    if stale is cache_module.ABSENT:
+        raise gen.Return(None)
+    found = compute.fresh(dict(stale) if stale else None, beta)
+    if found is not None:
+        raise gen.Return(compute.result(cache, lookup, found))
+    if stale is not None:
+        stale = dict(stale)
+        stale.pop(compute.META_FIELD, None)
+
+    name = (id(cache), lookup.name)
+    if name in _IN_FLIGHT:
+        result = yield _IN_FLIGHT[name]
+        raise gen.Return(result)
+    future = _IN_FLIGHT[name] = concurrent.Future()
+    try:
+        result = yield _compute(cache, lookup, loader, stale, lock,
+                                lock_timeout, lock_wait)
+    except Exception as err:
+        del _IN_FLIGHT[name]
+        future.set_exception(err)
+        future.exception()  # Retrieved here, even if nobody was waiting.
+        raise
+    del _IN_FLIGHT[name]
+    future.set_result(result)
+    raise gen.Return(result)
+
+
+@gen.coroutine
+def _compute(cache, lookup, loader, stale, lock, lock_timeout, lock_wait):
+    """Run loader for get_or_compute, under a Redis lock if asked to."""
+    # pylint: disable=too-many-arguments
+    redis_lock = None
+    if lock:
+        with cache as redis_connection:
+            redis_lock = redis_connection.lock(lookup.name + ':lock',
+                                               timeout=lock_timeout)
+        acquired = yield redis_lock.acquire(blocking=False)
+        if not acquired:
+            if stale is not None:
+                raise gen.Return(compute.result(cache, lookup, stale))
+            redis_lock = None
+            deadline = time.time() + lock_timeout
+            while time.time() < deadline:
+                yield gen.sleep(lock_wait)
+                waited = yield retrieve_object(cache, lookup.template,
+                                               lookup.indexes)
+                if waited is cache_module.ABSENT:
+                    raise gen.Return(None)
+                if waited is not None:
+                    raise gen.Return(compute.result(cache, lookup, waited))
+    try:
+        start = time.time()
+        value = loader()
+        if gen.is_future(value) or hasattr(value, '__await__'):
+            value = yield value
+        if compute.negative(lookup, value):
+            yield mark_absent(cache, lookup.template, lookup.indexes)
+            raise gen.Return(None)
+        data = compute.to_store(lookup, value, time.time() - start)
+        yield set_object(cache, lookup.template, lookup.indexes, data,
+                         ttl=lookup.ttl)
+    finally:
+        if redis_lock is not None:
+            try:
+                yield redis_lock.release()
+            except redis.exceptions.LockError:
+                pass  # Expired while computing.
+    raise gen.Return(compute.result(cache, lookup, data))
@@ -0,0 +1,130 @@
+"""Value serialization for chassis.services.cache.
+
+A Codec turns the values given to the cache helpers into bytes and back,
+optionally compressing large payloads. Every encoded value starts with a
+header byte naming its serializer and compression, so values written with
+any codec (or by a different configuration) are decoded correctly:
+
+    users = Cache(settings, codec=Codec('msgpack', compression='zlib'))
+
+Header bytes are taken from 0xF5-0xFD, which never appear in UTF-8 text,
+so plain string values written without a codec are returned untouched.
+"""
+
+import json
+import pickle
+import zlib
+
+import six
+
+from chassis.util import encoders
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None  # pylint: disable=invalid-name
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None  # pylint: disable=invalid-name
+
+SERIALIZERS = ('json', 'msgpack', 'pickle')
+COMPRESSIONS = (None, 'zlib', 'lz4')
+
+_HEADER_BASE = 0xF5
+
+
+def _dumps_json(value):
+    return json.dumps(value, cls=encoders.ModelJSONEncoder,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def _loads_json(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def _dumps_msgpack(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _loads_msgpack(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+def _dumps_pickle(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+_DUMPS = {'json': _dumps_json, 'msgpack': _dumps_msgpack,
+          'pickle': _dumps_pickle}
+
+_LOADS = {'json': _loads_json, 'msgpack': _loads_msgpack,
+          'pickle': pickle.loads}
+
+# lz4 is looked up on use, as it is optional.
+_COMPRESS = {'zlib': zlib.compress,
+             'lz4': lambda data: lz4_frame.compress(data)}
+
+_DECOMPRESS = {'zlib': zlib.decompress,
+               'lz4': lambda data: lz4_frame.decompress(data)}
+
+
+class Codec(object):
+    """Encodes cache values with a header byte.
+
+    Arguments:
+        serializer: 'json' (using ModelJSONEncoder), 'msgpack' or 'pickle'.
+        compression: None, 'zlib' or 'lz4'.
+        threshold: payloads of at least this many bytes are compressed.
+
+    Pickled values are only decoded by codecs whose serializer is
+    'pickle': unpickling runs arbitrary code, so a codec must opt in.
+
+    """
+
+    def __init__(self, serializer='json', compression=None, threshold=1024):
+        if serializer not in SERIALIZERS:
+            raise ValueError('serializer must be one of %s'
+                             % (SERIALIZERS, ))
+        if compression not in COMPRESSIONS:
+            raise ValueError('compression must be one of %s'
+                             % (COMPRESSIONS, ))
+        if serializer == 'msgpack' and msgpack is None:
+            raise ImportError('The msgpack serializer requires msgpack')
+        if compression == 'lz4' and lz4_frame is None:
+            raise ImportError('lz4 compression requires lz4')
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+        self._dumps = _DUMPS[serializer]
+
+    def encode(self, value):
+        """Return value as bytes prefixed with the header byte."""
+        data = self._dumps(value)
+        compression = None
+        if self.compression is not None and len(data) >= self.threshold:
+            compression = self.compression
+            data = _COMPRESS[compression](data)
+        header = (_HEADER_BASE + SERIALIZERS.index(self.serializer) * 3
+                  + COMPRESSIONS.index(compression))
+        return six.int2byte(header) + data
+
+    def decode(self, data):
+        """Return the value encoded in data.
+
+        Data without a header byte (or None) is returned as is.
+        """
+        if not isinstance(data, six.binary_type) or not data:
+            return data
+        header = six.indexbytes(data, 0) - _HEADER_BASE
+        if not 0 <= header < len(SERIALIZERS) * len(COMPRESSIONS):
+            return data
+        serializer = SERIALIZERS[header // 3]
+        compression = COMPRESSIONS[header % 3]
+        if serializer == 'pickle' and self.serializer != 'pickle':
+            raise ValueError('Refusing to unpickle a cached value')
+        data = data[1:]
+        if compression is not None:
+            data = _DECOMPRESS[compression](data)
+        return _LOADS[serializer](data)
@@ -0,0 +1,246 @@
+"""Cache-aside lookups with stampede protection.
+
+get_or_compute reads a value or object from the cache and, on a miss, calls
+a loader to compute it and writes the result back. When a popular entry
+expires it makes sure the loader does not run once per concurrent request:
+
+* Concurrent misses for the same entry within a process share a single
+  call to the loader (single-flight).
+* With lock=True, a Redis lock elects a single process to run the loader;
+  the others wait for its result to land in the cache.
+* Entries with a time to live are recomputed early with a probability that
+  grows as they near expiry and with how long the loader took (XFetch), so
+  hot entries are usually refreshed before they expire at all.
+
+    user = get_or_compute(users, USER_TEMPLATE, {'id': 342},
+                          lambda: load_user(342), ttl=300)
+"""
+
+import collections
+import math
+import random
+import threading
+import time
+
+import redis
+import six
+
+from chassis.services import cache as cache_module
+
+VALUE_FIELD = 'value'
+
+META_FIELD = '__xfetch__'
+
+# The template, indexes and time to live of a lookup, whether it was for a
+# plain key, and the redis key naming it for locks and single-flight.
+Lookup = collections.namedtuple('Lookup', ['template', 'indexes', 'ttl',
+                                           'is_key', 'name'])
+
+
+class SingleFlight(object):
+    """Runs one call per name at a time; concurrent callers share it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, name, func):
+        """Call func, or wait for the call already running under name."""
+        with self._lock:
+            call = self._calls.get(name)
+            leader = call is None
+            if leader:
+                call = self._calls[name] = {'event': threading.Event()}
+        if not leader:
+            call['event'].wait()
+            if 'error' in call:
+                raise call['error']
+            return call['result']
+        try:
+            call['result'] = func()
+        except Exception as err:
+            call['error'] = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[name]
+            call['event'].set()
+        return call['result']
+
+
+_SINGLE_FLIGHT = SingleFlight()
+
+
+def lookup(key_or_template, indexes, ttl):
+    """Describe a get_or_compute lookup.
+
+    A plain key is handled as a one-field template. When there is a time to
+    live, the template gets an extra field holding the XFetch metadata.
+    """
+    if isinstance(key_or_template, six.string_types):
+        template = {VALUE_FIELD: key_or_template.replace('%', '%%')}
+        is_key = True
+    else:
+        template = key_or_template
+        is_key = False
+    indexes = indexes or {}
+    ttl = cache_module._resolve_ttl(template, ttl)  # pylint: disable=W0212
+    name = min(cache_module._object_keys(  # pylint: disable=W0212
+        template, indexes)[1])
+    if ttl is None:
+        return Lookup(template, indexes, None, is_key, name)
+
+    hash_key = getattr(template, 'hash_key', None)
+    fields = dict(template)
+    if hash_key is None:
+        fields[META_FIELD] = min(template.values()) + ':xfetch'
+        if isinstance(ttl, dict):
+            ttl = dict(ttl)
+            ttl[META_FIELD] = max(ttl.values())
+    else:
+        fields[META_FIELD] = META_FIELD
+    negative_ttl = getattr(template, 'negative_ttl', None)
+    return Lookup(cache_module.Template(fields, hash_key=hash_key,
+                                        negative_ttl=negative_ttl),
+                  indexes, ttl, is_key, name)
+
+
+def fresh(found, beta):
+    """Return found without its metadata if it should be served, or None if
+    it should be recomputed now."""
+    if found is None:
+        return None
+    meta = found.pop(META_FIELD, None)
+    if meta is None:
+        return found
+    (delta, expiry) = [float(part) for part in meta.split()]
+    # XFetch: -log(U) is exponentially distributed, so the odds of an early
+    # recompute rise as expiry nears, scaled by the recompute time.
+    early = delta * beta * -math.log(1.0 - random.random())
+    if time.time() + early < expiry:
+        return found
+    return None
+
+
+def negative(lookup_, value):
+    """Return whether a computed value marks the object absent: it is None
+    and the template has a negative_ttl."""
+    return (value is None and
+            getattr(lookup_.template, 'negative_ttl', None) is not None)
+
+
+def to_store(lookup_, value, delta):
+    """Return the data to write for a computed value."""
+    data = {VALUE_FIELD: value} if lookup_.is_key else dict(value)
+    if lookup_.ttl is not None:
+        ttl = lookup_.ttl
+        if isinstance(ttl, dict):
+            ttl = ttl[META_FIELD]
+        data[META_FIELD] = '%f %f' % (delta, time.time() + ttl)
+    return data
+
+
+def result(cache, lookup_, data):
+    """Return computed or found data the way get_or_compute returns it.
+
+    Computed values are converted as a read from the cache would return
+    them, so hits and misses look the same to callers.
+    """
+    # pylint: disable=protected-access
+    data = dict((key, value) for (key, value) in data.items()
+                if key != META_FIELD)
+    if cache.codec is None:
+        data = dict((key, cache_module._stored_value(
+            cache, cache_module._string(value), lookup_.name))
+                    for (key, value) in data.items())
+    return data[VALUE_FIELD] if lookup_.is_key else data
+
+
+def get_or_compute(cache, key_or_template, indexes, loader, ttl=None,
+                   beta=1.0, lock=False, lock_timeout=10, lock_wait=0.05):
+    """Get a value or object from the cache, computing it on a miss.
+
+    Arguments:
+        cache: instance of Cache.
+
+        key_or_template: a redis key, or a template as accepted by
+            retrieve_object.
+
+        indexes: the indexes for a template, or None for a key.
+
+        loader: a callable computing the value (for a key) or the object
+            dictionary (for a template).
+
+        ttl: time to live of the cached entry; defaults to the template's.
+            Entries without a time to live are never recomputed early.
+
+        beta: how eagerly to recompute before expiry; 1.0 is the usual
+            XFetch setting, larger values recompute earlier.
+
+        lock: take a Redis lock so a single process runs the loader.
+            Processes that find the lock taken serve the value they already
+            have, or poll the cache every lock_wait seconds for up to
+            lock_timeout seconds before computing it themselves.
+
+        lock_timeout: seconds after which the lock expires.
+
+    Returns: the value or object, as retrieve_object or get_value would
+        return it. If the template has a negative_ttl and loader returns
+        None, the object is marked absent (see mark_absent) and None is
+        returned without calling loader again until the mark expires or
+        the object is set.
+
+    """
+    # pylint: disable=too-many-arguments
+    lookup_ = lookup(key_or_template, indexes, ttl)
+    stale = cache_module.retrieve_object(cache, lookup_.template,
+                                         lookup_.indexes)
+    if stale is cache_module.ABSENT:
+        return None
+    found = fresh(dict(stale) if stale else None, beta)
+    if found is not None:
+        return result(cache, lookup_, found)
+    if stale is not None:
+        stale = dict(stale)
+        stale.pop(META_FIELD, None)
+
+    def compute():
+        redis_lock = None
+        if lock:
+            lock_name = lookup_.name + ':lock'
+            with cache.shard_for(lock_name) as redis_connection:
+                redis_lock = redis_connection.lock(lock_name,
+                                                   timeout=lock_timeout)
+            if not redis_lock.acquire(blocking=False):
+                if stale is not None:
+                    return result(cache, lookup_, stale)
+                redis_lock = None
+                deadline = time.time() + lock_timeout
+                while time.time() < deadline:
+                    time.sleep(lock_wait)
+                    waited = cache_module.retrieve_object(
+                        cache, lookup_.template, lookup_.indexes,
+                        consistent=True)
+                    if waited is cache_module.ABSENT:
+                        return None
+                    if waited is not None:
+                        return result(cache, lookup_, waited)
+        try:
+            start = time.time()
+            value = loader()
+            if negative(lookup_, value):
+                cache_module.mark_absent(cache, lookup_.template,
+                                         lookup_.indexes)
+                return None
+            data = to_store(lookup_, value, time.time() - start)
+            cache_module.set_object(cache, lookup_.template, lookup_.indexes,
+                                    data, ttl=lookup_.ttl)
+        finally:
+            if redis_lock is not None:
+                try:
+                    redis_lock.release()
+                except redis.exceptions.LockError:
+                    pass  # Expired while computing.
+        return result(cache, lookup_, data)
+
+    return _SINGLE_FLIGHT.do((id(cache), lookup_.name), compute)
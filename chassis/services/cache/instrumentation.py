@@ -0,0 +1,122 @@
+"""Redis client and connection pool instrumentation.
+
+Used by Cache when it is given `metrics`. Records, in the Metrics instance:
+
+    pool_wait_seconds      time to check a connection out of the pool
+    pool_errors            failed checkouts
+    pool_in_use            gauge of connections checked out
+    pool_idle              gauge of connections waiting in the pool
+                           (both labelled by shard or replica, if the
+                           Cache is one)
+    command_seconds        latency of each command, labelled by command
+    command_errors         failed commands, labelled by command
+    pipeline_size          number of commands in each executed pipeline
+    pipeline_seconds       latency of each pipeline
+    pipeline_errors        failed pipelines
+"""
+
+import threading
+
+import redis
+
+from chassis.services import metrics as metrics_module
+
+
+class PoolMetricsMixin(object):
+    """Records checkouts of a redis-py connection pool.
+
+    Mixed into a pool class; takes the Metrics instance as its first
+    argument, and the label of its gauges, so that the pools of several
+    servers sharing the Metrics report apart, as `metrics_label`.
+    """
+
+    def __init__(self, metrics, *args, **kwargs):
+        label = kwargs.pop('metrics_label', None)
+        self.metrics = metrics
+        self._counts_lock = threading.Lock()
+        self.in_use = 0
+        self.created = 0
+        super(PoolMetricsMixin, self).__init__(*args, **kwargs)
+        metrics.gauge('pool_in_use', lambda: self.in_use, label)
+        metrics.gauge('pool_idle', lambda: max(self.created - self.in_use, 0),
+                      label)
+
+    def reset(self):
+        super(PoolMetricsMixin, self).reset()
+        self.in_use = 0
+        self.created = 0
+
+    def make_connection(self):
+        with self._counts_lock:
+            self.created += 1
+        return super(PoolMetricsMixin, self).make_connection()
+
+    def get_connection(self, *args, **kwargs):
+        start = metrics_module.clock()
+        try:
+            connection = super(PoolMetricsMixin, self).get_connection(
+                *args, **kwargs)
+        except Exception:
+            self.metrics.increment('pool_errors')
+            raise
+        self.metrics.observe('pool_wait_seconds',
+                             metrics_module.clock() - start)
+        with self._counts_lock:
+            self.in_use += 1
+        return connection
+
+    def release(self, connection):
+        with self._counts_lock:
+            self.in_use -= 1
+        super(PoolMetricsMixin, self).release(connection)
+
+
+class InstrumentedConnectionPool(PoolMetricsMixin, redis.ConnectionPool):
+    """redis.ConnectionPool recording checkouts."""
+
+
+class InstrumentedBlockingConnectionPool(PoolMetricsMixin,
+                                         redis.BlockingConnectionPool):
+    """redis.BlockingConnectionPool recording checkouts."""
+
+
+class InstrumentedStrictRedis(redis.StrictRedis):
+    """Redis client timing its commands and pipelines.
+
+    Must be given an instrumented connection pool, whose metrics it uses.
+    """
+
+    def execute_command(self, *args, **options):
+        metrics = self.connection_pool.metrics
+        label = ('command', args[0])
+        start = metrics_module.clock()
+        try:
+            return super(InstrumentedStrictRedis, self).execute_command(
+                *args, **options)
+        except Exception:
+            metrics.increment('command_errors', label=label)
+            raise
+        finally:
+            metrics.observe('command_seconds',
+                            metrics_module.clock() - start, label)
+
+    def pipeline(self, *args, **kwargs):
+        pipe = super(InstrumentedStrictRedis, self).pipeline(*args, **kwargs)
+        metrics = self.connection_pool.metrics
+        execute = pipe.execute
+
+        def timed_execute(*args, **kwargs):
+            metrics.observe('pipeline_size', len(pipe.command_stack),
+                            buckets=metrics_module.SIZE_BUCKETS)
+            start = metrics_module.clock()
+            try:
+                return execute(*args, **kwargs)
+            except Exception:
+                metrics.increment('pipeline_errors')
+                raise
+            finally:
+                metrics.observe('pipeline_seconds',
+                                metrics_module.clock() - start)
+
+        pipe.execute = timed_execute
+        return pipe
@@ -0,0 +1,138 @@
+"""Cross-process invalidation of local cache tiers.
+
+When every process keeps a LocalCache in front of Redis, a write in one
+process must evict the copies held by the others. An Invalidator publishes
+the keys written through the chassis.services.cache helpers on a Redis
+channel and evicts the keys published by other processes from its cache's
+local tier.
+
+Writes are coalesced: keys are collected for `delay` seconds and published
+as a handful of messages, however many times each key was written.
+
+    users = Cache(settings, local_cache=LocalCache(ttl=60))
+    invalidator = Invalidator(users)
+    invalidator.start()
+
+An AsyncCache sharing the same local tier can publish through the same
+invalidator by setting its `invalidator` attribute.
+"""
+
+import json
+import threading
+import uuid
+
+from tornado import ioloop
+
+DEFAULT_CHANNEL = 'chassis:cache:invalidate'
+
+
+class Invalidator(object):
+    """Publishes and applies local tier invalidations for a Cache.
+
+    Arguments:
+        cache: the Cache used to talk to Redis. Its local tier is the one
+            kept coherent, and its helpers publish through this invalidator.
+        channel: the Redis channel shared by all processes.
+        delay: seconds to collect keys before publishing them.
+        max_batch: maximum number of keys in one message.
+        poll_interval: seconds between checks for incoming messages.
+        io_loop: the IOLoop driving publication and subscription; defaults
+            to the current IOLoop.
+
+    """
+
+    # pylint: disable=too-many-arguments, too-many-instance-attributes
+    def __init__(self, cache, channel=DEFAULT_CHANNEL, delay=0.05,
+                 max_batch=500, poll_interval=0.1, io_loop=None):
+        self.cache = cache
+        self.channel = channel
+        self.delay = delay
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+        self.io_loop = io_loop or ioloop.IOLoop.current()
+        self.origin = uuid.uuid4().hex
+        self.published = 0
+        self.received = 0
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._scheduled = False
+        self._pubsub = None
+        self._poller = None
+        cache.invalidator = self
+        for shard in cache.shards or ():
+            shard.invalidator = self
+
+    def publish(self, redis_keys):
+        """Queue redis_keys to be invalidated in every other process.
+
+        Safe to call from any thread. The keys are published from the
+        IOLoop after `delay` seconds.
+        """
+        with self._lock:
+            self._pending.update(redis_keys)
+            if self._scheduled or not self._pending:
+                return
+            self._scheduled = True
+        self.io_loop.add_callback(self._schedule_flush)
+
+    def _schedule_flush(self):
+        self.io_loop.call_later(self.delay, self.flush)
+
+    def flush(self):
+        """Publish the queued keys now."""
+        with self._lock:
+            pending = sorted(self._pending)
+            self._pending = set()
+            self._scheduled = False
+        if not pending:
+            return
+        with self._channel_cache() as redis_connection:
+            for start in range(0, len(pending), self.max_batch):
+                redis_connection.publish(self.channel, json.dumps({
+                    'origin': self.origin,
+                    'keys': pending[start:start + self.max_batch]}))
+                self.published += 1
+
+    def _channel_cache(self):
+        """Return the cache (or, when sharded, the shard) carrying the
+        channel."""
+        return self.cache.shard_for(self.channel)
+
+    def start(self):
+        """Subscribe to the channel and apply incoming invalidations."""
+        with self._channel_cache() as redis_connection:
+            self._pubsub = redis_connection.pubsub(
+                ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+        self._poller = ioloop.PeriodicCallback(self.poll,
+                                               self.poll_interval * 1000)
+        self._poller.start()
+
+    def stop(self):
+        """Publish anything queued and unsubscribe."""
+        self.flush()
+        if self._poller is not None:
+            self._poller.stop()
+            self._poller = None
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+
+    def poll(self):
+        """Apply every invalidation received since the last poll."""
+        while self._pubsub is not None:
+            message = self._pubsub.get_message()
+            if message is None:
+                return
+            self.apply(message['data'])
+
+    def apply(self, data):
+        """Evict the keys in a published message from the local tier."""
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        message = json.loads(data)
+        if message['origin'] == self.origin:
+            return
+        self.received += 1
+        if self.cache.local_cache is not None:
+            self.cache.local_cache.delete(*message['keys'])
@@ -0,0 +1,135 @@
+"""In-process cache tier.
+
+A bounded LRU with per-entry expiration that sits in front of Redis. Pass
+one to a Cache to have the chassis.services.cache helpers consult it before
+going over the network:
+
+    users = Cache(settings, local_cache=LocalCache(max_entries=10000,
+                                                   max_bytes=8 * 1024 * 1024,
+                                                   ttl=5))
+"""
+
+import collections
+import sys
+import threading
+import time
+
+import six
+
+_clock = getattr(time, 'monotonic', time.time)  # pylint: disable=invalid-name
+
+
+def default_sizeof(value):
+    """Approximate the memory held by a cached value."""
+    if isinstance(value, (six.binary_type, six.text_type)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class LocalCache(object):
+    """Size-aware LRU cache with per-entry TTLs.
+
+    Arguments:
+        max_entries: maximum number of entries, or None for no limit.
+        max_bytes: maximum total size of the values as measured by sizeof,
+            or None for no limit.
+        ttl: default time to live in seconds, or None to keep entries until
+            they are evicted.
+        sizeof: callable returning the size of a value.
+        clock: callable returning the current time in seconds.
+
+    """
+
+    # pylint: disable=too-many-arguments, too-many-instance-attributes
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=None,
+                 sizeof=default_sizeof, clock=_clock):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (value, size, expires_at)
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] is not None and entry[2] <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            # Mark as most recently used.
+            del self._entries[key]
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Store value under key.
+
+        Values larger than max_bytes are not stored. ttl overrides the
+        default time to live for this entry.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            expires_at = None if ttl is None else self._clock() + ttl
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            self._evict()
+
+    def delete(self, *keys):
+        """Remove keys from the cache."""
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return a snapshot of the counters."""
+        return {'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations}
+
+    def _remove(self, key):
+        """Remove key. Caller holds the lock."""
+        self._bytes -= self._entries.pop(key)[1]
+
+    def _evict(self):
+        """Drop least recently used entries until within bounds."""
+        while self._entries and (
+                (self.max_entries is not None
+                 and len(self._entries) > self.max_entries)
+                or (self.max_bytes is not None
+                    and self._bytes > self.max_bytes)):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
@@ -0,0 +1,145 @@
+"""Read replicas for Cache.
+
+A Cache given `read_replicas` sends the reads of the helpers in
+chassis.services.cache to its replicas, and its writes and deletes to the
+primary:
+
+    cache = Cache({'host': 'primary', 'port': 6379},
+                  read_replicas=[{'host': 'replica1', 'port': 6379},
+                                 {'host': 'replica2', 'port': 6379}],
+                  read_strategy=LEAST_LATENCY, max_replica_lag=5)
+
+Pass consistent=True to a read helper to read from the primary, e.g. to
+read back a value just written. Reads go to the primary instead of a
+replica that
+
+- failed with a connection error in the last `replica_retry` seconds
+  (the failed read is retried on the primary), or
+- when max_replica_lag is set, was found at its last check (made at most
+  every `replica_check` seconds) to have its link to the primary down, or
+  idle for more than max_replica_lag seconds. A server that is not a
+  replica counts as lagging.
+
+`with cache` blocks always use the primary.
+"""
+
+import threading
+
+from chassis.services import circuit_breaker
+from chassis.services import metrics as metrics_module
+
+ROUND_ROBIN = 'round_robin'
+
+LEAST_LATENCY = 'least_latency'
+
+# Weight of the latest read in a replica's moving average latency.
+LATENCY_WEIGHT = 0.2
+
+
+class Replica(object):
+    """A replica's Cache and what is known of its health."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, cache, retry, clock):
+        self.cache = cache
+        self.breaker = circuit_breaker.CircuitBreaker(
+            failure_threshold=1, reset_timeout=retry, clock=clock)
+        self.latency = 0.0
+        self.lagging = False
+        self.checked = None
+
+
+class Replicas(object):
+    """Routes the reads of a primary Cache to its replicas.
+
+    Arguments:
+        primary: the Cache writes go to.
+        replicas: Cache instances, one per replica.
+        strategy: ROUND_ROBIN, or LEAST_LATENCY to pick the replica with
+            the lowest moving average read latency.
+        max_lag: seconds without news from the primary after which a
+            replica is skipped, or None to not check replication.
+        check: seconds between replication checks of a replica.
+        retry: seconds a replica is skipped after a connection error.
+        clock: callable returning the current time in seconds.
+
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, primary, replicas, strategy=ROUND_ROBIN, max_lag=None,
+                 check=1, retry=5, clock=metrics_module.clock):
+        if strategy not in (ROUND_ROBIN, LEAST_LATENCY):
+            raise ValueError('Unknown read strategy: %r' % (strategy,))
+        self.primary = primary
+        self.replicas = [Replica(replica, retry, clock)
+                         for replica in replicas]
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check = check
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def __iter__(self):
+        return iter(self.replicas)
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def _lagging(self, replica):
+        """Return whether a replica is too far behind the primary,
+        checking it again if its last check is too old."""
+        if self.max_lag is None:
+            return False
+        now = self._clock()
+        if replica.checked is None or now - replica.checked >= self.check:
+            replica.checked = now
+            try:
+                with replica.cache as redis_connection:
+                    info = redis_connection.info('replication')
+            except replica.cache.connection_errors:
+                replica.breaker.failure()
+                return True
+            replica.lagging = (
+                info.get('master_link_status') != 'up' or
+                info.get('master_last_io_seconds_ago', -1) < 0 or
+                info['master_last_io_seconds_ago'] > self.max_lag)
+        return replica.lagging
+
+    def choose(self):
+        """Return the Replica to read from, or None to read from the
+        primary."""
+        candidates = [replica for replica in self.replicas
+                      if replica.breaker.state != circuit_breaker.OPEN and
+                      not self._lagging(replica)]
+        if not candidates:
+            return None
+        if self.strategy == LEAST_LATENCY:
+            replica = min(candidates, key=lambda replica: replica.latency)
+        else:
+            with self._lock:
+                self._next += 1
+                replica = candidates[self._next % len(candidates)]
+        return replica if replica.breaker.allow() else None
+
+    def read(self, func, consistent=False):
+        """Return func(redis_connection), run on a replica unless
+        consistent is True or no replica is usable, and on the primary if
+        the replica fails to connect."""
+        replica = None if consistent else self.choose()
+        if replica is not None:
+            start = self._clock()
+            try:
+                with replica.cache as redis_connection:
+                    result = func(redis_connection)
+            except replica.cache.connection_errors:
+                replica.breaker.failure()
+                if self.primary.metrics is not None:
+                    self.primary.metrics.increment('replica_fallbacks')
+            else:
+                replica.breaker.success()
+                replica.latency += LATENCY_WEIGHT * (
+                    self._clock() - start - replica.latency)
+                return result
+        with self.primary as redis_connection:
+            return func(redis_connection)
@@ -0,0 +1,127 @@
+"""Client-side sharding for Cache.
+
+A Cache given a list of shard settings spreads its keys over the shards
+with a ketama consistent hash ring, so adding or removing a shard only
+moves the keys of its neighbours on the ring:
+
+    cache = Cache([{'host': 'cache1', 'port': 6379},
+                   {'host': 'cache2', 'port': 6379}])
+
+Keys are placed by their hash tag when they have one, as in Redis Cluster:
+only the part between the first '{' and the next '}' is hashed. Tagging
+the object part of a template keeps all the fields of one object on one
+shard, so reading or writing it takes a single round trip:
+
+    USER = {'username': '{user:%(id)s}:username',
+            'email': '{user:%(id)s}:email'}
+"""
+
+import bisect
+import collections
+import hashlib
+import struct
+import threading
+from multiprocessing.pool import ThreadPool
+
+import six
+
+
+def hash_tag(key):
+    """Return the part of key that decides its shard."""
+    start = key.find('{')
+    if start != -1:
+        end = key.find('}', start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def shard_name(settings):
+    """Return the name placing a shard on the ring, 'host:port[/db]'."""
+    name = '%s:%s' % (settings.get('host', 'localhost'),
+                      settings.get('port', 6379))
+    if settings.get('db'):
+        name += '/%s' % settings['db']
+    return name
+
+
+def _points(data):
+    """Return the four ring points of an MD5 digest, as ketama does."""
+    digest = hashlib.md5(data.encode('utf-8')).digest()
+    return struct.unpack('<4I', digest)
+
+
+class HashRing(object):
+    """Ketama consistent hash ring.
+
+    Arguments:
+        nodes: the node names.
+        replicas: virtual nodes per node; a multiple of 4.
+
+    """
+
+    def __init__(self, nodes, replicas=160):
+        points = sorted((point, node) for node in nodes
+                        for replica in range(replicas // 4)
+                        for point in _points('%s-%d' % (node, replica)))
+        if not points:
+            raise ValueError('A hash ring needs at least one node')
+        self._hashes = [point for (point, _) in points]
+        self._nodes = [node for (_, node) in points]
+
+    def get_node(self, key):
+        """Return the node owning key."""
+        if isinstance(key, six.binary_type):
+            key = key.decode('utf-8')
+        point = _points(key)[0]
+        position = bisect.bisect(self._hashes, point)
+        return self._nodes[position % len(self._nodes)]
+
+
+class Shards(object):
+    """The shards of a Cache and the ring placing keys on them.
+
+    Arguments:
+        shards: Cache instances, one per shard.
+        replicas: virtual nodes per shard.
+
+    """
+
+    def __init__(self, shards, replicas=160):
+        self.shards = list(shards)
+        self._by_name = dict((shard_name(shard.settings), shard)
+                             for shard in self.shards)
+        if len(self._by_name) != len(self.shards):
+            raise ValueError('Shards must have distinct host, port and db')
+        self.ring = HashRing(sorted(self._by_name), replicas)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    def __len__(self):
+        return len(self.shards)
+
+    def shard_for(self, redis_key):
+        """Return the shard holding redis_key."""
+        return self._by_name[self.ring.get_node(hash_tag(redis_key))]
+
+    def group(self, redis_keys):
+        """Return (shard, positions) for each shard holding some of
+        redis_keys, in order of first appearance."""
+        groups = collections.OrderedDict()
+        for (position, redis_key) in enumerate(redis_keys):
+            groups.setdefault(self.shard_for(redis_key), []).append(position)
+        return list(groups.items())
+
+    def run(self, calls):
+        """Run (function, arguments) calls, one thread per shard at most,
+        and return their results in order."""
+        if len(calls) == 1:
+            (func, args) = calls[0]
+            return [func(*args)]
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPool(len(self.shards))
+        return self._pool.map(lambda call: call[0](*call[1]), calls)
@@ -0,0 +1,115 @@
+"""Circuit breaker for data sources.
+
+After `failure_threshold` consecutive connection failures the circuit
+opens and a DatasourceContext given the breaker fails fast instead of
+waiting on a backend that is down. After `reset_timeout` seconds the
+circuit is half open and lets a few probes through: one success closes it,
+one failure opens it again.
+
+    users = Cache(settings, circuit_breaker=CircuitBreaker(5, 30))
+"""
+
+import threading
+import time
+
+_clock = getattr(time, 'monotonic', time.time)  # pylint: disable=invalid-name
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker(object):
+    """Tracks consecutive failures and decides whether to allow calls.
+
+    Arguments:
+        failure_threshold: consecutive failures opening the circuit.
+        reset_timeout: seconds the circuit stays open before probing.
+        half_open_probes: calls let through at a time while half open.
+        clock: callable returning the current time in seconds.
+
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, failure_threshold=5, reset_timeout=30,
+                 half_open_probes=1, clock=_clock):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        """CLOSED, OPEN or HALF_OPEN."""
+        with self._lock:
+            self._update()
+            return self._state
+
+    def _update(self):
+        """Move from open to half open once the timeout passed. Caller
+        holds the lock."""
+        if (self._state == OPEN
+                and self._clock() - self._opened_at >= self.reset_timeout):
+            self._state = HALF_OPEN
+            self._probes = 0
+
+    def allow(self):
+        """Return whether a call may go through now."""
+        with self._lock:
+            self._update()
+            if self._state == CLOSED:
+                return True
+            if (self._state == HALF_OPEN
+                    and self._probes < self.half_open_probes):
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        """Record a call that reached the backend."""
+        with self._lock:
+            if self._state == CLOSED:
+                self._failures = 0
+            elif self._state == HALF_OPEN and self._probes:
+                self._state = CLOSED
+                self._failures = 0
+
+    def failure(self):
+        """Record a call that failed to reach the backend."""
+        with self._lock:
+            if self._state == CLOSED:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open()
+            elif self._state == HALF_OPEN and self._probes:
+                self._open()
+
+    def _open(self):
+        """Open the circuit. Caller holds the lock."""
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._probes = 0
+        self.opened += 1
+
+    def copy(self):
+        """Return a new, closed breaker with the same settings, for a
+        backend that must fail on its own (e.g. another shard)."""
+        return CircuitBreaker(self.failure_threshold, self.reset_timeout,
+                              self.half_open_probes, self._clock)
+
+    def stats(self):
+        """Return a snapshot of the state and counters."""
+        with self._lock:
+            self._update()
+            return {'state': self._state,
+                    'failures': self._failures,
+                    'opened': self.opened,
+                    'rejected': self.rejected}
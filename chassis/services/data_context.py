@@ -1,28 +1,172 @@
 """Data Source Context Manager"""
 # pylint: disable=too-few-public-methods
 
+import threading
+
+from tornado import concurrent
+from tornado import gen
+from tornado import ioloop
 from tornado import web
 
+from chassis.services import metrics as metrics_module
+from chassis.services import pool as pool_module
+from chassis.services import write_buffer
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # Python 2 without the futures backport
+    ThreadPoolExecutor = None
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+
+class _ThreadBlocks(threading.local):
+    """Per-thread stand-in for a ContextVar where contextvars is missing."""
+
+    value = ()
+
+    def get(self):
+        """Return the value set on this thread."""
+        return self.value
+
+    def set(self, value):
+        """Set the value for this thread."""
+        self.value = value
+
+
+# The `with` blocks open in the current context, innermost last, as a tuple
+# of (datasource, block). Tornado (>= 6) and asyncio run every coroutine in
+# its own copy of the context, so blocks of coroutines interleaving on one
+# thread do not see each other's.
+_BLOCKS = (_ThreadBlocks() if contextvars is None
+           else contextvars.ContextVar('chassis_blocks', default=()))
+
+
+def _push_block(datasource, block):
+    """Record block as the innermost open block of datasource."""
+    _BLOCKS.set(_BLOCKS.get() + ((datasource, block), ))
+
+
+def _pop_block(datasource):
+    """Remove and return the innermost open block of datasource, dropping
+    the blocks whose asynchronous entry failed."""
+    blocks = _BLOCKS.get()
+    for index in range(len(blocks) - 1, -1, -1):
+        (owner, block) = blocks[index]
+        if owner is datasource and not block.failed:
+            _BLOCKS.set(tuple(
+                entry for (position, entry) in enumerate(blocks)
+                if position != index and
+                (entry[0] is not datasource or not entry[1].failed)))
+            return block
+    return None
+
+
+class _Block(object):
+    """A `with` block of a DatasourceContext: whether it was handed the
+    fallback, and whether its asynchronous entry failed."""
+
+    __slots__ = ('fallback', 'failed')
+
+    def __init__(self, fallback=False):
+        self.fallback = fallback
+        self.failed = False
+
 
 class DataSourceConnectionError(web.HTTPError):
     """Data Source Connection Error"""
 
     def __init__(self, log_message=None, *args, **kwargs):
-        super(DataSourceConnectionError, self).__init__(*args, **kwargs)
-        self.status_code = 500
-        self.log_message = log_message
-        self.args = args
-        self.reason = kwargs.get('reason', None)
+        super(DataSourceConnectionError, self).__init__(500, log_message,
+                                                        *args, **kwargs)
 
         if 'headers' in kwargs:
             self.headers = kwargs['headers']
 
 
 class DatasourceContext(object):
-    """Data Source Context Manager"""
+    """Data Source Context Manager
+
+    Pass a chassis.services.metrics.Metrics as `metrics` to record the time
+    spent getting connections (checkout_seconds) and the errors raised
+    inside `with` blocks (errors, labelled by exception type).
+
+    Pass a chassis.services.circuit_breaker.CircuitBreaker as
+    `circuit_breaker` to stop using the data source after consecutive
+    connection errors (the exception types in `connection_errors`). While
+    the circuit is open, `with` hands out `fallback` if one was given, and
+    raises `connection_error_class` otherwise. Blocks handed the fallback
+    never touched the data source, so their outcome is not reported to the
+    circuit breaker.
+
+    Coroutines use `async with` (or yield __aenter__ and __aexit__) so a
+    blocking driver never stalls the IOLoop:
+
+        async with users as connection:
+            ...
+        yield users.ainsert(query, params)
+
+    While `blocking` is True, _get_connection, _close_connection, insert
+    and insert_many run on `executor`, a thread pool of `executor_workers`
+    threads by default, shared by the context's calls; this also bounds
+    how many of them run at once. Natively asynchronous drivers set
+    `blocking` to False: these methods are then called on the IOLoop and
+    may return Futures.
+
+    """
+
+    metrics = None
+
+    blocking = True
+
+    executor = None
+
+    executor_workers = 10
+
+    circuit_breaker = None
+
+    fallback = None
+
+    connection_errors = ()
+
+    connection_error_class = DataSourceConnectionError
 
     def __init__(self, *args, **kwargs):
-        pass
+        self.metrics = kwargs.get('metrics')
+        self.circuit_breaker = kwargs.get('circuit_breaker')
+        self.fallback = kwargs.get('fallback')
+        self.executor = kwargs.get('executor', self.executor)
+        self.executor_workers = kwargs.get('executor_workers',
+                                           self.executor_workers)
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        """Return the executor of blocking calls, creating it the first
+        time."""
+        if self.executor is None:
+            if ThreadPoolExecutor is None:
+                raise ImportError('Running blocking datasources from '
+                                  'coroutines requires concurrent.futures')
+            with self._executor_lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(self.executor_workers)
+        return self.executor
+
+    @gen.coroutine
+    def run_blocking(self, func, *args):
+        """Call func(*args) off the IOLoop, on the executor, and return a
+        Future resolving to its result. Datasources that are not blocking
+        call it directly."""
+        if self.blocking:
+            result = yield self._get_executor().submit(func, *args)
+        else:
+            result = func(*args)
+            if concurrent.is_future(result) or hasattr(result, '__await__'):
+                result = yield result
+        raise gen.Return(result)
 
     def _get_connection(self):
         """Override this method to set up the connection."""
@@ -36,8 +180,463 @@ class DatasourceContext(object):
         """Override this method to close the connection."""
         raise NotImplementedError
 
+    def insert_many(self, query, list_of_params):
+        """Insert several rows with one query.
+
+        Calls insert once per row; override this method to use the bulk
+        call of the driver (e.g. executemany).
+        """
+        for params in list_of_params:
+            self.insert(query, params)
+
+    def ainsert(self, query, params):
+        """Return a Future resolving once insert is done, without
+        blocking the IOLoop."""
+        return self.run_blocking(self.insert, query, params)
+
+    def ainsert_many(self, query, list_of_params):
+        """Return a Future resolving once insert_many is done, without
+        blocking the IOLoop."""
+        return self.run_blocking(self.insert_many, query, list_of_params)
+
+    def write_buffer(self, **kwargs):
+        """Return a chassis.services.write_buffer.WriteBuffer writing
+        through insert_many. Keyword arguments configure the buffer."""
+        return write_buffer.WriteBuffer(self, **kwargs)
+
+    def read_many(self, keys):
+        """Override this method to let request scopes batch reads.
+
+        Returns the values of keys in order, or a Future resolving to them.
+        """
+        raise NotImplementedError
+
+    def request_scope(self, io_loop=None):
+        """Return a RequestScope memoizing and batching reads for one
+        request."""
+        return RequestScope(self, io_loop)
+
+    def _record_outcome(self, exc_type):
+        """Report a connection's outcome to the circuit breaker."""
+        if exc_type is not None and issubclass(exc_type,
+                                               self.connection_errors):
+            self.circuit_breaker.failure()
+        else:
+            self.circuit_breaker.success()
+
+    def _admit(self):
+        """Return whether the circuit breaker lets a checkout through, or
+        False to hand out the fallback. Raises connection_error_class when
+        it does not and there is no fallback."""
+        breaker = self.circuit_breaker
+        if breaker is None or breaker.allow():
+            return True
+        if self.metrics is not None:
+            self.metrics.increment('breaker_rejections')
+        if self.fallback is not None:
+            return False
+        raise self.connection_error_class('Circuit breaker is open')
+
+    def _checkout_failed(self, err):
+        """Record a failure to get a connection."""
+        if self.metrics is not None:
+            self.metrics.increment('checkout_errors')
+        if self.circuit_breaker is not None:
+            self._record_outcome(type(err))
+
+    def _checked_out(self, start):
+        """Record the time taken to get a connection since start."""
+        if start is not None:
+            self.metrics.observe('checkout_seconds',
+                                 metrics_module.clock() - start)
+
+    def _finished(self, exc_type, fallback=False):
+        """Record the outcome of a `with` block; blocks handed the
+        fallback are not reported to the circuit breaker."""
+        if exc_type is not None and self.metrics is not None:
+            self.metrics.increment('errors',
+                                   label=('error', exc_type.__name__))
+        if self.circuit_breaker is not None and not fallback:
+            self._record_outcome(exc_type)
+
+    def _exiting(self):
+        """Return whether the block being exited in the current context was
+        handed the fallback."""
+        block = _pop_block(self)
+        return block is not None and block.fallback
+
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        self._close_connection()
+        fallback = self._exiting()
+        self._finished(exc_type, fallback)
+        if not fallback:
+            self._close_connection()
+
+    def __enter__(self):
+        if not self._admit():
+            _push_block(self, _Block(fallback=True))
+            return self.fallback
+        start = None if self.metrics is None else metrics_module.clock()
+        try:
+            connection = self._get_connection()
+        except Exception as err:
+            self._checkout_failed(err)
+            raise
+        self._checked_out(start)
+        _push_block(self, _Block())
+        return connection
+
+    def __aenter__(self):
+        # Not a coroutine: the block must be recorded in the caller's
+        # context, which coroutines only get a copy of.
+        block = _Block()
+        _push_block(self, block)
+        return self._aenter(block)
+
+    @gen.coroutine
+    def _aenter(self, block):
+        """Get a connection for block without blocking the IOLoop."""
+        try:
+            admitted = self._admit()
+        except Exception:
+            block.failed = True
+            raise
+        if not admitted:
+            block.fallback = True
+            raise gen.Return(self.fallback)
+        start = None if self.metrics is None else metrics_module.clock()
+        try:
+            connection = yield self.run_blocking(self._get_connection)
+        except Exception as err:
+            block.failed = True
+            self._checkout_failed(err)
+            raise
+        self._checked_out(start)
+        raise gen.Return(connection)
+
+    def __aexit__(self, exc_type, exc_value, exc_traceback):
+        return self._aexit(exc_type, self._exiting())
+
+    @gen.coroutine
+    def _aexit(self, exc_type, fallback):
+        """Record a block's outcome and close its connection, if it got
+        one, without blocking the IOLoop."""
+        self._finished(exc_type, fallback)
+        if not fallback:
+            yield self.run_blocking(self._close_connection)
+
+
+class Checkout(object):
+    """A connection checked out of a PooledDatasourceContext's pool for
+    one `with` (or, for AsyncPooledDatasourceContext, `async with`) block.
+
+    The connection goes back to the pool after the block, unless the block
+    raised one of the datasource's connection_errors: it is then closed.
+    `fallback` is True while the block runs with the datasource's fallback.
+    """
+
+    def __init__(self, datasource, timeout=None):
+        self.datasource = datasource
+        self.timeout = timeout
+        self.connection = None
+        self.fallback = False
+        self.failed = False
+
+    def _release(self, exc_type, release=None):
+        """Record the block's outcome and return the connection, if one
+        was checked out, through release(pool.release, connection,
+        discard) if given."""
+        datasource = self.datasource
+        fallback, self.fallback = self.fallback, False
+        # pylint: disable=protected-access
+        datasource._finished(exc_type, fallback)
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return None
+        discard = (exc_type is not None and
+                   issubclass(exc_type, datasource.connection_errors))
+        if release is not None:
+            return release(datasource.pool.release, connection, discard)
+        return datasource.pool.release(connection, discard=discard)
 
     def __enter__(self):
-        return self._get_connection()
+        # pylint: disable=protected-access
+        datasource = self.datasource
+        if not datasource._admit():
+            self.fallback = True
+            return datasource.fallback
+        start = (None if datasource.metrics is None
+                 else metrics_module.clock())
+        try:
+            self.connection = datasource.pool.acquire(self.timeout)
+        except Exception as err:
+            datasource._checkout_failed(err)
+            raise
+        datasource._checked_out(start)
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self._release(exc_type)
+
+    @gen.coroutine
+    def __aenter__(self):
+        # pylint: disable=protected-access
+        datasource = self.datasource
+        if not datasource._admit():
+            self.fallback = True
+            raise gen.Return(datasource.fallback)
+        start = (None if datasource.metrics is None
+                 else metrics_module.clock())
+        try:
+            self.connection = yield datasource.run_blocking(
+                datasource.pool.acquire, self.timeout)
+        except Exception as err:
+            datasource._checkout_failed(err)
+            raise
+        datasource._checked_out(start)
+        raise gen.Return(self.connection)
+
+    @gen.coroutine
+    def __aexit__(self, exc_type, exc_value, exc_traceback):
+        released = self._release(exc_type, self.datasource.run_blocking)
+        if released is not None:
+            yield released
+
+
+class PooledDatasourceContext(DatasourceContext):
+    """DatasourceContext reusing connections from a pool.
+
+    Subclasses implement _connect to open a connection, and may override
+    _disconnect to close one and _validate to check one is still usable
+    before it is handed out. `with` blocks then check connections out of
+    a chassis.services.pool.Pool instead of opening new ones:
+
+        class Database(PooledDatasourceContext):
+            connection_errors = (psycopg2.OperationalError, )
+
+            def _connect(self):
+                return psycopg2.connect(self.settings)
+
+        users = Database(dsn, min_size=2, max_size=20, max_lifetime=3600)
+        with users as connection:
+            ...
+
+    Keyword arguments min_size, max_size, max_idle, max_lifetime and
+    reap_interval configure the pool (see chassis.services.pool.BasePool),
+    and pool_timeout bounds the wait for a connection. A connection whose
+    block raised one of connection_errors is closed rather than reused.
+    checkout() returns a context manager bound to one checkout, for
+    passing connections around explicitly. Coroutines use it with
+    `async with`, which waits for the pool on the executor.
+
+    """
+
+    pool_class = pool_module.Pool
+
+    pool_settings = ('min_size', 'max_size', 'max_idle', 'max_lifetime',
+                     'reap_interval')
+
+    def __init__(self, *args, **kwargs):
+        settings = dict((name, kwargs.pop(name)) for name in
+                        self.pool_settings if name in kwargs)
+        settings['timeout'] = kwargs.pop('pool_timeout', None)
+        self.settings = args[0] if args else None
+        super(PooledDatasourceContext, self).__init__(*args, **kwargs)
+        self.pool = self.pool_class(self._connect, close=self._disconnect,
+                                    validate=self._validate, **settings)
+
+    def _connect(self):
+        """Override this method to open a connection."""
+        raise NotImplementedError
+
+    def _disconnect(self, connection):
+        """Close a connection; calls its close method by default."""
+        close = getattr(connection, 'close', None)
+        if close is not None:
+            return close()
+        return None
+
+    def _validate(self, connection):
+        """Override this method to check a connection before it is handed
+        out; returning False closes it."""
+        # pylint: disable=unused-argument, no-self-use
+        return True
+
+    def _get_connection(self):
+        return self.pool.acquire()
+
+    def _close_connection(self):
+        """Connections are returned by their Checkout."""
+        pass
+
+    def checkout(self, timeout=None):
+        """Return a Checkout of a connection, for a `with` block."""
+        return Checkout(self, timeout)
+
+    def __enter__(self):
+        checkout = self.checkout()
+        connection = checkout.__enter__()
+        _push_block(self, checkout)
+        return connection
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        _pop_block(self).__exit__(exc_type, exc_value, exc_traceback)
+
+    def __aenter__(self):
+        raise TypeError('Use `async with datasource.checkout()`')
+
+    def __aexit__(self, exc_type, exc_value, exc_traceback):
+        raise TypeError('Use `async with datasource.checkout()`')
+
+
+class AsyncPooledDatasourceContext(PooledDatasourceContext):
+    """PooledDatasourceContext for coroutines, backed by a
+    chassis.services.pool.AsyncPool: _connect, _disconnect and _validate
+    may return Futures. Check connections out with checkout() in
+    `async with` blocks, or yield pool.acquire() and pool.release(); a
+    plain `with` would block the IOLoop and is not supported.
+    """
+
+    pool_class = pool_module.AsyncPool
+
+    blocking = False
+
+    def __enter__(self):
+        raise TypeError('Use `async with datasource.checkout()`')
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        raise TypeError('Use `async with datasource.checkout()`')
+
+
+class RequestScope(object):
+    """Memoizes and batches the reads of a DatasourceContext for the
+    lifetime of one request.
+
+    Create one per request, e.g. in RequestHandler.prepare, and read
+    through it instead of through the datasource:
+
+        def prepare(self):
+            self.users = USERS.request_scope()
+
+        @gen.coroutine
+        def get(self, user_id):
+            username, email = yield [
+                self.users.load('user:%s:username' % user_id),
+                self.users.load('user:%s:email' % user_id)]
+
+    A key is read at most once per scope, and the keys loaded during the
+    same IOLoop iteration are read with a single call to the datasource's
+    read_many (one MGET for a Cache). Synchronous code can use get and
+    get_many, which share the memo but read immediately. Missing values
+    (None) are memoized too; call prime or clear after writing a key.
+
+    Batch sizes are recorded as the batch_size histogram and memo hits as
+    the memo_hits counter of the datasource's metrics, if it has any.
+
+    """
+
+    def __init__(self, datasource, io_loop=None):
+        self.datasource = datasource
+        self.io_loop = io_loop or ioloop.IOLoop.current()
+        self._memo = {}
+        self._pending = {}
+
+    def _hit(self, count=1):
+        """Count reads served from the memo."""
+        if self.datasource.metrics is not None and count:
+            self.datasource.metrics.increment('memo_hits', count)
+
+    def load(self, key):
+        """Return a Future resolving to the value of key."""
+        if key in self._memo:
+            self._hit()
+            future = concurrent.Future()
+            future.set_result(self._memo[key])
+            return future
+        future = self._pending.get(key)
+        if future is not None:
+            self._hit()
+            return future
+        if not self._pending:
+            self.io_loop.add_callback(self._dispatch)
+        future = self._pending[key] = concurrent.Future()
+        return future
+
+    def load_many(self, keys):
+        """Return a Future resolving to the values of keys, in order."""
+        futures = [self.load(key) for key in keys]
+        result = concurrent.Future()
+
+        def done(_):
+            if all(future.done() for future in futures) and not result.done():
+                errors = [future.exception() for future in futures
+                          if future.exception() is not None]
+                if errors:
+                    result.set_exception(errors[0])
+                else:
+                    result.set_result([future.result() for future in futures])
+
+        for future in futures:
+            future.add_done_callback(done)
+        if not futures:
+            result.set_result([])
+        return result
+
+    def _dispatch(self):
+        """Read the keys loaded since the last dispatch in one batch."""
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        if self.datasource.metrics is not None:
+            self.datasource.metrics.observe(
+                'batch_size', len(keys), buckets=metrics_module.SIZE_BUCKETS)
+        try:
+            values = self.datasource.read_many(keys)
+        except Exception as err:  # pylint: disable=broad-except
+            for future in pending.values():
+                future.set_exception(err)
+            return
+        if concurrent.is_future(values):
+            values.add_done_callback(
+                lambda values: self._resolve(keys, pending, values))
+        else:
+            self._store(keys, pending, values)
+
+    def _resolve(self, keys, pending, values):
+        """Resolve the futures of a batch read asynchronously."""
+        if values.exception() is not None:
+            for future in pending.values():
+                future.set_exception(values.exception())
+        else:
+            self._store(keys, pending, values.result())
+
+    def _store(self, keys, pending, values):
+        """Memoize a batch and resolve its futures."""
+        for (key, value) in zip(keys, values):
+            self._memo[key] = value
+            pending[key].set_result(value)
+
+    def get(self, key):
+        """Return the value of key, reading it now if not memoized."""
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """Return the values of keys in order, reading the keys not
+        memoized now, in a single call."""
+        missing = [key for key in keys if key not in self._memo]
+        self._hit(len(keys) - len(missing))
+        if missing:
+            missing = list(dict.fromkeys(missing))
+            for (key, value) in zip(missing,
+                                    self.datasource.read_many(missing)):
+                self._memo[key] = value
+        return [self._memo[key] for key in keys]
+
+    def prime(self, key, value):
+        """Memoize a value, e.g. one just written."""
+        self._memo[key] = value
+
+    def clear(self, *keys):
+        """Forget the given keys, or every key when none are given."""
+        if not keys:
+            self._memo.clear()
+        for key in keys:
+            self._memo.pop(key, None)
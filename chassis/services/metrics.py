@@ -0,0 +1,237 @@
+"""Low overhead metrics for data sources.
+
+A Metrics instance collects counters, gauges and histograms in process and
+hands them out as a snapshot dictionary, or pushes them to a sink:
+
+    metrics = Metrics(sink=StatsdSink('127.0.0.1', 8125, prefix='users'))
+    users = Cache(settings, metrics=metrics)
+    metrics.start(10)
+
+Series are named after the metric and its label, Prometheus style, e.g.
+'command_seconds{command="GET"}'. Recording a value costs a lock and a
+bisection, so metrics can be left on in production.
+"""
+
+import bisect
+import socket
+import threading
+import time
+
+from tornado import ioloop
+
+clock = getattr(time, 'monotonic', time.time)  # pylint: disable=invalid-name
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0)
+
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def series_name(name, label=None):
+    """Return the series name of a metric and its (key, value) label."""
+    if label is None:
+        return name
+    return '%s{%s="%s"}' % (name, label[0], label[1])
+
+
+class Histogram(object):
+    """Counts of observed values in fixed buckets."""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        """Count value in its bucket."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        """Return the count, sum and cumulative bucket counts."""
+        cumulative = []
+        total = 0
+        for (bound, count) in zip(self.buckets + ('+Inf', ), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {'count': self.count, 'sum': self.sum, 'buckets': cumulative}
+
+
+class Metrics(object):
+    """Collects metrics and pushes snapshots to a sink.
+
+    Arguments:
+        sink: callable taking a snapshot, called by flush.
+
+    """
+
+    def __init__(self, sink=None):
+        self.sink = sink
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._names = {}
+        self._flusher = None
+
+    def _series(self, name, label):
+        key = (name, label)
+        series = self._names.get(key)
+        if series is None:
+            series = self._names[key] = series_name(name, label)
+        return series
+
+    def increment(self, name, value=1, label=None):
+        """Add value to a counter."""
+        series = self._series(name, label)
+        with self._lock:
+            self._counters[series] = self._counters.get(series, 0) + value
+
+    def observe(self, name, value, label=None, buckets=LATENCY_BUCKETS):
+        """Record value in a histogram.
+
+        The buckets of a histogram are fixed by its first observation.
+        """
+        series = self._series(name, label)
+        with self._lock:
+            histogram = self._histograms.get(series)
+            if histogram is None:
+                histogram = self._histograms[series] = Histogram(buckets)
+            histogram.observe(value)
+
+    def gauge(self, name, func, label=None):
+        """Report the value returned by func in every snapshot."""
+        self._gauges[self._series(name, label)] = func
+
+    def snapshot(self):
+        """Return every metric as a dictionary."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict((series, histogram.snapshot())
+                              for (series, histogram)
+                              in self._histograms.items())
+        gauges = dict((series, func())
+                      for (series, func) in list(self._gauges.items()))
+        return {'counters': counters, 'gauges': gauges,
+                'histograms': histograms}
+
+    def flush(self):
+        """Push a snapshot to the sink."""
+        if self.sink is not None:
+            self.sink(self.snapshot())
+
+    def start(self, interval):
+        """Flush every interval seconds from the current IOLoop."""
+        self.stop()
+        self._flusher = ioloop.PeriodicCallback(self.flush, interval * 1000)
+        self._flusher.start()
+
+    def stop(self):
+        """Stop periodic flushes."""
+        if self._flusher is not None:
+            self._flusher.stop()
+            self._flusher = None
+
+
+def _split_series(series):
+    """Return the metric name and label text of a series name."""
+    if '{' not in series:
+        return series, ''
+    name, label = series.split('{', 1)
+    return name, label[:-1]
+
+
+def statsd_lines(snapshot, prefix=None):
+    """Format a snapshot as StatsD gauges.
+
+    Counters are cumulative, so every value is sent as a gauge; histograms
+    are sent as their count, sum and mean. Labels become a path segment:
+    'command_seconds{command="GET"}' is sent as 'command_seconds.GET'.
+    """
+    def path(series, suffix=None):
+        name, label = _split_series(series)
+        parts = [prefix, name, label.split('=', 1)[-1].strip('"') or None,
+                 suffix]
+        return '.'.join(part for part in parts if part)
+
+    lines = []
+    for kind in ('counters', 'gauges'):
+        for (series, value) in sorted(snapshot[kind].items()):
+            lines.append('%s:%s|g' % (path(series), value))
+    for (series, histogram) in sorted(snapshot['histograms'].items()):
+        count = histogram['count']
+        lines.append('%s:%s|g' % (path(series, 'count'), count))
+        lines.append('%s:%s|g' % (path(series, 'sum'), histogram['sum']))
+        if count:
+            lines.append('%s:%s|g' % (path(series, 'mean'),
+                                      float(histogram['sum']) / count))
+    return lines
+
+
+def prometheus_text(snapshot, prefix=None):
+    """Format a snapshot in the Prometheus text exposition format."""
+    def metric(series):
+        name, label = _split_series(series)
+        return ('%s_%s' % (prefix, name) if prefix else name), label
+
+    def labels(*pairs):
+        text = ','.join(pair for pair in pairs if pair)
+        return '{%s}' % text if text else ''
+
+    lines = []
+    typed = set()
+    for (kind, prometheus_type) in (('counters', 'counter'),
+                                    ('gauges', 'gauge')):
+        for (series, value) in sorted(snapshot[kind].items()):
+            name, label = metric(series)
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE %s %s' % (name, prometheus_type))
+            lines.append('%s%s %s' % (name, labels(label), value))
+    for (series, histogram) in sorted(snapshot['histograms'].items()):
+        name, label = metric(series)
+        if name not in typed:
+            typed.add(name)
+            lines.append('# TYPE %s histogram' % name)
+        for (bound, count) in histogram['buckets']:
+            lines.append('%s_bucket%s %s' % (
+                name, labels(label, 'le="%s"' % bound), count))
+        lines.append('%s_sum%s %s' % (name, labels(label), histogram['sum']))
+        lines.append('%s_count%s %s' % (name, labels(label),
+                                        histogram['count']))
+    return '\n'.join(lines) + '\n'
+
+
+class StatsdSink(object):
+    """Sends snapshots to a StatsD server over UDP."""
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix=None,
+                 max_packet=512):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.max_packet = max_packet
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, snapshot):
+        packet = []
+        size = 0
+        for line in statsd_lines(snapshot, self.prefix):
+            if packet and size + len(line) + 1 > self.max_packet:
+                self._send(packet)
+                packet = []
+                size = 0
+            packet.append(line)
+            size += len(line) + 1
+        if packet:
+            self._send(packet)
+
+    def _send(self, lines):
+        try:
+            self._socket.sendto('\n'.join(lines).encode('utf-8'),
+                                self.address)
+        except socket.error:
+            pass  # Metrics are best effort.
@@ -0,0 +1,490 @@
+"""Connection pools for data sources.
+
+A Pool keeps connections open between uses instead of opening and closing
+one per `with` block:
+
+    pool = Pool(lambda: psycopg2.connect(dsn), close=lambda conn: conn.close(),
+                validate=lambda conn: not conn.closed,
+                min_size=2, max_size=20, max_idle=300, max_lifetime=3600)
+
+    with pool.connection() as conn:
+        ...
+
+Connections are handed out most recently used first, so that spare ones
+sit idle and get closed once idle for max_idle seconds, down to min_size.
+Connections older than max_lifetime seconds are closed when returned or
+checked out, and every connection is validated before being handed out.
+Idle connections are reaped whenever one is returned; pass reap_interval
+to also reap them every so many seconds, so that a pool nobody uses any
+more closes its spare connections too.
+
+AsyncPool does the same for the IOLoop: its connect, close and validate
+callables may return Futures, and acquire waits without blocking.
+PooledDatasourceContext and AsyncPooledDatasourceContext in
+chassis.services.data_context build on them.
+"""
+
+import collections
+import contextlib
+import datetime
+import threading
+import time
+import weakref
+
+from tornado import concurrent
+from tornado import gen
+from tornado import ioloop
+from tornado import locks
+from tornado.log import app_log
+
+_clock = getattr(time, 'monotonic', time.time)  # pylint: disable=invalid-name
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up in time."""
+
+
+class PoolClosed(Exception):
+    """Raised when checking out a connection from a closed pool."""
+
+
+class _Entry(object):
+    """A pooled connection and its timestamps."""
+    # pylint: disable=too-few-public-methods
+
+    __slots__ = ('connection', 'created', 'used')
+
+    def __init__(self, connection, now):
+        self.connection = connection
+        self.created = now
+        self.used = now
+
+
+class BasePool(object):
+    """Bookkeeping shared by Pool and AsyncPool.
+
+    Arguments:
+        connect: callable opening a connection.
+        close: callable closing a connection, or None.
+        validate: callable returning whether a connection is still usable,
+            or None to not validate connections. Connections it raises
+            for are closed like those it rejects.
+        min_size: connections kept open even when idle.
+        max_size: connections open at most; checkouts wait for one to be
+            returned beyond that.
+        max_idle: seconds after which idle connections beyond min_size are
+            closed, or None to keep them.
+        max_lifetime: seconds after which connections are closed instead
+            of reused, or None to reuse them forever.
+        timeout: default seconds to wait for a connection, or None to wait
+            as long as it takes.
+        reap_interval: seconds between reaps of the idle connections in
+            the background, or None to only reap them when connections
+            are returned and when reap is called.
+        clock: callable returning the current time in seconds.
+
+    """
+
+    # pylint: disable=too-many-arguments, too-many-instance-attributes
+    def __init__(self, connect, close=None, validate=None, min_size=0,
+                 max_size=10, max_idle=300, max_lifetime=None, timeout=None,
+                 reap_interval=None, clock=_clock):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError('Pool sizes must satisfy 0 <= min_size <= '
+                             'max_size and max_size >= 1')
+        self._connect = connect
+        self._close = close
+        self._validate = validate
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.reap_interval = reap_interval
+        self._clock = clock
+        self._idle = collections.deque()
+        self._in_use = {}
+        self._size = 0
+        self._waiting = 0
+        self.closed = False
+        self.created = 0
+        self.discarded = 0
+
+    def _expired(self, entry, now):
+        """Return whether a connection outlived max_lifetime."""
+        return (self.max_lifetime is not None and
+                now - entry.created >= self.max_lifetime)
+
+    def _take_idle(self):
+        """Return the most recently used idle entry, or None."""
+        return self._idle.pop() if self._idle else None
+
+    def _reserve(self):
+        """Return whether a new connection may be opened, counting it."""
+        if self._size < self.max_size:
+            self._size += 1
+            return True
+        return False
+
+    def _drop_expired(self, entry):
+        """Return whether an entry taken from the idle list outlived
+        max_lifetime, removing it from the pool if so."""
+        if not self._expired(entry, self._clock()):
+            return False
+        self._size -= 1
+        self.discarded += 1
+        return True
+
+    def _check_out(self, entry):
+        """Mark an entry in use and return its connection."""
+        self._in_use[id(entry.connection)] = entry
+        return entry.connection
+
+    def _check_in(self, connection, discard):
+        """Take a returned connection back. Returns the entry if it must be
+        closed, None if it went back to the idle list."""
+        entry = self._in_use.pop(id(connection))
+        now = self._clock()
+        if discard or self.closed or self._expired(entry, now):
+            self._size -= 1
+            self.discarded += 1
+            return entry
+        entry.used = now
+        self._idle.append(entry)
+        return None
+
+    def _reapable(self):
+        """Remove and return the idle entries to close: the expired ones,
+        and those idle too long beyond min_size."""
+        now = self._clock()
+        reaped = [entry for entry in self._idle if self._expired(entry, now)]
+        if self.max_idle is not None:
+            # Least recently used first.
+            for entry in self._idle:
+                if self._size - len(reaped) <= self.min_size:
+                    break
+                if (now - entry.used >= self.max_idle and
+                        entry not in reaped):
+                    reaped.append(entry)
+        for entry in reaped:
+            self._idle.remove(entry)
+        self._size -= len(reaped)
+        self.discarded += len(reaped)
+        return reaped
+
+    def _closing(self):
+        """Mark the pool closed and return the idle entries to close."""
+        self.closed = True
+        idle = list(self._idle)
+        self._idle.clear()
+        self._size -= len(idle)
+        return idle
+
+    def stats(self):
+        """Return a snapshot of the pool's size and counters."""
+        return {'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'waiting': self._waiting,
+                'created': self.created,
+                'discarded': self.discarded}
+
+
+def _reap_every(pool_ref, interval, stopped):
+    """Reap a Pool every interval seconds until stopped is set or the pool
+    is garbage collected."""
+    while not stopped.wait(interval):
+        pool = pool_ref()
+        if pool is None:
+            return
+        try:
+            pool.reap()
+        except Exception:  # pylint: disable=broad-except
+            app_log.exception('Reaping a connection pool failed')
+        del pool
+
+
+class Pool(BasePool):
+    """Thread safe connection pool. See BasePool for the arguments; with a
+    reap_interval, a daemon thread reaps the pool until it is closed."""
+
+    def __init__(self, *args, **kwargs):
+        super(Pool, self).__init__(*args, **kwargs)
+        self._lock = threading.Condition(threading.Lock())
+        self._reaper = threading.Event()
+        if self.reap_interval is not None:
+            thread = threading.Thread(
+                target=_reap_every, name='pool-reaper',
+                args=(weakref.ref(self), self.reap_interval, self._reaper))
+            thread.daemon = True
+            thread.start()
+
+    def _open(self):
+        """Open a connection for a reserved slot."""
+        try:
+            connection = self._connect()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self.created += 1
+            return self._check_out(_Entry(connection, self._clock()))
+
+    def _discard(self, entries):
+        """Close the connections of entries."""
+        for entry in entries:
+            if self._close is not None:
+                self._close(entry.connection)
+
+    def fill(self):
+        """Open connections until the pool holds min_size."""
+        while True:
+            with self._lock:
+                if self.closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            self.release(self._open())
+
+    def _wait(self, deadline, timeout):
+        """Return an idle entry, or None once a slot for a new connection
+        is reserved, waiting until deadline. Caller holds the lock."""
+        while True:
+            if self.closed:
+                raise PoolClosed('The pool is closed')
+            entry = self._take_idle()
+            if entry is not None or self._reserve():
+                return entry
+            remaining = None if deadline is None else deadline - self._clock()
+            if remaining is not None and remaining <= 0:
+                raise PoolTimeout('No connection available after %s '
+                                  'seconds' % timeout)
+            self._waiting += 1
+            try:
+                self._lock.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+    def acquire(self, timeout=None):
+        """Check a connection out, waiting up to timeout seconds (the
+        pool's timeout by default) for one to be returned."""
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else self._clock() + timeout
+        self.fill()
+        while True:
+            with self._lock:
+                entry = self._wait(deadline, timeout)
+                if entry is None:
+                    break
+                expired = self._drop_expired(entry)
+                if expired:
+                    self._lock.notify()
+                else:
+                    connection = self._check_out(entry)
+            if expired:
+                self._discard([entry])
+            elif self._valid(connection):
+                return connection
+            else:
+                self.release(connection, discard=True)
+        return self._open()
+
+    def _valid(self, connection):
+        """Return whether a checked out connection passes validation."""
+        if self._validate is None:
+            return True
+        try:
+            return self._validate(connection)
+        except Exception:  # pylint: disable=broad-except
+            app_log.warning('Validating a pooled connection failed',
+                            exc_info=True)
+            return False
+
+    def release(self, connection, discard=False):
+        """Return a connection to the pool, or close it if discard is True
+        (e.g. after a connection error)."""
+        with self._lock:
+            entry = self._check_in(connection, discard)
+            reaped = self._reapable()
+            self._lock.notify()
+        self._discard(([entry] if entry is not None else []) + reaped)
+
+    def reap(self):
+        """Close the connections idle for too long, or too old."""
+        with self._lock:
+            reaped = self._reapable()
+        self._discard(reaped)
+        return len(reaped)
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """Check a connection out for a `with` block. It is discarded if
+        the block raises."""
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        except BaseException:
+            self.release(connection, discard=True)
+            raise
+        self.release(connection)
+
+    def close(self):
+        """Close the idle connections, and the others once returned."""
+        with self._lock:
+            idle = self._closing()
+            self._lock.notify_all()
+        self._reaper.set()
+        self._discard(idle)
+
+
+@gen.coroutine
+def _resolve(value):
+    """Wait for value if it is a Future or awaitable."""
+    if concurrent.is_future(value) or hasattr(value, '__await__'):
+        value = yield value
+    raise gen.Return(value)
+
+
+class AsyncPool(BasePool):
+    """Connection pool for coroutines running on one IOLoop. connect,
+    close and validate may return Futures. See BasePool for the
+    arguments; with a reap_interval, a PeriodicCallback started on the
+    IOLoop by the first checkout reaps the pool until it is closed."""
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncPool, self).__init__(*args, **kwargs)
+        self._returned = locks.Condition()
+        self._reaper = None
+
+    def _start_reaper(self):
+        """Start reaping the pool periodically, from the current IOLoop."""
+        if self.reap_interval is not None and self._reaper is None:
+            self._reaper = ioloop.PeriodicCallback(
+                self.reap, self.reap_interval * 1000)
+            self._reaper.start()
+
+    @gen.coroutine
+    def _open(self):
+        """Open a connection for a reserved slot."""
+        try:
+            connection = yield _resolve(self._connect())
+        except Exception:
+            self._size -= 1
+            self._returned.notify()
+            raise
+        self.created += 1
+        raise gen.Return(self._check_out(_Entry(connection, self._clock())))
+
+    @gen.coroutine
+    def _discard(self, entries):
+        """Close the connections of entries."""
+        for entry in entries:
+            if self._close is not None:
+                yield _resolve(self._close(entry.connection))
+
+    @gen.coroutine
+    def fill(self):
+        """Open connections until the pool holds min_size."""
+        while not self.closed and self._size < self.min_size:
+            self._size += 1
+            connection = yield self._open()
+            yield self.release(connection)
+
+    @gen.coroutine
+    def acquire(self, timeout=None):
+        """Check a connection out, waiting up to timeout seconds (the
+        pool's timeout by default) for one to be returned."""
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else self._clock() + timeout
+        self._start_reaper()
+        yield self.fill()
+        while True:
+            if self.closed:
+                raise PoolClosed('The pool is closed')
+            entry = self._take_idle()
+            if entry is None:
+                if self._reserve():
+                    connection = yield self._open()
+                    raise gen.Return(connection)
+                remaining = (None if deadline is None
+                             else deadline - self._clock())
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeout('No connection available after %s '
+                                      'seconds' % timeout)
+                self._waiting += 1
+                try:
+                    yield self._returned.wait(
+                        None if remaining is None
+                        else datetime.timedelta(seconds=remaining))
+                finally:
+                    self._waiting -= 1
+                continue
+            if self._drop_expired(entry):
+                self._returned.notify()
+                yield self._discard([entry])
+                continue
+            connection = self._check_out(entry)
+            valid = True
+            if self._validate is not None:
+                try:
+                    valid = yield _resolve(self._validate(connection))
+                except Exception:  # pylint: disable=broad-except
+                    app_log.warning('Validating a pooled connection failed',
+                                    exc_info=True)
+                    valid = False
+            if valid:
+                raise gen.Return(connection)
+            yield self.release(connection, discard=True)
+
+    @gen.coroutine
+    def release(self, connection, discard=False):
+        """Return a connection to the pool, or close it if discard is True
+        (e.g. after a connection error)."""
+        entry = self._check_in(connection, discard)
+        reaped = self._reapable()
+        self._returned.notify()
+        yield self._discard(([entry] if entry is not None else []) + reaped)
+
+    @gen.coroutine
+    def reap(self):
+        """Close the connections idle for too long, or too old."""
+        reaped = self._reapable()
+        yield self._discard(reaped)
+        raise gen.Return(len(reaped))
+
+    def connection(self, timeout=None):
+        """Return an asynchronous context manager checking a connection
+        out for an `async with` block. It is discarded if the block
+        raises."""
+        return _AsyncCheckout(self, timeout)
+
+    @gen.coroutine
+    def close(self):
+        """Close the idle connections, and the others once returned."""
+        idle = self._closing()
+        self._returned.notify_all()
+        if self._reaper is not None:
+            self._reaper.stop()
+        yield self._discard(idle)
+
+
+class _AsyncCheckout(object):
+    """`async with` checkout of an AsyncPool connection."""
+
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._connection = None
+
+    @gen.coroutine
+    def __aenter__(self):
+        self._connection = yield self._pool.acquire(self._timeout)
+        raise gen.Return(self._connection)
+
+    @gen.coroutine
+    def __aexit__(self, exc_type, exc_value, exc_traceback):
+        yield self._pool.release(self._connection,
+                                 discard=exc_type is not None)
@@ -0,0 +1,262 @@
+"""Write-behind buffering of data source inserts.
+
+A WriteBuffer takes rows through the same insert(query, params) call as a
+DatasourceContext, and writes them in bulk with the datasource's
+insert_many, one call per query:
+
+    events = analytics.write_buffer(max_rows=500, max_delay=1.0)
+    events.insert('INSERT INTO events VALUES (%s, %s)', (user_id, name))
+
+The rows of a query are flushed once max_rows or max_bytes of them are
+buffered, and every row is flushed at most max_delay seconds after it was
+buffered. When max_pending rows are buffered, insert flushes them all.
+Flushes started on the IOLoop (by a handler's insert, or once max_delay ran
+out) write with the datasource's ainsert_many, so that the IOLoop never
+waits on the datasource; insert then returns the Future of the flush, which
+coroutines may yield to slow down to the pace of the datasource. Inserts
+from other threads flush before returning. Buffers are flushed when closed
+and, unless closed before, at interpreter exit.
+
+Rows of a failed flush are dropped, counted as dropped_rows and, for
+flushes run from the IOLoop, logged. Explicit calls to flush and close
+raise the error.
+"""
+
+import atexit
+import threading
+import weakref
+
+import six
+from tornado import gen
+from tornado import ioloop
+from tornado.log import app_log
+
+from chassis.services import metrics as metrics_module
+
+try:
+    from asyncio import get_running_loop
+except ImportError:  # Python < 3.7
+    get_running_loop = None  # pylint: disable=invalid-name
+
+# Buffers to flush at interpreter exit; closed buffers leave it, and it
+# does not keep the others alive.
+_AT_EXIT = weakref.WeakSet()
+
+
+def default_sizeof(params):
+    """Approximate the size in bytes of a row's parameters."""
+    if isinstance(params, dict):
+        params = params.values()
+    size = 0
+    for value in params:
+        if isinstance(value, (six.binary_type, six.text_type)):
+            size += len(value)
+        else:
+            size += 8
+    return size
+
+
+class WriteBuffer(object):
+    """Buffers the inserts of a datasource and writes them in bulk.
+
+    Arguments:
+        datasource: the DatasourceContext writing the rows, with
+            insert_many(query, list_of_params) and its ainsert_many.
+        max_rows: rows of one query that trigger its flush.
+        max_bytes: bytes of one query's rows, as measured by sizeof, that
+            trigger its flush, or None.
+        max_delay: seconds after which buffered rows are flushed from the
+            IOLoop, or None to only flush on size.
+        max_pending: rows buffered in all, beyond which insert flushes
+            before returning.
+        sizeof: callable returning the size of a row's parameters.
+        metrics: a chassis.services.metrics.Metrics recording flush_seconds,
+            batch_rows and dropped_rows; defaults to the datasource's.
+        io_loop: the IOLoop running delayed flushes; defaults to the current
+            IOLoop.
+        flush_at_exit: flush the buffer when the interpreter exits.
+
+    """
+
+    # pylint: disable=too-many-arguments, too-many-instance-attributes
+    def __init__(self, datasource, max_rows=500, max_bytes=None,
+                 max_delay=1.0, max_pending=10000, sizeof=default_sizeof,
+                 metrics=None, io_loop=None, flush_at_exit=True):
+        self.datasource = datasource
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self._sizeof = sizeof
+        self.metrics = metrics if metrics is not None else getattr(
+            datasource, 'metrics', None)
+        self.io_loop = io_loop or ioloop.IOLoop.current()
+        self._lock = threading.Lock()
+        # query -> [list of params, bytes]
+        self._rows = {}
+        self._pending = 0
+        self._timer = None
+        self.closed = False
+        if flush_at_exit:
+            _AT_EXIT.add(self)
+
+    def __len__(self):
+        return self._pending
+
+    def insert(self, query, params):
+        """Buffer a row, flushing what needs to be.
+
+        Returns the Future of the flush it started on the IOLoop, if any.
+        """
+        size = 0 if self.max_bytes is None else self._sizeof(params)
+        with self._lock:
+            if self.closed:
+                raise ValueError('The write buffer is closed')
+            buffered = self._rows.get(query)
+            if buffered is None:
+                buffered = self._rows[query] = [[], 0]
+            buffered[0].append(params)
+            buffered[1] += size
+            self._pending += 1
+            full = (len(buffered[0]) >= self.max_rows or
+                    (self.max_bytes is not None and
+                     buffered[1] >= self.max_bytes))
+            overflowing = self._pending >= self.max_pending
+            if self.max_delay is not None and self._timer is None:
+                self._timer = True
+                self.io_loop.add_callback(self._schedule)
+        if not (overflowing or full):
+            return None
+        if overflowing:
+            query = None
+        if self._on_io_loop():
+            future = self.aflush(query)
+            self.io_loop.add_future(future, self._flushed)
+            return future
+        self.flush(query)
+        return None
+
+    def _on_io_loop(self):
+        """Return whether the caller runs on the buffer's IOLoop."""
+        asyncio_loop = getattr(self.io_loop, 'asyncio_loop', None)
+        if asyncio_loop is None or get_running_loop is None:
+            return ioloop.IOLoop.current(instance=False) is self.io_loop
+        try:
+            return get_running_loop() is asyncio_loop
+        except RuntimeError:  # no running loop on this thread
+            return False
+
+    @staticmethod
+    def _flushed(future):
+        """Log the failure of a flush started by insert."""
+        try:
+            future.result()
+        except Exception:  # pylint: disable=broad-except
+            app_log.exception('Flush of a write buffer failed')
+
+    def _schedule(self):
+        """Arm the delayed flush timer, from the IOLoop."""
+        with self._lock:
+            if self._timer is True:
+                self._timer = self.io_loop.call_later(self.max_delay,
+                                                      self._flush_later)
+
+    @gen.coroutine
+    def _flush_later(self):
+        """Flush the buffer when its delay ran out."""
+        with self._lock:
+            self._timer = None
+        try:
+            yield self.aflush()
+        except Exception:  # pylint: disable=broad-except
+            app_log.exception('Delayed flush of a write buffer failed')
+
+    def _take(self, query):
+        """Remove and return the (query, rows) to flush. Caller holds the
+        lock."""
+        if query is None:
+            batches = [(name, buffered[0])
+                       for (name, buffered) in self._rows.items()]
+            self._rows = {}
+        elif query in self._rows:
+            batches = [(query, self._rows.pop(query)[0])]
+        else:
+            batches = []
+        self._pending -= sum(len(rows) for (_, rows) in batches)
+        return batches
+
+    def _record_batch(self, rows, start, error):
+        """Record the outcome of writing a batch of rows since start."""
+        if self.metrics is None:
+            return
+        if error is not None:
+            self.metrics.increment('dropped_rows', len(rows))
+            return
+        self.metrics.observe('flush_seconds', metrics_module.clock() - start)
+        self.metrics.observe('batch_rows', len(rows),
+                             buckets=metrics_module.SIZE_BUCKETS)
+
+    def flush(self, query=None):
+        """Write the buffered rows of query, or of every query, now.
+
+        Returns the number of rows written.
+        """
+        with self._lock:
+            batches = self._take(query)
+        written = 0
+        error = None
+        for (name, rows) in batches:
+            start = metrics_module.clock()
+            try:
+                self.datasource.insert_many(name, rows)
+            except Exception as err:  # pylint: disable=broad-except
+                error = err
+                self._record_batch(rows, start, err)
+                continue
+            written += len(rows)
+            self._record_batch(rows, start, None)
+        if error is not None:
+            raise error
+        return written
+
+    @gen.coroutine
+    def aflush(self, query=None):
+        """Write the buffered rows of query, or of every query, with the
+        datasource's ainsert_many, without blocking the IOLoop.
+
+        Returns a Future resolving to the number of rows written.
+        """
+        with self._lock:
+            batches = self._take(query)
+        written = 0
+        error = None
+        for (name, rows) in batches:
+            start = metrics_module.clock()
+            try:
+                yield self.datasource.ainsert_many(name, rows)
+            except Exception as err:  # pylint: disable=broad-except
+                error = err
+                self._record_batch(rows, start, err)
+                continue
+            written += len(rows)
+            self._record_batch(rows, start, None)
+        if error is not None:
+            raise error
+        raise gen.Return(written)
+
+    def close(self):
+        """Flush the buffer and stop taking rows."""
+        with self._lock:
+            self.closed = True
+        _AT_EXIT.discard(self)
+        return self.flush()
+
+
+@atexit.register
+def _flush_at_exit():
+    """Flush what is left in the open buffers when the interpreter exits."""
+    for buffer_ in list(_AT_EXIT):
+        try:
+            buffer_.close()
+        except Exception:  # pylint: disable=broad-except
+            app_log.exception('Flushing a write buffer at exit failed')
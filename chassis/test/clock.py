@@ -0,0 +1,12 @@
+"""Clock for tests of time-dependent code."""
+
+
+class FakeClock(object):
+    """Clock that only moves when told to."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
@@ -0,0 +1 @@
+""" Cache Unit Tests """
@@ -0,0 +1,177 @@
+"""Unit Test for chassis.services.cache.asynchronous module"""
+# pylint: disable=invalid-name
+import unittest
+import yaml
+from tornado import testing
+
+from chassis.services import cache
+from chassis.services.cache import asynchronous
+from chassis.services.cache import local
+
+
+def get_config_yaml():
+    """Load Test Config"""
+    config_file = open('./test/test_config.yml', 'r')
+    return yaml.load(config_file) or {}
+
+
+@unittest.skipIf(asynchronous.aioredis is None, 'redis.asyncio unavailable')
+class AsyncCacheTest(testing.AsyncTestCase):
+    """AsyncCache Unit Test"""
+    _config = None
+
+    _cache = None
+
+    def setUp(self):
+        """Create Redis"""
+        super(AsyncCacheTest, self).setUp()
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        self._cache = asynchronous.AsyncCache(self._config['redis'])
+
+    def tearDown(self):
+        """Flush Database"""
+        with self._cache as redis_connection:
+            self.io_loop.run_sync(redis_connection.flushdb)
+        super(AsyncCacheTest, self).tearDown()
+
+    @testing.gen_test
+    def test_negative_caching(self):
+        """Objects marked absent are reported as ABSENT until set"""
+        template = cache.Template({'name': 'user:%(id)s:name',
+                                   'email': 'user:%(id)s:email'},
+                                  negative_ttl=10)
+        yield asynchronous.mark_absent(self._cache, template, {'id': 1})
+        result = yield asynchronous.retrieve_object(self._cache, template,
+                                                    {'id': 1})
+        self.assertIs(cache.ABSENT, result)
+
+        yield asynchronous.set_object(self._cache, template, {'id': 1},
+                                      {'name': 'Bob'})
+        result = yield asynchronous.retrieve_object(
+            self._cache, template, {'id': 1}, partial=True)
+        self.assertEqual(({'name': b'Bob'}, ['email']), result)
+
+    @testing.gen_test
+    def test_read_through_entries_do_not_outlive_redis(self):
+        """Values read from Redis expire locally with their Redis keys"""
+        now = [0]
+        self._cache.local_cache = local.LocalCache(clock=lambda: now[0])
+        yield asynchronous.set_value(self._cache, 'user:1:username', 'Bob',
+                                     ttl=10)
+        yield asynchronous.set_value(self._cache, 'user:2:username', 'Bob')
+        self._cache.local_cache.clear()
+
+        yield asynchronous.get_value(self._cache, 'user:1:username')
+        yield asynchronous.multi_get(self._cache, ['user:2:username'])
+        yield asynchronous.retrieve_object(
+            self._cache, {'username': 'user:%(id)s:username'}, {'id': 1})
+        self.assertEqual(2, len(self._cache.local_cache))
+
+        now[0] = 11
+        self.assertEqual(None,
+                         self._cache.local_cache.get('user:1:username'))
+        self.assertEqual(b'Bob',
+                         self._cache.local_cache.get('user:2:username'))
+
+    @testing.gen_test
+    def test_request_scope(self):
+        """Request scopes batch loads into one MGET"""
+        yield asynchronous.set_value(self._cache, 'foo', 'bar')
+        scope = self._cache.request_scope()
+        values = yield [scope.load('foo'), scope.load('missing'),
+                        scope.load('foo')]
+        self.assertEqual([b'bar', None, b'bar'], values)
+
+        yield asynchronous.delete_value(self._cache, 'foo')
+        self.assertEqual(b'bar', (yield scope.load('foo')))
+
+    @testing.gen_test
+    def test_set_retrieve_and_delete_object(self):
+        """Test set_object, retrieve_object, and delete_object coroutines"""
+        template = {'username': 'user:%(id)s:username',
+                    'email': 'user:%(id)s:email',
+                    'phone': 'phone:%(id)s:phone'}
+        indexes = {'id': 12345}
+        data = {'username': 'Bob',
+                'email': 'bob@example.com',
+                'phone': '555-555-5555'}
+
+        yield asynchronous.set_object(self._cache, template, indexes, data)
+
+        result = yield asynchronous.retrieve_object(self._cache, template,
+                                                    indexes)
+        self.assertEqual(
+            {'username': b'Bob',
+             'email': b'bob@example.com',
+             'phone': b'555-555-5555'},
+            result
+            )
+
+        yield asynchronous.delete_object(self._cache, template, indexes)
+
+        result = yield asynchronous.retrieve_object(self._cache, template,
+                                                    indexes)
+        self.assertEqual(None, result)
+
+    @testing.gen_test
+    def test_set_and_retrieve_objects(self):
+        """Test set_objects and retrieve_objects coroutines"""
+        template = {'username': 'user:%(id)s:username',
+                    'email': 'user:%(id)s:email'}
+        list_of_indexes = [{'id': 1}, {'id': 2}, {'id': 3}]
+
+        yield asynchronous.set_objects(
+            self._cache, template, list_of_indexes[:2],
+            [{'username': 'Bob', 'email': 'bob@example.com'},
+             {'username': 'John'}],
+            chunk_size=2)
+
+        result = yield asynchronous.retrieve_objects(
+            self._cache, template, list_of_indexes, chunk_size=2)
+        self.assertEqual(
+            [{'username': b'Bob', 'email': b'bob@example.com'}, None, None],
+            result)
+
+    @testing.gen_test
+    def test_multi_get(self):
+        """Test Getting Multipile Keys"""
+        yield asynchronous.set_value(self._cache, 'user:12345:username', 'Bob')
+        yield asynchronous.set_value(self._cache, 'user:67890:username',
+                                     'John')
+
+        result = yield asynchronous.multi_get(self._cache,
+                                              ['user:12345:username',
+                                               'user:67890:username'])
+
+        self.assertEqual([b'Bob', b'John'], result)
+
+    @testing.gen_test
+    def test_set_get_and_delete_value(self):
+        """Test setting, getting, and deleting value by key"""
+        yield asynchronous.set_value(self._cache, 'user:12345:username',
+                                     'Harry')
+
+        result = yield asynchronous.get_value(self._cache,
+                                              'user:12345:username')
+        self.assertEqual(b'Harry', result)
+
+        result = yield asynchronous.delete_value(self._cache,
+                                                 'user:12345:username')
+        self.assertEqual(1, result)
+
+        result = yield asynchronous.get_value(self._cache,
+                                              'user:12345:username')
+        self.assertEqual(None, result)
+
+    @testing.gen_test
+    def test_async_context_manager(self):
+        """AsyncCache can be entered with `async with`"""
+        connection = yield self._cache.__aenter__()
+        yield connection.set('user:12345:username', 'Bob')
+        yield self._cache.__aexit__(None, None, None)
+
+        result = yield asynchronous.get_value(self._cache,
+                                              'user:12345:username')
+        self.assertEqual(b'Bob', result)
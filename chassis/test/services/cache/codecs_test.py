@@ -0,0 +1,71 @@
+"""Unit Test for chassis.services.cache.codecs module"""
+# pylint: disable=invalid-name
+import datetime
+import unittest
+
+from chassis.services.cache import codecs
+
+VALUE = {'id': 342, 'name': u'Bob', 'tags': ['a', 'b'], 'ratio': 0.5,
+         'active': True, 'manager': None}
+
+
+class CodecTest(unittest.TestCase):
+    """Codec Unit Test"""
+
+    def test_json_round_trip(self):
+        """JSON keeps types and uses ModelJSONEncoder"""
+        codec = codecs.Codec('json')
+        self.assertEqual(VALUE, codec.decode(codec.encode(VALUE)))
+        self.assertEqual(
+            '2015-08-29T17:30:00Z',
+            codec.decode(codec.encode(datetime.datetime(2015, 8, 29, 17,
+                                                        30))))
+
+    def test_pickle_round_trip(self):
+        """Pickle keeps Python types and must be opted in to"""
+        codec = codecs.Codec('pickle')
+        value = {'when': datetime.datetime(2015, 8, 29), 'ids': set([1, 2])}
+        encoded = codec.encode(value)
+        self.assertEqual(value, codec.decode(encoded))
+        self.assertRaises(ValueError, codecs.Codec('json').decode, encoded)
+
+    @unittest.skipIf(codecs.msgpack is None, 'msgpack unavailable')
+    def test_msgpack_round_trip(self):
+        """msgpack keeps types"""
+        codec = codecs.Codec('msgpack')
+        self.assertEqual(VALUE, codec.decode(codec.encode(VALUE)))
+
+    def test_compression_threshold(self):
+        """Only payloads over the threshold are compressed"""
+        codec = codecs.Codec('json', compression='zlib', threshold=100)
+        small = codec.encode('a' * 10)
+        large = codec.encode('a' * 1000)
+        self.assertEqual(13, len(small))
+        self.assertTrue(len(large) < 100)
+        self.assertEqual('a' * 10, codec.decode(small))
+        self.assertEqual('a' * 1000, codec.decode(large))
+
+    @unittest.skipIf(codecs.lz4_frame is None, 'lz4 unavailable')
+    def test_lz4_compression(self):
+        """lz4 compressed payloads round trip"""
+        codec = codecs.Codec('json', compression='lz4', threshold=0)
+        self.assertEqual(VALUE, codec.decode(codec.encode(VALUE)))
+
+    def test_codec_is_detected_from_header(self):
+        """Any codec decodes values written by another configuration"""
+        writer = codecs.Codec('json', compression='zlib', threshold=0)
+        reader = codecs.Codec('pickle')
+        self.assertEqual(VALUE, reader.decode(writer.encode(VALUE)))
+
+    def test_values_without_header(self):
+        """Values not written by a codec are returned untouched"""
+        codec = codecs.Codec()
+        self.assertEqual(b'Bob', codec.decode(b'Bob'))
+        self.assertEqual(b'', codec.decode(b''))
+        self.assertEqual(None, codec.decode(None))
+        self.assertEqual(u'Bob', codec.decode(u'Bob'))
+
+    def test_invalid_configuration(self):
+        """Unknown serializers and compressions are rejected"""
+        self.assertRaises(ValueError, codecs.Codec, 'yaml')
+        self.assertRaises(ValueError, codecs.Codec, 'json', 'gzip')
@@ -0,0 +1,225 @@
+"""Unit Test for chassis.services.cache.compute module"""
+# pylint: disable=invalid-name
+import threading
+import time
+import unittest
+
+import yaml
+from tornado import gen
+from tornado import testing
+
+from chassis.services import cache
+from chassis.services.cache import asynchronous
+from chassis.services.cache import codecs
+from chassis.services.cache import compute
+
+
+def get_config_yaml():
+    """Load Test Config"""
+    config_file = open('./test/test_config.yml', 'r')
+    return yaml.load(config_file) or {}
+
+
+class GetOrComputeTest(unittest.TestCase):
+    """get_or_compute Unit Test"""
+    _config = None
+
+    _cache = None
+
+    def setUp(self):
+        """Create Redis"""
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        self._cache = cache.Cache(self._config['redis'])
+        self.calls = []
+
+    def tearDown(self):
+        """Flush Database"""
+        with self._cache as redis_connection:
+            redis_connection.flushdb()
+
+    def loader(self, value, delay=0):
+        """Return a loader recording its calls"""
+        def load():
+            self.calls.append(value)
+            time.sleep(delay)
+            return value
+        return load
+
+    def test_key(self):
+        """A miss computes and stores the value, a hit does not"""
+        result = compute.get_or_compute(self._cache, 'answer', None,
+                                        self.loader(42), ttl=60)
+        self.assertEqual(b'42', result)
+        result = compute.get_or_compute(self._cache, 'answer', None,
+                                        self.loader(43), ttl=60)
+        self.assertEqual(b'42', result)
+        self.assertEqual([42], self.calls)
+        self.assertEqual(b'42', cache.get_value(self._cache, 'answer'))
+
+    def test_template(self):
+        """Objects are computed as a whole and returned as retrieved"""
+        template = cache.Template({'username': 'user:%(id)s:username',
+                                   'email': 'user:%(id)s:email'}, ttl=60)
+        data = {'username': 'Bob', 'email': 'bob@example.com'}
+
+        result = compute.get_or_compute(self._cache, template, {'id': 1},
+                                        self.loader(data))
+        self.assertEqual({'username': b'Bob', 'email': b'bob@example.com'},
+                         result)
+        self.assertEqual(result, compute.get_or_compute(
+            self._cache, template, {'id': 1}, self.loader(data)))
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual(result, cache.retrieve_object(self._cache, template,
+                                                       {'id': 1}))
+        with self._cache as redis_connection:
+            self.assertTrue(0 < redis_connection.ttl('user:1:email') <= 60)
+
+    def test_negative_caching(self):
+        """Objects the loader does not find are not looked up again"""
+        template = cache.Template({'name': 'user:%(id)s:name'},
+                                  negative_ttl=10)
+        for _ in range(2):
+            self.assertIsNone(compute.get_or_compute(
+                self._cache, template, {'id': 1}, self.loader(None)))
+        self.assertEqual([None], self.calls)
+
+        cache.set_object(self._cache, template, {'id': 1}, {'name': 'Bob'})
+        self.assertEqual({'name': b'Bob'}, compute.get_or_compute(
+            self._cache, template, {'id': 1}, self.loader(None)))
+
+    def test_codec(self):
+        """Computed values come back the same way as cached ones"""
+        self._cache = cache.Cache(self._config['redis'],
+                                  codec=codecs.Codec())
+        template = cache.Template.hash('user:%(id)s', ['username', 'tags'],
+                                       ttl=60)
+        data = {'username': 'Bob', 'tags': ['a', 'b']}
+        for _ in range(2):
+            self.assertEqual(data, compute.get_or_compute(
+                self._cache, template, {'id': 1}, self.loader(data)))
+        self.assertEqual(1, len(self.calls))
+
+    def test_single_flight(self):
+        """A burst of concurrent misses runs the loader once"""
+        results = []
+
+        def request():
+            results.append(compute.get_or_compute(
+                self._cache, 'hot', None, self.loader('value', 0.2), ttl=60))
+
+        threads = [threading.Thread(target=request) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['value'], self.calls)
+        self.assertEqual([b'value'] * 20, results)
+
+    def test_single_flight_error(self):
+        """Loader errors reach every caller sharing the call"""
+        errors = []
+
+        def fail():
+            time.sleep(0.2)
+            raise RuntimeError('backend down')
+
+        def request():
+            try:
+                compute.get_or_compute(self._cache, 'hot', None, fail)
+            except RuntimeError as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(5, len(errors))
+        self.assertIsNone(cache.get_value(self._cache, 'hot'))
+
+    def test_early_expiration(self):
+        """Entries near expiry are recomputed before they expire"""
+        compute.get_or_compute(self._cache, 'slow', None,
+                               self.loader('old'), ttl=60)
+        # Pretend the logical expiry has passed while the keys live on.
+        with self._cache as redis_connection:
+            redis_connection.set('slow:xfetch', '1 %f' % (time.time() - 1))
+        result = compute.get_or_compute(self._cache, 'slow', None,
+                                        self.loader('new'), ttl=60)
+        self.assertEqual(b'new', result)
+        self.assertEqual(['old', 'new'], self.calls)
+
+    def test_lock_serves_stale(self):
+        """A process finding the lock taken serves the value it has"""
+        compute.get_or_compute(self._cache, 'locked', None,
+                               self.loader('old'), ttl=60, lock=True)
+        with self._cache as redis_connection:
+            redis_connection.set('locked:xfetch', '1 %f' % (time.time() - 1))
+            redis_connection.set('locked:lock', 'other process', ex=10)
+        result = compute.get_or_compute(self._cache, 'locked', None,
+                                        self.loader('new'), ttl=60,
+                                        lock=True)
+        self.assertEqual(b'old', result)
+        self.assertEqual(['old'], self.calls)
+
+    def test_lock_waits_for_holder(self):
+        """A process finding the lock taken waits for the holder's value"""
+        with self._cache as redis_connection:
+            redis_connection.set('locked:lock', 'other process', ex=10)
+
+        def holder():
+            time.sleep(0.2)
+            cache.set_object(self._cache, compute.lookup('locked', None,
+                                                         60).template,
+                             {}, {'value': 'theirs', '__xfetch__': '0 0'})
+
+        thread = threading.Thread(target=holder)
+        thread.start()
+        result = compute.get_or_compute(self._cache, 'locked', None,
+                                        self.loader('mine'), ttl=60,
+                                        lock=True)
+        thread.join()
+        self.assertEqual(b'theirs', result)
+        self.assertEqual([], self.calls)
+
+
+@unittest.skipIf(asynchronous.aioredis is None, 'redis.asyncio unavailable')
+class AsyncGetOrComputeTest(testing.AsyncTestCase):
+    """asynchronous.get_or_compute Unit Test"""
+    _config = None
+
+    _cache = None
+
+    def setUp(self):
+        """Create Redis"""
+        super(AsyncGetOrComputeTest, self).setUp()
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        self._cache = asynchronous.AsyncCache(self._config['redis'])
+
+    def tearDown(self):
+        """Flush Database"""
+        with self._cache as redis_connection:
+            self.io_loop.run_sync(redis_connection.flushdb)
+        super(AsyncGetOrComputeTest, self).tearDown()
+
+    @testing.gen_test
+    def test_single_flight(self):
+        """A burst of concurrent misses runs the loader once"""
+        calls = []
+
+        @gen.coroutine
+        def load():
+            calls.append(1)
+            yield gen.sleep(0.1)
+            raise gen.Return('value')
+
+        results = yield [
+            asynchronous.get_or_compute(self._cache, 'hot', None, load,
+                                        ttl=60, lock=True)
+            for _ in range(20)]
+        self.assertEqual([1], calls)
+        self.assertEqual([b'value'] * 20, results)
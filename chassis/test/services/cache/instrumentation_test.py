@@ -0,0 +1,77 @@
+"""Unit Test for chassis.services.cache.instrumentation module"""
+# pylint: disable=invalid-name
+import unittest
+
+import redis
+import yaml
+
+from chassis.services import cache
+from chassis.services import metrics
+
+
+def get_config_yaml():
+    """Load Test Config"""
+    config_file = open('./test/test_config.yml', 'r')
+    return yaml.load(config_file) or {}
+
+
+class InstrumentedCacheTest(unittest.TestCase):
+    """Cache with metrics Unit Test"""
+    _config = None
+
+    _cache = None
+
+    def setUp(self):
+        """Create Redis"""
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        self._metrics = metrics.Metrics()
+        self._cache = cache.Cache(self._config['redis'],
+                                  metrics=self._metrics)
+
+    def tearDown(self):
+        """Flush Database"""
+        with cache.Cache(self._config['redis']) as redis_connection:
+            redis_connection.flushdb()
+
+    def test_commands(self):
+        """Commands are timed by name and the pool is reported"""
+        cache.set_value(self._cache, 'foo', 'bar')
+        cache.get_value(self._cache, 'foo')
+        cache.get_value(self._cache, 'foo')
+
+        snapshot = self._metrics.snapshot()
+        histograms = snapshot['histograms']
+        self.assertEqual(1, histograms['command_seconds{command="SET"}']
+                         ['count'])
+        self.assertEqual(2, histograms['command_seconds{command="GET"}']
+                         ['count'])
+        self.assertTrue(histograms['pool_wait_seconds']['count'] >= 3)
+        self.assertEqual(3, histograms['checkout_seconds']['count'])
+        self.assertEqual(0, snapshot['gauges']['pool_in_use'])
+        self.assertTrue(snapshot['gauges']['pool_idle'] >= 1)
+
+    def test_pipelines(self):
+        """Pipelines are timed and their sizes recorded"""
+        template = {'username': 'user:%(id)s:username',
+                    'email': 'user:%(id)s:email'}
+        cache.set_object(self._cache, template, {'id': 1},
+                         {'username': 'Bob', 'email': 'bob@example.com'})
+        cache.retrieve_object(self._cache, template, {'id': 1})
+
+        histograms = self._metrics.snapshot()['histograms']
+        self.assertEqual(2, histograms['pipeline_seconds']['count'])
+        self.assertEqual(2, histograms['pipeline_size']['count'])
+        self.assertEqual(4, histograms['pipeline_size']['sum'])
+
+    def test_errors(self):
+        """Failed commands are counted"""
+        cache.set_value(self._cache, 'foo', 'bar')
+        with self.assertRaises(redis.ResponseError):
+            with self._cache as redis_connection:
+                redis_connection.incr('foo')
+
+        counters = self._metrics.snapshot()['counters']
+        self.assertEqual(1, counters['command_errors{command="INCRBY"}'])
+        self.assertEqual(1, counters['errors{error="ResponseError"}'])
@@ -0,0 +1,96 @@
+"""Unit Test for chassis.services.cache.invalidation module"""
+# pylint: disable=invalid-name
+import yaml
+from tornado import gen, testing
+
+from chassis.services import cache
+from chassis.services.cache import invalidation
+from chassis.services.cache import local
+
+
+def get_config_yaml():
+    """Load Test Config"""
+    config_file = open('./test/test_config.yml', 'r')
+    return yaml.load(config_file) or {}
+
+
+class InvalidatorTest(testing.AsyncTestCase):
+    """Invalidator Unit Test
+
+    Two Cache instances with their own local tiers stand in for two worker
+    processes sharing one Redis.
+    """
+    _config = None
+
+    def setUp(self):
+        """Create two 'processes' sharing Redis"""
+        super(InvalidatorTest, self).setUp()
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        self.caches = []
+        self.invalidators = []
+        for _ in range(2):
+            process_cache = cache.Cache(self._config['redis'],
+                                        local_cache=local.LocalCache())
+            invalidator = invalidation.Invalidator(
+                process_cache, delay=0.01, poll_interval=0.01,
+                io_loop=self.io_loop)
+            invalidator.start()
+            self.caches.append(process_cache)
+            self.invalidators.append(invalidator)
+
+    def tearDown(self):
+        """Unsubscribe and flush Database"""
+        for invalidator in self.invalidators:
+            invalidator.stop()
+        with self.caches[0] as redis_connection:
+            redis_connection.flushdb()
+        super(InvalidatorTest, self).tearDown()
+
+    @testing.gen_test
+    def test_writes_evict_other_processes(self):
+        """A write in one process evicts the copy held by the other"""
+        writer, reader = self.caches
+        cache.set_value(writer, 'user:12345:username', 'Bob')
+        self.assertEqual(b'Bob',
+                         cache.get_value(reader, 'user:12345:username'))
+
+        cache.set_value(writer, 'user:12345:username', 'Harry')
+        self.assertEqual(b'Bob', reader.local_cache.get('user:12345:username'))
+
+        yield gen.sleep(0.1)
+        self.assertEqual(None, reader.local_cache.get('user:12345:username'))
+        self.assertEqual(b'Harry',
+                         cache.get_value(reader, 'user:12345:username'))
+
+        # The writer ignores its own messages and keeps its written copy.
+        self.assertEqual(b'Harry',
+                         writer.local_cache.get('user:12345:username'))
+
+        cache.delete_object(writer, {'username': 'user:%(id)s:username'},
+                            {'id': 12345})
+        yield gen.sleep(0.1)
+        self.assertEqual(None, reader.local_cache.get('user:12345:username'))
+
+    @testing.gen_test
+    def test_invalidations_are_coalesced(self):
+        """A burst of writes becomes a single message"""
+        writer, reader = self.caches
+        for name in ('Bob', 'Harry', 'Sally'):
+            cache.set_value(writer, 'user:12345:username', name)
+            cache.set_value(writer, 'user:67890:username', name)
+        cache.delete_value(writer, 'user:12345:username')
+        cache.get_value(reader, 'user:67890:username')
+
+        yield gen.sleep(0.1)
+        self.assertEqual(1, self.invalidators[0].published)
+        self.assertEqual(1, self.invalidators[1].received)
+        self.assertEqual(None, reader.local_cache.get('user:67890:username'))
+
+    def test_messages_are_split_into_batches(self):
+        """No message carries more than max_batch keys"""
+        self.invalidators[0].max_batch = 2
+        self.invalidators[0].publish(['a', 'b', 'c', 'd', 'e'])
+        self.invalidators[0].flush()
+        self.assertEqual(3, self.invalidators[0].published)
@@ -0,0 +1,71 @@
+"""Unit Test for chassis.services.cache.local module"""
+# pylint: disable=invalid-name
+import unittest
+
+from chassis.services.cache import local
+from chassis.test.clock import FakeClock
+
+
+class LocalCacheTest(unittest.TestCase):
+    """LocalCache Unit Test"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_get_and_set(self):
+        """Values are returned until deleted"""
+        local_cache = local.LocalCache(clock=self.clock)
+        self.assertEqual(None, local_cache.get('foo'))
+
+        local_cache.set('foo', b'bar')
+        self.assertEqual(b'bar', local_cache.get('foo'))
+
+        local_cache.delete('foo', 'missing')
+        self.assertEqual(None, local_cache.get('foo'))
+        self.assertEqual({'entries': 0, 'bytes': 0, 'hits': 1, 'misses': 2,
+                          'evictions': 0, 'expirations': 0},
+                         local_cache.stats())
+
+    def test_ttl(self):
+        """Entries expire after their time to live"""
+        local_cache = local.LocalCache(ttl=10, clock=self.clock)
+        local_cache.set('foo', b'bar')
+        local_cache.set('spam', b'eggs', ttl=60)
+
+        self.clock.now += 10
+        self.assertEqual(None, local_cache.get('foo'))
+        self.assertEqual(b'eggs', local_cache.get('spam'))
+
+        self.clock.now += 50
+        self.assertEqual(None, local_cache.get('spam'))
+        self.assertEqual(2, local_cache.expirations)
+        self.assertEqual(0, len(local_cache))
+
+    def test_lru_eviction_by_entries(self):
+        """The least recently used entry is evicted first"""
+        local_cache = local.LocalCache(max_entries=2, clock=self.clock)
+        local_cache.set('a', b'1')
+        local_cache.set('b', b'2')
+        local_cache.get('a')
+        local_cache.set('c', b'3')
+
+        self.assertEqual(b'1', local_cache.get('a'))
+        self.assertEqual(None, local_cache.get('b'))
+        self.assertEqual(b'3', local_cache.get('c'))
+        self.assertEqual(1, local_cache.evictions)
+
+    def test_lru_eviction_by_bytes(self):
+        """Entries are evicted to keep the total size within max_bytes"""
+        local_cache = local.LocalCache(max_entries=None, max_bytes=10,
+                                       clock=self.clock)
+        local_cache.set('a', b'12345')
+        local_cache.set('b', b'12345')
+        local_cache.set('c', b'123')
+
+        self.assertEqual(None, local_cache.get('a'))
+        self.assertEqual(8, local_cache.stats()['bytes'])
+
+        # Values larger than the whole cache are never stored
+        local_cache.set('d', b'12345678901')
+        self.assertEqual(None, local_cache.get('d'))
+        self.assertEqual(b'123', local_cache.get('c'))
@@ -0,0 +1,139 @@
+"""Unit Test for chassis.services.cache.replication module"""
+# pylint: disable=invalid-name, protected-access
+import unittest
+
+import redis
+import yaml
+
+from chassis.services import cache
+from chassis.services import metrics
+from chassis.services.cache import replication
+from chassis.services.cache import sharding
+from chassis.test.clock import FakeClock
+
+
+def get_config_yaml():
+    """Load Test Config"""
+    config_file = open('./test/test_config.yml', 'r')
+    return yaml.load(config_file) or {}
+
+
+class ReplicaRedis(redis.StrictRedis):
+    """Client reporting a replica last hearing from its primary `lag`
+    seconds ago."""
+
+    lag = 0
+
+    def info(self, section=None, *args, **kwargs):
+        return {'role': 'slave', 'master_link_status': 'up',
+                'master_last_io_seconds_ago': ReplicaRedis.lag}
+
+
+class ReplicationTest(unittest.TestCase):
+    """Cache with read replicas Unit Test
+
+    The replicas are other databases of the test server, so where a read
+    went shows in the value it returns.
+    """
+    _config = None
+
+    def setUp(self):
+        """Create a primary on database 0 and replicas on 1 and 2"""
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        settings = self._config['redis']
+        self._replicas = [cache.Cache(dict(settings, db=db)) for db in (1, 2)]
+        self._cache = cache.Cache(settings, read_replicas=self._replicas)
+        for (db, server) in enumerate([self._cache] + self._replicas):
+            with server as redis_connection:
+                redis_connection.set('foo', 'db%d' % db)
+
+    def tearDown(self):
+        """Flush Databases"""
+        for server in [self._cache] + self._replicas:
+            with server as redis_connection:
+                redis_connection.flushdb()
+
+    def test_round_robin(self):
+        """Reads alternate between replicas, writes go to the primary"""
+        self.assertEqual(
+            set([b'db1', b'db2']),
+            set(cache.get_value(self._cache, 'foo') for _ in range(2)))
+        self.assertEqual([b'db0'], cache.multi_get(self._cache, ['foo'],
+                                                   consistent=True))
+
+        cache.set_value(self._cache, 'bar', 'written')
+        self.assertIsNone(cache.get_value(self._cache, 'bar'))
+        self.assertEqual(b'written', cache.get_value(self._cache, 'bar',
+                                                     consistent=True))
+
+    def test_objects(self):
+        """Object reads go to replicas unless they refresh TTLs"""
+        template = {'foo': 'foo'}
+        self.assertIn(cache.retrieve_object(self._cache, template, {}),
+                      [{'foo': b'db1'}, {'foo': b'db2'}])
+        self.assertIn(cache.retrieve_objects(self._cache, template, [{}]),
+                      [[{'foo': b'db1'}], [{'foo': b'db2'}]])
+        self.assertEqual({'foo': b'db0'}, cache.retrieve_object(
+            self._cache, template, {}, ttl=10, refresh_ttl=True))
+
+    def test_least_latency(self):
+        """The replica with the lowest latency gets the reads"""
+        self._cache.read_replicas.strategy = replication.LEAST_LATENCY
+        (first, second) = self._cache.read_replicas
+        first.latency = 0.002
+        second.latency = 0.001
+        self.assertEqual(b'db2', cache.get_value(self._cache, 'foo'))
+
+    def test_failures_fall_back(self):
+        """Failing replicas are skipped until their retry time"""
+        clock = FakeClock()
+        down = cache.Cache(dict(self._config['redis'], port=1))
+        self._cache.read_replicas = replication.Replicas(
+            self._cache, [down], retry=5, clock=clock)
+        self._cache.metrics = metrics.Metrics()
+
+        self.assertEqual(b'db0', cache.get_value(self._cache, 'foo'))
+        self.assertIsNone(self._cache.read_replicas.choose())
+        self.assertEqual(
+            1, self._cache.metrics.snapshot()['counters']['replica_fallbacks'])
+
+        clock.now += 5
+        self.assertIs(down, self._cache.read_replicas.choose().cache)
+
+    def test_lagging_replicas(self):
+        """Replicas too far behind get no reads until they catch up"""
+        clock = FakeClock()
+        replica = self._replicas[0]
+        replica._client_class = ReplicaRedis
+        self._cache.read_replicas = replication.Replicas(
+            self._cache, [replica], max_lag=5, check=1, clock=clock)
+
+        ReplicaRedis.lag = 6
+        self.assertEqual(b'db0', cache.get_value(self._cache, 'foo'))
+        ReplicaRedis.lag = 0
+        self.assertEqual(b'db0', cache.get_value(self._cache, 'foo'))
+        clock.now += 1
+        self.assertEqual(b'db1', cache.get_value(self._cache, 'foo'))
+
+    def test_replica_metrics(self):
+        """Replicas given as settings share the metrics, by replica"""
+        settings = self._config['redis']
+        replicated = cache.Cache(settings, metrics=metrics.Metrics(),
+                                 read_replicas=[dict(settings, db=1)])
+        (replica, ) = replicated.read_replicas
+        self.assertIs(replicated.metrics, replica.cache.metrics)
+        self.assertEqual(b'db1', cache.get_value(replicated, 'foo'))
+        gauges = replicated.metrics.snapshot()['gauges']
+        name = sharding.shard_name(dict(settings, db=1))
+        self.assertEqual(0, gauges['pool_in_use{replica="%s"}' % name])
+        self.assertEqual(1, gauges['pool_idle{replica="%s"}' % name])
+
+    def test_sharded_replicas(self):
+        """Replicas are configured per shard"""
+        with self.assertRaises(ValueError):
+            cache.Cache([self._config['redis']],
+                        read_replicas=self._replicas)
+        sharded = cache.Cache([self._cache])
+        self.assertIn(cache.multi_get(sharded, ['foo']), [[b'db1'], [b'db2']])
@@ -0,0 +1,126 @@
+"""Unit Test for bounded pools and circuit breaking in Cache"""
+# pylint: disable=invalid-name
+import time
+import unittest
+
+import redis
+import yaml
+
+from chassis.services import cache
+from chassis.services import circuit_breaker
+from chassis.test.clock import FakeClock
+
+
+def get_config_yaml():
+    """Load Test Config"""
+    config_file = open('./test/test_config.yml', 'r')
+    return yaml.load(config_file) or {}
+
+
+class FaultyConnection(redis.Connection):
+    """Connection failing to connect while `down` is set."""
+
+    down = False
+
+    def connect(self):
+        if FaultyConnection.down:
+            raise redis.ConnectionError('Injected fault')
+        return super(FaultyConnection, self).connect()
+
+
+class CircuitBreakerCacheTest(unittest.TestCase):
+    """Cache with a circuit breaker Unit Test"""
+    _config = None
+
+    def setUp(self):
+        """Create Redis"""
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        self.clock = FakeClock()
+        self.breaker = circuit_breaker.CircuitBreaker(
+            failure_threshold=2, reset_timeout=5, clock=self.clock)
+        settings = dict(self._config['redis'],
+                        connection_class=FaultyConnection)
+        self._cache = cache.Cache(settings, circuit_breaker=self.breaker)
+
+    def tearDown(self):
+        """Flush Database"""
+        FaultyConnection.down = False
+        with cache.Cache(self._config['redis']) as redis_connection:
+            redis_connection.flushdb()
+
+    def fail(self):
+        """Make a call that fails to connect"""
+        with self.assertRaises(redis.ConnectionError):
+            cache.get_value(self._cache, 'foo')
+
+    def test_fails_fast_and_recovers(self):
+        """The circuit opens on failures and closes after a good probe"""
+        cache.set_value(self._cache, 'foo', 'bar')
+        self._cache._pool.disconnect()  # pylint: disable=protected-access
+        FaultyConnection.down = True
+        self.fail()
+        self.fail()
+        self.assertEqual(circuit_breaker.OPEN, self.breaker.state)
+        with self.assertRaises(cache.CacheConnectionError):
+            cache.get_value(self._cache, 'foo')
+
+        FaultyConnection.down = False
+        self.clock.now += 5
+        self.assertEqual(b'bar', cache.get_value(self._cache, 'foo'))
+        self.assertEqual(circuit_breaker.CLOSED, self.breaker.state)
+
+    def test_command_errors_do_not_count(self):
+        """Errors from a reachable Redis leave the circuit closed"""
+        self.breaker.failure_threshold = 1
+        cache.set_value(self._cache, 'foo', 'bar')
+        with self.assertRaises(redis.ResponseError):
+            with self._cache as redis_connection:
+                redis_connection.incr('foo')
+        self.assertEqual(circuit_breaker.CLOSED, self.breaker.state)
+
+    def test_fallback(self):
+        """An open circuit hands out the fallback connection"""
+        fallback = cache.Cache(self._config['redis'])._get_connection()
+        self._cache = cache.Cache(
+            dict(self._config['redis'], connection_class=FaultyConnection),
+            circuit_breaker=self.breaker, fallback=fallback)
+        fallback.set('foo', 'from fallback')
+        FaultyConnection.down = True
+        self.fail()
+        self.fail()
+        self.assertEqual(b'from fallback',
+                         cache.get_value(self._cache, 'foo'))
+
+
+class BoundedPoolTest(unittest.TestCase):
+    """Cache with a bounded pool Unit Test"""
+    _config = None
+
+    def setUp(self):
+        """Create Redis"""
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        self._cache = cache.Cache(dict(self._config['redis'],
+                                       max_connections=1),
+                                  pool_timeout=0.1)
+
+    def tearDown(self):
+        """Flush Database"""
+        with self._cache as redis_connection:
+            redis_connection.flushdb()
+
+    def test_checkout_timeout(self):
+        """Commands give up when no connection frees up in time"""
+        cache.set_value(self._cache, 'foo', 'bar')
+        pool = self._cache._pool  # pylint: disable=protected-access
+        held = pool.get_connection('GET')
+        start = time.time()
+        with self.assertRaises(redis.ConnectionError):
+            cache.get_value(self._cache, 'foo')
+        self.assertTrue(time.time() - start < 1)
+
+        pool.release(held)
+        self.assertEqual(b'bar', cache.get_value(self._cache, 'foo'))
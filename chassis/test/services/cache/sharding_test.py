@@ -0,0 +1,254 @@
+"""Unit Test for chassis.services.cache.sharding module"""
+# pylint: disable=invalid-name
+import unittest
+
+import mock
+import redis
+import yaml
+
+from chassis.services import cache
+from chassis.services import circuit_breaker
+from chassis.services import metrics
+from chassis.services.cache import compute
+from chassis.services.cache import local
+from chassis.services.cache import sharding
+
+
+def get_config_yaml():
+    """Load Test Config"""
+    config_file = open('./test/test_config.yml', 'r')
+    return yaml.load(config_file) or {}
+
+
+class HashRingTest(unittest.TestCase):
+    """HashRing Unit Test"""
+
+    def test_hash_tag(self):
+        """Only the first non-empty {...} part of a key is hashed"""
+        self.assertEqual('user:1', sharding.hash_tag('{user:1}:email'))
+        self.assertEqual('a', sharding.hash_tag('x{a}{b}'))
+        self.assertEqual('x{}:y', sharding.hash_tag('x{}:y'))
+        self.assertEqual('x{y', sharding.hash_tag('x{y'))
+
+    def test_balanced_and_consistent(self):
+        """Keys spread evenly, and removing a node only moves its keys"""
+        nodes = ['cache%d:6379' % number for number in range(4)]
+        ring = sharding.HashRing(nodes)
+        keys = ['user:%d' % number for number in range(4000)]
+        placement = dict((key, ring.get_node(key)) for key in keys)
+        for node in nodes:
+            share = list(placement.values()).count(node)
+            self.assertTrue(700 < share < 1300, (node, share))
+
+        smaller = sharding.HashRing(nodes[:3])
+        for key in keys:
+            if placement[key] != nodes[3]:
+                self.assertEqual(placement[key], smaller.get_node(key))
+
+    def test_no_nodes(self):
+        """A ring needs nodes"""
+        self.assertRaises(ValueError, sharding.HashRing, [])
+
+
+class ShardedCacheTest(unittest.TestCase):
+    """Cache over two shards Unit Test"""
+    _config = None
+
+    def setUp(self):
+        """Create Redis shards on two databases"""
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        settings = self._config['redis']
+        self._shards = [cache.Cache(dict(settings, db=db)) for db in (0, 1)]
+        self._cache = cache.Cache(self._shards)
+
+    def tearDown(self):
+        """Flush Databases"""
+        for shard in self._shards:
+            with shard as redis_connection:
+                redis_connection.flushdb()
+
+    def keys_per_shard(self):
+        """Return the keys stored by each shard"""
+        keys = []
+        for shard in self._shards:
+            with shard as redis_connection:
+                keys.append(sorted(redis_connection.keys('*')))
+        return keys
+
+    def test_values(self):
+        """Values are routed by key and multi_get merges them in order"""
+        keys = ['value:%d' % number for number in range(20)]
+        for key in keys:
+            cache.set_value(self._cache, key, key)
+        self.assertTrue(all(self.keys_per_shard()))
+        self.assertEqual(b'value:3', cache.get_value(self._cache, 'value:3'))
+        self.assertEqual([key.encode('utf-8') for key in keys] + [None],
+                         cache.multi_get(self._cache, keys + ['missing']))
+
+        self.assertEqual(20, cache.delete_value(self._cache, *keys))
+        self.assertEqual([[], []], self.keys_per_shard())
+
+    def test_objects_spread_over_shards(self):
+        """Fields of untagged templates are split and merged"""
+        template = dict(('field%d' % number, 'user:%%(id)s:field%d' % number)
+                        for number in range(10))
+        data = dict((key, key) for key in template)
+
+        self.assertTrue(cache.set_object(self._cache, template, {'id': 1},
+                                         data))
+        self.assertTrue(all(self.keys_per_shard()))
+        self.assertEqual(
+            dict((key, key.encode('utf-8')) for key in template),
+            cache.retrieve_object(self._cache, template, {'id': 1}))
+
+        cache.delete_value(self._cache, 'user:1:field3')
+        self.assertIsNone(cache.retrieve_object(self._cache, template,
+                                                {'id': 1}))
+        cache.delete_object(self._cache, template, {'id': 1})
+        self.assertEqual([[], []], self.keys_per_shard())
+
+    def test_hash_tags_keep_objects_together(self):
+        """Fields sharing a hash tag live on one shard"""
+        template = dict(('field%d' % number, '{user:%%(id)s}:field%d' % number)
+                        for number in range(10))
+        data = dict((key, key) for key in template)
+        for user_id in range(10):
+            cache.set_object(self._cache, template, {'id': user_id}, data)
+        for user_id in range(10):
+            shard = self._cache.shard_for('{user:%d}' % user_id)
+            self.assertEqual(
+                dict((key, key.encode('utf-8')) for key in template),
+                cache.retrieve_object(shard, template, {'id': user_id}))
+
+    def test_batches(self):
+        """retrieve_objects and set_objects mix whole and split objects"""
+        tagged = cache.Template.hash('user:%(id)s', ['name'])
+        spread = {'name': 'user:%(id)s:name', 'email': 'user:%(id)s:email'}
+        list_of_indexes = [{'id': user_id} for user_id in range(10)]
+        for template in (tagged, spread):
+            list_of_data = [dict((key, '%s%d' % (key, user_id))
+                                 for key in template)
+                            for user_id in range(10)]
+            self.assertTrue(cache.set_objects(
+                self._cache, template, list_of_indexes, list_of_data))
+            self.assertEqual(
+                [dict((key, value.encode('utf-8'))
+                      for (key, value) in data.items())
+                 for data in list_of_data] + [None],
+                cache.retrieve_objects(self._cache, template,
+                                       list_of_indexes + [{'id': 99}]))
+
+    def test_scan(self):
+        """Every shard is scanned"""
+        template = {'name': 'user:%(id)s:name', 'email': 'user:%(id)s:email'}
+        list_of_indexes = [{'id': str(user_id)} for user_id in range(20)]
+        cache.set_objects(self._cache, template, list_of_indexes,
+                          [{'name': 'n', 'email': 'e'}
+                           for _ in list_of_indexes])
+        self.assertEqual(
+            sorted(indexes['id'] for indexes in list_of_indexes),
+            sorted(indexes['id'] for (indexes, _)
+                   in cache.scan_objects(self._cache, template)))
+        self.assertEqual(20, cache.delete_matching(self._cache, template))
+        self.assertEqual([[], []], self.keys_per_shard())
+
+    def test_get_or_compute(self):
+        """Computed values are returned as the owning shard reads them"""
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return 'computed'
+
+        for _ in range(2):
+            self.assertEqual(b'computed', compute.get_or_compute(
+                self._cache, 'value:1', None, loader))
+        self.assertEqual(1, len(loads))
+
+    def test_with_needs_a_shard(self):
+        """A sharded Cache has no single connection"""
+        with self.assertRaises(TypeError):
+            with self._cache:
+                pass
+        self.assertIs(self._shards[0], self._shards[0].shard_for('key'))
+
+
+class ShardFailureTest(unittest.TestCase):
+    """Cache over a healthy and a dead shard Unit Test"""
+    _config = None
+
+    def setUp(self):
+        """Create a Redis shard and one nothing listens to"""
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        settings = self._config['redis']
+        self._metrics = metrics.Metrics()
+        self._cache = cache.Cache(
+            [settings, dict(settings, port=1)], metrics=self._metrics,
+            circuit_breaker=circuit_breaker.CircuitBreaker(
+                failure_threshold=2))
+        self._keys = {}
+        for number in range(20):
+            key = 'value:%d' % number
+            port = self._cache.shard_for(key).settings['port']
+            self._keys.setdefault(port, key)
+
+    def tearDown(self):
+        """Flush Database"""
+        with self._cache.shard_for(self._keys[6379]) as redis_connection:
+            redis_connection.flushdb()
+
+    def test_breaker_per_shard(self):
+        """A dead shard opens its own circuit only"""
+        dead = self._keys[1]
+        for _ in range(2):
+            self.assertRaises(redis.ConnectionError, cache.get_value,
+                              self._cache, dead)
+        self.assertRaises(cache.CacheConnectionError, cache.get_value,
+                          self._cache, dead)
+
+        healthy = self._keys[6379]
+        cache.set_value(self._cache, healthy, 'up')
+        self.assertEqual(b'up', cache.get_value(self._cache, healthy))
+
+    def test_pool_gauges_per_shard(self):
+        """Every shard reports its own pool gauges"""
+        healthy = self._cache.shard_for(self._keys[6379])
+        # pylint: disable=protected-access
+        connection = healthy._pool.get_connection()
+        gauges = self._metrics.snapshot()['gauges']
+        healthy._pool.release(connection)
+        name = sharding.shard_name(healthy.settings)
+        self.assertEqual(1, gauges['pool_in_use{shard="%s"}' % name])
+        self.assertEqual(0, gauges['pool_in_use{shard="%s"}'
+                                   % sharding.shard_name(
+                                       dict(healthy.settings, port=1))])
+
+
+@unittest.skipIf(cache.redis_cluster is None, 'redis.cluster unavailable')
+class ClusterCacheTest(unittest.TestCase):
+    """Cache in cluster mode Unit Test, over a single Redis standing in for
+    the cluster client"""
+
+    def setUp(self):
+        settings = get_config_yaml()['redis']
+        self._redis = redis.StrictRedis(**settings)
+        patcher = mock.patch.object(cache.redis_cluster, 'RedisCluster',
+                                    lambda **_: self._redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._redis.flushdb()
+
+    def test_local_cache(self):
+        """Writes go through to the local tier"""
+        local_cache = local.LocalCache()
+        cluster = cache.Cache({'host': 'node'}, cluster=True,
+                              local_cache=local_cache)
+        self.assertTrue(cache.set_value(cluster, 'value:1', 'one'))
+        self.assertEqual(b'one', local_cache.get('value:1'))
+        self.assertEqual(b'one', cache.get_value(cluster, 'value:1'))
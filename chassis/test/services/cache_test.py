@@ -1,9 +1,12 @@
 """Unit Test for cache.services.cache module"""
-# pylint: disable=invalid-name
+# pylint: disable=invalid-name, protected-access
+import time
 import unittest
 import yaml
 
 from chassis.services import cache
+from chassis.services.cache import codecs
+from chassis.services.cache import local
 
 
 def get_config_yaml():
@@ -87,3 +90,474 @@ class CacheTest(unittest.TestCase):
 
         result = cache.get_value(self._cache, 'user:12345:username')
         self.assertEqual(None, result)
+
+    def test_set_and_retrieve_objects(self):
+        """Test set_objects and retrieve_objects match the single versions"""
+        template = {'username': 'user:%(id)s:username',
+                    'email': 'user:%(id)s:email'}
+        list_of_indexes = [{'id': user_id} for user_id in range(5)]
+        list_of_data = [{'username': 'user%s' % user_id,
+                         'email': 'user%s@example.com' % user_id}
+                        for user_id in range(5)]
+
+        cache.set_objects(self._cache, template, list_of_indexes,
+                          list_of_data, chunk_size=3)
+        cache.delete_value(self._cache, 'user:3:email')
+        cache.set_value(self._cache, 'user:5:username', 'user5')
+        list_of_indexes.append({'id': 5})
+        list_of_indexes.append({'id': 6})
+
+        for chunk_size in (None, 1, 4):
+            result = cache.retrieve_objects(self._cache, template,
+                                            list_of_indexes,
+                                            chunk_size=chunk_size)
+            self.assertEqual(
+                [cache.retrieve_object(self._cache, template, indexes)
+                 for indexes in list_of_indexes],
+                result)
+            self.assertEqual({'username': b'user1',
+                              'email': b'user1@example.com'}, result[1])
+            self.assertEqual([None, None, None], result[3:4] + result[5:])
+
+    def test_set_object_ttl(self):
+        """Per-call, per-template and per-field times to live"""
+        template = cache.Template({'username': 'user:%(id)s:username',
+                                   'session': 'user:%(id)s:session'},
+                                  ttl={'session': 60})
+        data = {'username': 'Bob', 'session': 'abc'}
+
+        cache.set_object(self._cache, template, {'id': 1}, data)
+        cache.set_object(self._cache, template, {'id': 2}, data, ttl=30)
+        cache.set_objects(self._cache, template, [{'id': 3}], [data])
+
+        with self._cache as redis_connection:
+            self.assertEqual(-1, redis_connection.ttl('user:1:username'))
+            self.assertTrue(0 < redis_connection.ttl('user:1:session') <= 60)
+            self.assertTrue(0 < redis_connection.ttl('user:2:username') <= 30)
+            self.assertTrue(0 < redis_connection.ttl('user:2:session') <= 30)
+            self.assertEqual(-1, redis_connection.ttl('user:3:username'))
+            self.assertTrue(0 < redis_connection.ttl('user:3:session') <= 60)
+
+        # Templates are still dictionaries
+        self.assertEqual(
+            {'username': b'Bob', 'session': b'abc'},
+            cache.retrieve_object(self._cache, template, {'id': 1}))
+
+    def test_write_modes(self):
+        """nx only creates keys and xx only replaces them"""
+        template = {'username': 'user:%(id)s:username',
+                    'email': 'user:%(id)s:email'}
+        indexes = {'id': 1}
+
+        self.assertFalse(cache.set_object(self._cache, template, indexes,
+                                          {'username': 'Bob'}, mode='xx'))
+        self.assertTrue(cache.set_object(self._cache, template, indexes,
+                                         {'username': 'Bob'}, mode='nx'))
+        self.assertFalse(cache.set_object(
+            self._cache, template, indexes,
+            {'username': 'Harry', 'email': 'harry@example.com'}, mode='nx'))
+        self.assertEqual(
+            {'username': b'Bob', 'email': b'harry@example.com'},
+            cache.retrieve_object(self._cache, template, indexes))
+
+        self.assertTrue(cache.set_value(self._cache, 'user:1:username',
+                                        'Sally', ttl=30, mode='xx'))
+        self.assertFalse(cache.set_value(self._cache, 'user:2:username',
+                                         'Sally', mode='xx'))
+        self.assertEqual(b'Sally',
+                         cache.get_value(self._cache, 'user:1:username'))
+        with self._cache as redis_connection:
+            self.assertTrue(0 < redis_connection.ttl('user:1:username') <= 30)
+
+        self.assertRaises(ValueError, cache.set_value, self._cache,
+                          'user:1:username', 'Bob', mode='xnx')
+
+    def test_retrieve_object_refresh_ttl(self):
+        """refresh_ttl resets the time to live of the keys read"""
+        template = cache.Template({'username': 'user:%(id)s:username'},
+                                  ttl=300)
+        cache.set_object(self._cache, template, {'id': 1},
+                         {'username': 'Bob'}, ttl=5)
+
+        cache.retrieve_object(self._cache, template, {'id': 1})
+        with self._cache as redis_connection:
+            self.assertTrue(redis_connection.ttl('user:1:username') <= 5)
+
+        self.assertEqual(
+            {'username': b'Bob'},
+            cache.retrieve_object(self._cache, template, {'id': 1},
+                                  refresh_ttl=True))
+        with self._cache as redis_connection:
+            self.assertTrue(redis_connection.ttl('user:1:username') > 5)
+
+    def test_hash_template(self):
+        """Hash templates store each object in a single Redis hash"""
+        template = cache.Template.hash('user:%(id)s', ['username', 'email'],
+                                       ttl=60)
+        indexes = {'id': 12345}
+
+        self.assertTrue(cache.set_object(
+            self._cache, template, indexes,
+            {'username': 'Bob', 'email': 'bob@example.com', 'extra': 1}))
+        with self._cache as redis_connection:
+            self.assertEqual([b'user:12345'], redis_connection.keys('*'))
+            self.assertEqual(
+                {b'username': b'Bob', b'email': b'bob@example.com'},
+                redis_connection.hgetall('user:12345'))
+            self.assertTrue(0 < redis_connection.ttl('user:12345') <= 60)
+
+        self.assertEqual(
+            {'username': b'Bob', 'email': b'bob@example.com'},
+            cache.retrieve_object(self._cache, template, indexes))
+
+        self.assertFalse(cache.set_object(
+            self._cache, template, indexes, {'username': 'Harry'},
+            mode='nx'))
+        self.assertRaises(ValueError, cache.set_object, self._cache,
+                          template, indexes, {'username': 'Harry'},
+                          mode='xx')
+        self.assertRaises(ValueError, cache.Template.hash, 'user:%(id)s',
+                          ['username'], ttl={'username': 60})
+
+        cache.set_objects(self._cache, template, [{'id': 1}, {'id': 2}],
+                          [{'username': 'John'},
+                           {'username': 'Sally', 'email': 'sal@example.com'}])
+        self.assertEqual(
+            [None,
+             {'username': b'Sally', 'email': b'sal@example.com'},
+             {'username': b'Bob', 'email': b'bob@example.com'}],
+            cache.retrieve_objects(self._cache, template,
+                                   [{'id': 1}, {'id': 2}, indexes]))
+
+        cache.delete_object(self._cache, template, indexes)
+        self.assertEqual(None,
+                         cache.retrieve_object(self._cache, template, indexes))
+
+    def test_migrate_objects(self):
+        """Objects are copied from string keys to a hash"""
+        template = {'username': 'user:%(id)s:username',
+                    'email': 'user:%(id)s:email'}
+        hash_template = cache.Template.hash('user:%(id)s', template.keys())
+        cache.set_objects(self._cache, template,
+                          [{'id': 1}, {'id': 2}],
+                          [{'username': 'Bob', 'email': 'bob@example.com'},
+                           {'username': 'John'}])
+
+        self.assertEqual(2, cache.migrate_objects(
+            self._cache, template, hash_template,
+            [{'id': 1}, {'id': 2}, {'id': 3}], chunk_size=2))
+
+        self.assertEqual(
+            [{'username': b'Bob', 'email': b'bob@example.com'}, None, None],
+            cache.retrieve_objects(self._cache, hash_template,
+                                   [{'id': 1}, {'id': 2}, {'id': 3}]))
+        self.assertEqual(
+            {'username': b'John'},
+            cache.retrieve_object(
+                self._cache, cache.Template.hash('user:%(id)s', ['username']),
+                {'id': 2}))
+        with self._cache as redis_connection:
+            self.assertEqual(sorted([b'user:1', b'user:2']),
+                             sorted(redis_connection.keys('*')))
+
+    def test_compiled_template(self):
+        """Compiled templates build the same keys as template dictionaries"""
+        template = {'username': 'user:%(id)s:username',
+                    'email': 'user:%(id)s:email'}
+        compiled = cache.CompiledTemplate(template, prefix='app:')
+        self.assertEqual(['app:user:1:username', 'app:user:1:email'],
+                         compiled.redis_keys({'id': 1}, ['username',
+                                                         'email']))
+        self.assertEqual(['app:user:a\x00b:email'],
+                         compiled.redis_keys({'id': 'a\x00b'}, ['email']))
+        hashed = cache.CompiledTemplate.compile(
+            cache.Template.hash('user:%(id)s', ['username'], ttl=60))
+        self.assertEqual(['user:1#username'], hashed.redis_keys({'id': 1}))
+        self.assertEqual(60, hashed.ttl)
+
+        cache.set_object(self._cache, compiled, {'id': 1},
+                         {'username': 'Bob', 'email': 'bob@example.com'})
+        cache.set_objects(self._cache, compiled, [{'id': 2}],
+                          [{'username': 'John'}])
+        self.assertEqual(
+            {'username': b'Bob', 'email': b'bob@example.com'},
+            cache.retrieve_object(self._cache, compiled, {'id': 1}))
+        self.assertEqual(
+            [{'username': b'Bob', 'email': b'bob@example.com'}, None],
+            cache.retrieve_objects(self._cache, compiled,
+                                   [{'id': 1}, {'id': 2}]))
+        self.assertEqual(b'John', cache.get_value(self._cache,
+                                                  'app:user:2:username'))
+        cache.delete_object(self._cache, compiled, {'id': 1})
+        self.assertIsNone(cache.retrieve_object(self._cache, compiled,
+                                                {'id': 1}))
+
+    def test_negative_caching(self):
+        """Objects marked absent are reported as ABSENT until set"""
+        for template in (
+                cache.Template({'name': 'user:%(id)s:name',
+                                'email': 'user:%(id)s:email'},
+                               negative_ttl=10),
+                cache.CompiledTemplate.compile(cache.Template.hash(
+                    'user:%(id)s', ['name', 'email'], negative_ttl=10))):
+            cache.set_object(self._cache, template, {'id': 1},
+                             {'name': 'Bob'})
+            cache.mark_absent(self._cache, template, {'id': 1})
+            self.assertIs(cache.ABSENT, cache.retrieve_object(
+                self._cache, template, {'id': 1}))
+            self.assertEqual((cache.ABSENT, []), cache.retrieve_object(
+                self._cache, template, {'id': 1}, partial=True))
+            self.assertIsNone(cache.retrieve_object(self._cache, template,
+                                                    {'id': 2}))
+
+            cache.set_objects(self._cache, template, [{'id': 1}],
+                              [{'name': 'Bob'}])
+            self.assertEqual(({'name': b'Bob'}, ['email']),
+                             cache.retrieve_object(self._cache, template,
+                                                   {'id': 1}, partial=True))
+            with self._cache as redis_connection:
+                self.assertTrue(redis_connection.ttl(
+                    cache._tombstone_key(template, {'id': 1})) < 0)
+        with self.assertRaises(ValueError):
+            cache.mark_absent(self._cache, {'name': 'user:%(id)s'}, {'id': 1})
+
+    def test_partial(self):
+        """Partial reads report the missing keys"""
+        template = {'name': 'user:%(id)s:name', 'email': 'user:%(id)s:email'}
+        (found, missing) = cache.retrieve_object(self._cache, template,
+                                                 {'id': 1}, partial=True)
+        self.assertEqual(({}, ['email', 'name']), (found, sorted(missing)))
+        cache.set_value(self._cache, 'user:1:email', 'bob@example.com')
+        self.assertEqual(({'email': b'bob@example.com'}, ['name']),
+                         cache.retrieve_object(self._cache, template,
+                                               {'id': 1}, partial=True))
+
+    def test_request_scope(self):
+        """Request scopes read each key once"""
+        cache.set_value(self._cache, 'foo', 'bar')
+        scope = self._cache.request_scope()
+        self.assertEqual([b'bar', None], scope.get_many(['foo', 'missing']))
+        cache.set_value(self._cache, 'foo', 'changed')
+        self.assertEqual(b'bar', scope.get('foo'))
+
+    def test_scan_objects(self):
+        """Objects of a template are found with SCAN"""
+        template = {'name': 'org:%(org)s:user:%(id)d:name',
+                    'email': 'org:%(org)s:user:%(id)d:email'}
+        list_of_indexes = [{'org': org, 'id': user_id}
+                           for org in ('a', 'b') for user_id in range(30)]
+        cache.set_objects(self._cache, template, list_of_indexes,
+                          [{'name': 'n%(id)d' % indexes,
+                            'email': 'e%(id)d' % indexes}
+                           for indexes in list_of_indexes])
+        cache.set_value(self._cache, 'org:a:user:99:name', 'incomplete')
+
+        found = dict(((indexes['org'], indexes['id']), obj) for
+                     (indexes, obj) in cache.scan_objects(
+                         self._cache, template, count=7))
+        self.assertEqual(60, len(found))
+        self.assertEqual({'name': b'n3', 'email': b'e3'}, found[('b', 3)])
+
+        found = list(cache.scan_objects(self._cache, template,
+                                        match={'org': 'a'}))
+        self.assertEqual(30, len(found))
+        self.assertTrue(all(indexes['org'] == 'a'
+                            for (indexes, _) in found))
+
+        hash_template = cache.Template.hash('user:%(id)s', ['name'])
+        cache.set_object(self._cache, hash_template, {'id': 5},
+                         {'name': 'Bob'})
+        self.assertEqual([({'id': '5'}, {'name': b'Bob'})],
+                         list(cache.scan_objects(self._cache, hash_template)))
+
+    def test_scan_skips_tombstones(self):
+        """Tombstones are neither scanned nor deleted as objects"""
+        template = cache.Template.hash('user:%(id)s', ['name'],
+                                       negative_ttl=60)
+        cache.set_object(self._cache, template, {'id': 1}, {'name': 'Bob'})
+        cache.mark_absent(self._cache, template, {'id': 2})
+        self.assertEqual([({'id': '1'}, {'name': b'Bob'})],
+                         list(cache.scan_objects(self._cache, template)))
+
+        parse = cache._key_matcher('%(id)s', {})[1]
+        self.assertIsNone(parse(cache._tombstone_key(template, {'id': 2})))
+        self.assertEqual({'id': '2'}, parse('2'))
+
+        self.assertEqual(1, cache.delete_matching(self._cache, template))
+        self.assertIs(cache.ABSENT, cache.retrieve_object(
+            self._cache, template, {'id': 2}))
+
+    def test_delete_matching(self):
+        """Objects and keys are deleted page by page"""
+        template = {'name': 'user:%(id)s:name', 'email': 'user:%(id)s:email'}
+        list_of_indexes = [{'id': user_id} for user_id in range(20)]
+        cache.set_objects(self._cache, template, list_of_indexes,
+                          [{'name': 'n', 'email': 'e'}
+                           for _ in list_of_indexes])
+        cache.set_value(self._cache, 'user:1:name:old', 'kept')
+        for number in range(5):
+            cache.set_value(self._cache, 'session:%d' % number, 'x')
+
+        start = time.time()
+        self.assertEqual(5, cache.delete_matching(self._cache, 'session:*',
+                                                  count=2, rate=20))
+        self.assertTrue(time.time() - start >= 0.2)
+        self.assertEqual(20, cache.delete_matching(self._cache, template))
+        with self._cache as redis_connection:
+            self.assertEqual([b'user:1:name:old'], redis_connection.keys('*'))
+
+
+class LocalCacheTierTest(unittest.TestCase):
+    """Cache with an in-process tier Unit Test"""
+    _config = None
+
+    _cache = None
+
+    def setUp(self):
+        """Create Redis"""
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        self._local = local.LocalCache()
+        self._cache = cache.Cache(self._config['redis'],
+                                  local_cache=self._local)
+
+    def tearDown(self):
+        """Flush Database"""
+        with self._cache as redis_connection:
+            redis_connection.flushdb()
+
+    def test_reads_fill_local_tier(self):
+        """Values read from Redis are served locally afterwards"""
+        with self._cache as redis_connection:
+            redis_connection.set('user:12345:username', 'Bob')
+            redis_connection.set('user:67890:username', 'John')
+
+        self.assertEqual(b'Bob',
+                         cache.get_value(self._cache, 'user:12345:username'))
+
+        # Change Redis behind the cache's back; the local copy wins.
+        with self._cache as redis_connection:
+            redis_connection.set('user:12345:username', 'Harry')
+
+        self.assertEqual(b'Bob',
+                         cache.get_value(self._cache, 'user:12345:username'))
+        self.assertEqual([b'Bob', b'John', None],
+                         cache.multi_get(self._cache,
+                                         ['user:12345:username',
+                                          'user:67890:username',
+                                          'user:00000:username']))
+        self.assertEqual(b'John', self._local.get('user:67890:username'))
+
+    def test_writes_go_through_local_tier(self):
+        """set_* writes through and delete_* invalidates"""
+        template = {'username': 'user:%(id)s:username',
+                    'email': 'user:%(id)s:email'}
+        indexes = {'id': 12345}
+
+        cache.set_object(self._cache, template, indexes,
+                         {'username': 'Bob', 'email': 'bob@example.com'})
+        self.assertEqual(b'Bob', self._local.get('user:12345:username'))
+
+        cache.set_value(self._cache, 'user:12345:username', 'Harry')
+        self.assertEqual(
+            {'username': b'Harry', 'email': b'bob@example.com'},
+            cache.retrieve_object(self._cache, template, indexes))
+
+        cache.delete_value(self._cache, 'user:12345:username')
+        self.assertEqual(None, self._local.get('user:12345:username'))
+        self.assertEqual(None,
+                         cache.retrieve_object(self._cache, template, indexes))
+
+        cache.delete_object(self._cache, template, indexes)
+        self.assertEqual(0, len(self._local))
+
+    def test_local_entries_do_not_outlive_redis(self):
+        """Written through entries expire with their Redis keys"""
+        self._local.ttl = 60
+        cache.set_value(self._cache, 'user:12345:username', 'Bob', ttl=5)
+        cache.set_value(self._cache, 'user:67890:username', 'Bob')
+        # pylint: disable=protected-access
+        self.assertTrue(
+            self._local._entries['user:12345:username'][2]
+            < self._local._entries['user:67890:username'][2])
+
+        cache.set_value(self._cache, 'user:12345:username', 'Harry',
+                        mode='nx')
+        self.assertEqual(None, self._local.get('user:12345:username'))
+
+    def test_read_through_entries_do_not_outlive_redis(self):
+        """Values read from Redis expire locally with their Redis keys"""
+        now = [0]
+        self._local = local.LocalCache(clock=lambda: now[0])
+        self._cache.local_cache = self._local
+        with self._cache as redis_connection:
+            redis_connection.set('user:1:username', 'Bob', ex=10)
+            redis_connection.set('user:2:username', 'Bob', ex=10)
+            redis_connection.set('user:3:username', 'Bob', ex=10)
+            redis_connection.set('user:4:username', 'Bob')
+            redis_connection.hset('user:5', 'username', 'Bob')
+            redis_connection.expire('user:5', 10)
+        template = {'username': 'user:%(id)s:username'}
+
+        cache.get_value(self._cache, 'user:1:username')
+        cache.multi_get(self._cache, ['user:2:username', 'user:4:username'])
+        cache.retrieve_object(self._cache, template, {'id': 3})
+        cache.retrieve_objects(self._cache, cache.Template.hash(
+            'user:%(id)s', ['username']), [{'id': 5}])
+        self.assertEqual(5, len(self._local))
+
+        now[0] = 11
+        self.assertEqual(b'Bob', self._local.get('user:4:username'))
+        for key in ('user:1:username', 'user:2:username', 'user:3:username',
+                    'user:5#username'):
+            self.assertEqual(None, self._local.get(key))
+
+
+class CodecCacheTest(unittest.TestCase):
+    """Cache with a codec Unit Test"""
+    _config = None
+
+    _cache = None
+
+    def setUp(self):
+        """Create Redis"""
+        if self._config is None:
+            self._config = get_config_yaml()
+
+        self._cache = cache.Cache(self._config['redis'],
+                                  local_cache=local.LocalCache(),
+                                  codec=codecs.Codec('json',
+                                                     compression='zlib'))
+
+    def tearDown(self):
+        """Flush Database"""
+        with self._cache as redis_connection:
+            redis_connection.flushdb()
+
+    def test_values_keep_their_types(self):
+        """Values come back as they were written"""
+        template = {'id': 'user:%(id)s:id',
+                    'profile': 'user:%(id)s:profile'}
+        data = {'id': 342, 'profile': {'name': 'Bob', 'tags': ['a'] * 1000}}
+
+        cache.set_object(self._cache, template, {'id': 342}, data)
+        self._cache.local_cache.clear()
+        self.assertEqual(data, cache.retrieve_object(self._cache, template,
+                                                     {'id': 342}))
+        self.assertEqual(data, cache.retrieve_object(self._cache, template,
+                                                     {'id': 342}))
+        self.assertEqual([data], cache.retrieve_objects(self._cache, template,
+                                                        [{'id': 342}]))
+
+        cache.set_value(self._cache, 'user:342:active', True)
+        self.assertEqual(True,
+                         cache.get_value(self._cache, 'user:342:active'))
+        self.assertEqual([342, True, None],
+                         cache.multi_get(self._cache, ['user:342:id',
+                                                       'user:342:active',
+                                                       'user:343:id']))
+
+        with self._cache as redis_connection:
+            self.assertTrue(
+                len(redis_connection.get('user:342:profile')) < 1000)
@@ -0,0 +1,65 @@
+"""Unit Test for chassis.services.circuit_breaker module"""
+# pylint: disable=invalid-name
+import unittest
+
+from chassis.services import circuit_breaker
+from chassis.test.clock import FakeClock
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    """CircuitBreaker Unit Test"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = circuit_breaker.CircuitBreaker(
+            failure_threshold=3, reset_timeout=10, clock=self.clock)
+
+    def test_opens_after_consecutive_failures(self):
+        """Only consecutive failures open the circuit"""
+        self.breaker.failure()
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+        self.breaker.failure()
+        self.assertEqual(circuit_breaker.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+
+        self.breaker.failure()
+        self.assertEqual(circuit_breaker.OPEN, self.breaker.state)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual({'state': 'open', 'failures': 3, 'opened': 1,
+                          'rejected': 1}, self.breaker.stats())
+
+    def test_half_open_probe_closes(self):
+        """A successful probe closes the circuit"""
+        for _ in range(3):
+            self.breaker.failure()
+        self.clock.now += 10
+        self.assertEqual(circuit_breaker.HALF_OPEN, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.success()
+        self.assertEqual(circuit_breaker.CLOSED, self.breaker.state)
+        self.assertTrue(self.breaker.allow())
+
+    def test_half_open_probe_reopens(self):
+        """A failed probe opens the circuit for another timeout"""
+        for _ in range(3):
+            self.breaker.failure()
+        self.clock.now += 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.failure()
+        self.assertEqual(circuit_breaker.OPEN, self.breaker.state)
+
+        self.clock.now += 9
+        self.assertFalse(self.breaker.allow())
+        self.clock.now += 1
+        self.assertTrue(self.breaker.allow())
+
+    def test_reports_while_open_are_ignored(self):
+        """Outcomes of calls that were not let through change nothing"""
+        for _ in range(3):
+            self.breaker.failure()
+        self.breaker.success()
+        self.assertEqual(circuit_breaker.OPEN, self.breaker.state)
@@ -1,8 +1,20 @@
 """Unit test for chassis.services.data_context module"""
 # pylint: disable=invalid-name, protected-access
+import threading
+import time
 import unittest
 
+from tornado import concurrent
+from tornado import gen
+from tornado import ioloop
+from tornado import locks
+from tornado import testing
+
+from chassis.services import circuit_breaker
 from chassis.services import data_context
+from chassis.services import metrics
+from chassis.services import pool
+from chassis.test.clock import FakeClock
 
 
 class UnextendedDatasourceContextTest(unittest.TestCase):
@@ -31,3 +43,468 @@ class UnextendedDatasourceContextTest(unittest.TestCase):
         # pylint: disable=unused-variable, redundant-unittest-assert
         context = data_context.DatasourceContext()
         self.assertRaises(NotImplementedError, context.__enter__)
+
+
+class CountingContext(data_context.DatasourceContext):
+    """DatasourceContext handing out a counter as its connection"""
+
+    def __init__(self, *args, **kwargs):
+        super(CountingContext, self).__init__(*args, **kwargs)
+        self.connections = 0
+
+    def _get_connection(self):
+        self.connections += 1
+        return self.connections
+
+    def _close_connection(self):
+        pass
+
+
+class DatasourceContextMetricsTest(unittest.TestCase):
+    """Unit test of the metrics recorded by DatasourceContext"""
+
+    def test_checkouts_and_errors(self):
+        """Checkouts are timed and errors counted by type"""
+        context_metrics = metrics.Metrics()
+        context = CountingContext(metrics=context_metrics)
+        with context as connection:
+            self.assertEqual(1, connection)
+        with self.assertRaises(KeyError):
+            with context:
+                raise KeyError('missing')
+
+        snapshot = context_metrics.snapshot()
+        self.assertEqual(2, snapshot['histograms']['checkout_seconds']
+                         ['count'])
+        self.assertEqual({'errors{error="KeyError"}': 1},
+                         snapshot['counters'])
+
+    def test_no_metrics(self):
+        """Contexts work without metrics"""
+        context = CountingContext()
+        self.assertIsNone(context.metrics)
+        with context as connection:
+            self.assertEqual(1, connection)
+
+
+def half_open_breaker():
+    """Return a CircuitBreaker letting a single probe through."""
+    clock = FakeClock()
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=1,
+                                             reset_timeout=10, clock=clock)
+    breaker.failure()
+    clock.now += 10
+    return breaker
+
+
+class FallbackTest(testing.AsyncTestCase):
+    """Unit test of the outcomes of blocks handed the fallback"""
+
+    def test_fallback_is_not_reported(self):
+        """A block served the fallback does not close the circuit"""
+        breaker = half_open_breaker()
+        context = CountingContext(circuit_breaker=breaker,
+                                  fallback='fallback')
+        context.connection_errors = (IOError, )
+        with self.assertRaises(IOError):
+            with context as probe:
+                with context as connection:
+                    self.assertEqual('fallback', connection)
+                self.assertEqual(circuit_breaker.HALF_OPEN, breaker.state)
+                self.assertEqual(1, probe)
+                raise IOError('connection lost')
+        self.assertEqual(circuit_breaker.OPEN, breaker.state)
+
+    def test_pooled_fallback_is_not_reported(self):
+        """Checkouts served the fallback do not close the circuit"""
+        breaker = half_open_breaker()
+        database = FakeDatabase('dsn', circuit_breaker=breaker,
+                                fallback='fallback')
+        probe = database.checkout()
+        probe.__enter__()
+        with database.checkout() as connection:
+            self.assertEqual('fallback', connection)
+        self.assertEqual(circuit_breaker.HALF_OPEN, breaker.state)
+        probe.__exit__(IOError, IOError('connection lost'), None)
+        self.assertEqual(circuit_breaker.OPEN, breaker.state)
+
+    @testing.gen_test
+    def test_async_fallback_is_not_reported(self):
+        """Coroutines served the fallback do not close the circuit"""
+        breaker = half_open_breaker()
+        context = CountingContext(circuit_breaker=breaker,
+                                  fallback='fallback')
+        self.assertEqual(1, (yield context.__aenter__()))
+        self.assertEqual('fallback', (yield context.__aenter__()))
+        yield context.__aexit__(None, None, None)
+        self.assertEqual(circuit_breaker.HALF_OPEN, breaker.state)
+
+        database = FakeAsyncDatabase('dsn',
+                                     circuit_breaker=half_open_breaker(),
+                                     fallback='fallback')
+        probe = database.checkout()
+        yield probe.__aenter__()
+        checkout = database.checkout()
+        self.assertEqual('fallback', (yield checkout.__aenter__()))
+        yield checkout.__aexit__(None, None, None)
+        self.assertEqual(circuit_breaker.HALF_OPEN,
+                         database.circuit_breaker.state)
+
+
+class InterleavedFallbackTest(testing.AsyncTestCase):
+    """Unit test of fallbacks handed out to interleaving coroutines"""
+
+    def interleave(self, asynchronous):
+        """Run a probe and a fallback block in two coroutines, with async
+        with or with held across yields, the probe failing after the
+        fallback block entered and before it exits; return the final
+        breaker state."""
+        breaker = half_open_breaker()
+        context = CountingContext(circuit_breaker=breaker,
+                                  fallback='fallback')
+        context.connection_errors = (IOError, )
+        fallback_entered = locks.Event()
+        probe_exited = locks.Event()
+
+        @gen.coroutine
+        def probe():
+            if asynchronous:
+                connection = yield context.__aenter__()
+            else:
+                connection = context.__enter__()
+            self.assertEqual(1, connection)
+            yield fallback_entered.wait()
+            if asynchronous:
+                yield context.__aexit__(IOError, None, None)
+            else:
+                context.__exit__(IOError, None, None)
+            probe_exited.set()
+
+        @gen.coroutine
+        def fallback():
+            if asynchronous:
+                connection = yield context.__aenter__()
+            else:
+                connection = context.__enter__()
+            self.assertEqual('fallback', connection)
+            fallback_entered.set()
+            yield probe_exited.wait()
+            if asynchronous:
+                yield context.__aexit__(None, None, None)
+            else:
+                context.__exit__(None, None, None)
+
+        self.io_loop.run_sync(lambda: gen.multi([probe(), fallback()]))
+        return breaker.state
+
+    def test_async_with(self):
+        """Interleaved async with blocks report their own outcome"""
+        self.assertEqual(circuit_breaker.OPEN, self.interleave(True))
+
+    def test_with_across_yields(self):
+        """Interleaved with blocks held across yields report their own
+        outcome"""
+        self.assertEqual(circuit_breaker.OPEN, self.interleave(False))
+
+
+class BlockingContext(CountingContext):
+    """CountingContext recording the threads its calls run on"""
+
+    def __init__(self, *args, **kwargs):
+        super(BlockingContext, self).__init__(*args, **kwargs)
+        self.threads = set()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def _get_connection(self):
+        self.threads.add(threading.current_thread())
+        return super(BlockingContext, self)._get_connection()
+
+    def insert(self, query, params):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+
+
+class AsyncProtocolTest(testing.AsyncTestCase):
+    """Unit test of the asynchronous protocol of DatasourceContext"""
+
+    @testing.gen_test
+    def test_blocking_calls_run_on_executor(self):
+        """Blocking calls leave the IOLoop, with bounded concurrency"""
+        context = BlockingContext(executor_workers=2,
+                                  metrics=metrics.Metrics())
+        connection = yield context.__aenter__()
+        self.assertEqual(1, connection)
+        yield context.__aexit__(None, None, None)
+        self.assertNotIn(threading.current_thread(), context.threads)
+
+        ticks = []
+
+        @gen.coroutine
+        def tick():
+            for _ in range(3):
+                ticks.append(time.time())
+                yield gen.sleep(0.005)
+
+        yield [tick()] + [context.ainsert('INSERT', (number, ))
+                          for number in range(6)]
+        self.assertEqual(2, context.peak)
+        self.assertEqual(3, len(ticks))
+        snapshot = context.metrics.snapshot()
+        self.assertEqual(1, snapshot['histograms']['checkout_seconds']
+                         ['count'])
+
+    @testing.gen_test
+    def test_non_blocking_calls_run_on_loop(self):
+        """Natively asynchronous datasources are called on the IOLoop"""
+        context = BlockingContext()
+        context.blocking = False
+        connection = yield context.__aenter__()
+        self.assertEqual(1, connection)
+        self.assertEqual(set([threading.current_thread()]), context.threads)
+        self.assertIsNone(context.executor)
+
+    @testing.gen_test
+    def test_errors(self):
+        """Errors of blocking calls reach the coroutine"""
+        context = data_context.DatasourceContext()
+        with self.assertRaises(NotImplementedError):
+            yield context.__aenter__()
+        with self.assertRaises(NotImplementedError):
+            yield context.ainsert('INSERT', ())
+
+
+class DictContext(data_context.DatasourceContext):
+    """DatasourceContext reading from a dictionary, recording its batches"""
+
+    def __init__(self, data, *args, **kwargs):
+        super(DictContext, self).__init__(*args, **kwargs)
+        self.data = data
+        self.batches = []
+        self.asynchronous = False
+
+    def read_many(self, keys):
+        self.batches.append(sorted(keys))
+        values = [self.data.get(key) for key in keys]
+        if not self.asynchronous:
+            return values
+        future = concurrent.Future()
+        future.set_result(values)
+        return future
+
+
+class RequestScopeTest(testing.AsyncTestCase):
+    """Unit test of request scoped memoization and batching"""
+
+    def setUp(self):
+        super(RequestScopeTest, self).setUp()
+        self.metrics = metrics.Metrics()
+        self.context = DictContext({'a': 1, 'b': 2, 'c': 3},
+                                   metrics=self.metrics)
+        self.scope = self.context.request_scope()
+
+    @testing.gen_test
+    def test_same_tick_loads_are_batched(self):
+        """Loads issued together are read in one batch, then memoized"""
+        values = yield [self.scope.load('a'), self.scope.load('b'),
+                        self.scope.load('a'), self.scope.load('missing')]
+        self.assertEqual([1, 2, 1, None], values)
+        self.assertEqual([['a', 'b', 'missing']], self.context.batches)
+
+        values = yield self.scope.load_many(['b', 'c', 'missing'])
+        self.assertEqual([2, 3, None], values)
+        self.assertEqual([['a', 'b', 'missing'], ['c']],
+                         self.context.batches)
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(3, snapshot['counters']['memo_hits'])
+        self.assertEqual(2, snapshot['histograms']['batch_size']['count'])
+
+    @testing.gen_test
+    def test_asynchronous_datasource(self):
+        """read_many may return a Future"""
+        self.context.asynchronous = True
+
+        @gen.coroutine
+        def service(key):
+            value = yield self.scope.load(key)
+            raise gen.Return(value)
+
+        values = yield [service('a'), service('c')]
+        self.assertEqual([1, 3], values)
+        self.assertEqual([['a', 'c']], self.context.batches)
+
+    def test_synchronous_reads(self):
+        """get and get_many share the memo"""
+        self.assertEqual([1, 2, 1], self.scope.get_many(['a', 'b', 'a']))
+        self.assertEqual(1, self.scope.get('a'))
+        self.scope.prime('a', 10)
+        self.assertEqual(10, self.scope.get('a'))
+        self.scope.clear('a')
+        self.assertEqual(1, self.scope.get('a'))
+        self.assertEqual([['a', 'b'], ['a']], self.context.batches)
+
+    @testing.gen_test
+    def test_errors_are_not_memoized(self):
+        """A failed batch fails its loads and is read again next time"""
+        def read_many(keys):
+            raise KeyError(keys[0])
+
+        self.context.read_many = read_many
+        with self.assertRaises(KeyError):
+            yield self.scope.load('a')
+        del self.context.read_many
+        self.assertEqual(1, (yield self.scope.load('a')))
+
+
+class FakeConnection(object):
+    """Connection of a FakeDatabase"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self.closed = False
+        self.rows = []
+
+    def close(self):
+        """Close the connection"""
+        self.closed = True
+
+
+class FakeDatabase(data_context.PooledDatasourceContext):
+    """Pooled datasource over FakeConnections"""
+
+    connection_errors = (IOError, )
+
+    def __init__(self, *args, **kwargs):
+        super(FakeDatabase, self).__init__(*args, **kwargs)
+        self.opened = []
+
+    def _connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def insert(self, query, params):
+        with self as connection:
+            connection.rows.append((query, params))
+
+
+class PooledDatasourceContextTest(unittest.TestCase):
+    """Unit test of PooledDatasourceContext"""
+
+    def test_connections_are_reused(self):
+        """with blocks share the pool's connections"""
+        database = FakeDatabase('dsn', max_size=2, metrics=metrics.Metrics())
+        with database as first:
+            with database as second:
+                self.assertIsNot(first, second)
+        with database as connection:
+            self.assertIn(connection, (first, second))
+        database.insert('INSERT', (1, ))
+        self.assertEqual(2, len(database.opened))
+        self.assertEqual(4, database.metrics.snapshot()['histograms']
+                         ['checkout_seconds']['count'])
+
+    def test_connection_errors_discard(self):
+        """Connections whose block failed to reach the backend are closed"""
+        database = FakeDatabase('dsn')
+        with self.assertRaises(KeyError):
+            with database as kept:
+                raise KeyError('not a connection error')
+        with self.assertRaises(IOError):
+            with database.checkout() as connection:
+                self.assertIs(kept, connection)
+                raise IOError('connection lost')
+        self.assertTrue(connection.closed)
+        with database as connection:
+            self.assertIsNot(kept, connection)
+
+    def test_async_checkout(self):
+        """Coroutines check connections out of a thread safe pool"""
+        database = FakeDatabase('dsn', max_size=1)
+
+        @gen.coroutine
+        def work():
+            checkout = database.checkout()
+            connection = yield checkout.__aenter__()
+            connection.rows.append('row')
+            yield checkout.__aexit__(None, None, None)
+
+        io_loop = ioloop.IOLoop()
+        try:
+            io_loop.run_sync(lambda: gen.multi([work(), work()]))
+        finally:
+            io_loop.close()
+        self.assertEqual(1, len(database.opened))
+        self.assertEqual(['row', 'row'], database.opened[0].rows)
+        self.assertEqual(0, database.pool.stats()['in_use'])
+        with self.assertRaises(TypeError):
+            database.__aenter__()
+
+    def test_concurrency(self):
+        """Threads share at most max_size connections"""
+        database = FakeDatabase('dsn', max_size=4, pool_timeout=5)
+        errors = []
+
+        def work():
+            try:
+                for number in range(20):
+                    database.insert('INSERT', (number, ))
+            except Exception as err:  # pylint: disable=broad-except
+                errors.append(err)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertTrue(len(database.opened) <= 4)
+        self.assertEqual(160, sum(len(connection.rows)
+                                  for connection in database.opened))
+        self.assertEqual(0, database.pool.stats()['in_use'])
+
+
+class FakeAsyncDatabase(data_context.AsyncPooledDatasourceContext):
+    """Asynchronous pooled datasource over FakeConnections"""
+
+    @gen.coroutine
+    def _connect(self):
+        yield gen.moment
+        raise gen.Return(FakeConnection())
+
+
+class AsyncPooledDatasourceContextTest(testing.AsyncTestCase):
+    """Unit test of AsyncPooledDatasourceContext"""
+
+    @testing.gen_test
+    def test_checkout(self):
+        """Coroutines check connections out and wait for them"""
+        database = FakeAsyncDatabase('dsn', max_size=2)
+        used = set()
+
+        @gen.coroutine
+        def work(number):
+            checkout = database.checkout()
+            connection = yield checkout.__aenter__()
+            used.add(connection)
+            yield gen.sleep(0.001)
+            connection.rows.append(number)
+            yield checkout.__aexit__(None, None, None)
+
+        yield [work(number) for number in range(10)]
+        self.assertEqual(2, len(used))
+        self.assertEqual(list(range(10)), sorted(
+            row for connection in used for row in connection.rows))
+        with self.assertRaises(TypeError):
+            with database:
+                pass
+        connections = yield [database.pool.acquire() for _ in range(2)]
+        with self.assertRaises(pool.PoolTimeout):
+            yield database.pool.acquire(timeout=0.01)
+        for connection in connections:
+            yield database.pool.release(connection)
@@ -0,0 +1,71 @@
+"""Unit Test for chassis.services.metrics module"""
+# pylint: disable=invalid-name
+import unittest
+
+from chassis.services import metrics
+
+
+class MetricsTest(unittest.TestCase):
+    """Metrics Unit Test"""
+
+    def setUp(self):
+        self.metrics = metrics.Metrics()
+
+    def test_snapshot(self):
+        """Counters, gauges and histograms are reported by series"""
+        self.metrics.increment('errors')
+        self.metrics.increment('errors', 2)
+        self.metrics.increment('command_errors', label=('command', 'GET'))
+        self.metrics.gauge('pool_in_use', lambda: 3)
+        self.metrics.observe('command_seconds', 0.002, ('command', 'GET'))
+        self.metrics.observe('command_seconds', 10, ('command', 'GET'))
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual({'errors': 3, 'command_errors{command="GET"}': 1},
+                         snapshot['counters'])
+        self.assertEqual({'pool_in_use': 3}, snapshot['gauges'])
+        histogram = snapshot['histograms']['command_seconds{command="GET"}']
+        self.assertEqual(2, histogram['count'])
+        self.assertEqual(10.002, histogram['sum'])
+        buckets = dict(histogram['buckets'])
+        self.assertEqual(0, buckets[0.001])
+        self.assertEqual(1, buckets[0.0025])
+        self.assertEqual(1, buckets[5.0])
+        self.assertEqual(2, buckets['+Inf'])
+
+    def test_flush(self):
+        """flush pushes a snapshot to the sink"""
+        snapshots = []
+        self.metrics.sink = snapshots.append
+        self.metrics.increment('errors')
+        self.metrics.flush()
+        self.assertEqual([self.metrics.snapshot()], snapshots)
+
+    def test_statsd_lines(self):
+        """Snapshots are formatted as StatsD gauges"""
+        self.metrics.increment('command_errors', label=('command', 'GET'))
+        self.metrics.observe('pipeline_size', 4, buckets=(1, 10))
+        self.assertEqual(['users.command_errors.GET:1|g',
+                          'users.pipeline_size.count:1|g',
+                          'users.pipeline_size.sum:4|g',
+                          'users.pipeline_size.mean:4.0|g'],
+                         metrics.statsd_lines(self.metrics.snapshot(),
+                                              'users'))
+
+    def test_prometheus_text(self):
+        """Snapshots are formatted in the Prometheus text format"""
+        self.metrics.increment('errors', label=('error', 'KeyError'))
+        self.metrics.gauge('pool_idle', lambda: 2)
+        self.metrics.observe('pipeline_size', 4, buckets=(1, 10))
+        self.assertEqual('# TYPE users_errors counter\n'
+                         'users_errors{error="KeyError"} 1\n'
+                         '# TYPE users_pool_idle gauge\n'
+                         'users_pool_idle 2\n'
+                         '# TYPE users_pipeline_size histogram\n'
+                         'users_pipeline_size_bucket{le="1"} 0\n'
+                         'users_pipeline_size_bucket{le="10"} 1\n'
+                         'users_pipeline_size_bucket{le="+Inf"} 1\n'
+                         'users_pipeline_size_sum 4\n'
+                         'users_pipeline_size_count 1\n',
+                         metrics.prometheus_text(self.metrics.snapshot(),
+                                                 'users'))
@@ -0,0 +1,268 @@
+"""Unit Test for chassis.services.pool module"""
+# pylint: disable=invalid-name
+import threading
+import time
+import unittest
+
+from tornado import gen
+from tornado import testing
+
+from chassis.services import pool
+from chassis.test.clock import FakeClock
+
+
+class FakeConnection(object):
+    """Connection of a FakeBackend"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+
+
+class FakeBackend(object):
+    """Opens FakeConnections and keeps track of them"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.opened = []
+        self.in_use = 0
+        self.peak = 0
+
+    def connect(self):
+        """Open a connection"""
+        with self.lock:
+            connection = FakeConnection(len(self.opened))
+            self.opened.append(connection)
+            return connection
+
+    @staticmethod
+    def close(connection):
+        """Close a connection"""
+        connection.closed = True
+
+    @staticmethod
+    def validate(connection):
+        """Return whether a connection is alive"""
+        return connection.alive
+
+    def use(self, seconds):
+        """Record a connection being used for some time"""
+        with self.lock:
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+        time.sleep(seconds)
+        with self.lock:
+            self.in_use -= 1
+
+    def open_count(self):
+        """Return the number of connections not closed"""
+        return len([connection for connection in self.opened
+                    if not connection.closed])
+
+
+class PoolTest(unittest.TestCase):
+    """Pool Unit Test"""
+
+    def setUp(self):
+        self.backend = FakeBackend()
+        self.clock = FakeClock()
+
+    def make_pool(self, **kwargs):
+        """Return a Pool over the fake backend"""
+        return pool.Pool(self.backend.connect, close=self.backend.close,
+                         validate=self.backend.validate, clock=self.clock,
+                         **kwargs)
+
+    def test_reuse_and_min_size(self):
+        """Connections are reused, and min_size are opened up front"""
+        connections = self.make_pool(min_size=2, max_size=4)
+        first = connections.acquire()
+        self.assertEqual(2, len(self.backend.opened))
+        connections.release(first)
+        self.assertIs(first, connections.acquire())
+        self.assertEqual({'size': 2, 'idle': 1, 'in_use': 1, 'waiting': 0,
+                          'created': 2, 'discarded': 0}, connections.stats())
+
+    def test_validation(self):
+        """Dead connections are replaced on checkout"""
+        connections = self.make_pool()
+        with connections.connection() as connection:
+            connection.alive = False
+        with connections.connection() as replacement:
+            self.assertIsNot(connection, replacement)
+        self.assertTrue(connection.closed)
+
+    def test_raising_validation(self):
+        """Connections whose validation raises are replaced, not leaked"""
+        connections = self.make_pool(max_size=2, timeout=0.05)
+        held = [connections.acquire() for _ in range(2)]
+        for connection in held:
+            connections.release(connection)
+            connection.alive = None
+
+        def validate(connection):
+            if connection.alive is None:
+                raise IOError('dead socket')
+            return True
+
+        connections._validate = validate  # pylint: disable=protected-access
+        replacements = [connections.acquire() for _ in range(2)]
+        self.assertTrue(all(connection.closed for connection in held))
+        self.assertFalse(set(held) & set(replacements))
+        self.assertEqual(2, connections.stats()['in_use'])
+
+    def test_errors_discard(self):
+        """Connections used by a failing block are closed"""
+        connections = self.make_pool()
+        with self.assertRaises(KeyError):
+            with connections.connection() as connection:
+                raise KeyError('boom')
+        self.assertTrue(connection.closed)
+        self.assertEqual(0, connections.stats()['size'])
+
+    def test_idle_reaping(self):
+        """Idle connections beyond min_size are closed"""
+        connections = self.make_pool(min_size=1, max_idle=10)
+        held = [connections.acquire() for _ in range(3)]
+        for connection in held:
+            connections.release(connection)
+        self.clock.now += 10
+        self.assertEqual(2, connections.reap())
+        self.assertEqual(1, self.backend.open_count())
+        self.assertEqual(1, connections.stats()['size'])
+
+    def test_periodic_reaping(self):
+        """With a reap_interval, idle connections are reaped unprompted"""
+        connections = self.make_pool(max_idle=10, reap_interval=0.01)
+        connections.release(connections.acquire())
+        self.clock.now += 10
+        deadline = time.time() + 5
+        while self.backend.open_count() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(0, connections.stats()['size'])
+        connections.close()
+
+    def test_max_lifetime(self):
+        """Old connections are closed instead of reused"""
+        connections = self.make_pool(max_lifetime=60)
+        with connections.connection() as old:
+            pass
+        self.clock.now += 60
+        with connections.connection() as new:
+            self.assertIsNot(old, new)
+        self.assertTrue(old.closed)
+
+    def test_timeout_and_close(self):
+        """Checkouts give up when the pool is exhausted"""
+        connections = pool.Pool(self.backend.connect, max_size=1)
+        held = connections.acquire()
+        start = time.time()
+        with self.assertRaises(pool.PoolTimeout):
+            connections.acquire(timeout=0.05)
+        self.assertTrue(time.time() - start < 1)
+
+        connections.close()
+        with self.assertRaises(pool.PoolClosed):
+            connections.acquire()
+        connections.release(held)
+        self.assertEqual(0, connections.stats()['size'])
+
+    def test_concurrency(self):
+        """Threads never hold more than max_size connections"""
+        connections = pool.Pool(self.backend.connect, max_size=3, timeout=5)
+        errors = []
+
+        def work():
+            try:
+                for _ in range(5):
+                    with connections.connection():
+                        self.backend.use(0.002)
+            except Exception as err:  # pylint: disable=broad-except
+                errors.append(err)
+
+        threads = [threading.Thread(target=work) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertEqual(3, self.backend.peak)
+        self.assertEqual(3, len(self.backend.opened))
+        self.assertEqual(3, connections.stats()['idle'])
+
+
+class AsyncPoolTest(testing.AsyncTestCase):
+    """AsyncPool Unit Test"""
+
+    def setUp(self):
+        super(AsyncPoolTest, self).setUp()
+        self.backend = FakeBackend()
+
+    @testing.gen_test
+    def test_concurrency(self):
+        """Coroutines wait for connections beyond max_size"""
+        @gen.coroutine
+        def connect():
+            yield gen.moment
+            raise gen.Return(self.backend.connect())
+
+        connections = pool.AsyncPool(connect, validate=self.backend.validate,
+                                     max_size=2)
+        peak = [0, 0]
+
+        @gen.coroutine
+        def work():
+            connection = yield connections.acquire()
+            peak[0] += 1
+            peak[1] = max(peak)
+            yield gen.sleep(0.002)
+            peak[0] -= 1
+            yield connections.release(connection)
+
+        yield [work() for _ in range(10)]
+        self.assertEqual(2, peak[1])
+        self.assertEqual(2, len(self.backend.opened))
+
+    @testing.gen_test
+    def test_periodic_reaping(self):
+        """With a reap_interval, idle connections are reaped unprompted"""
+        clock = FakeClock()
+        connections = pool.AsyncPool(self.backend.connect,
+                                     close=self.backend.close, max_idle=10,
+                                     reap_interval=0.01, clock=clock)
+        yield connections.release((yield connections.acquire()))
+        clock.now += 10
+        yield gen.sleep(0.05)
+        self.assertEqual(0, self.backend.open_count())
+        self.assertEqual(0, connections.stats()['size'])
+        yield connections.close()
+
+    @testing.gen_test
+    def test_raising_validation(self):
+        """Connections whose validation raises are replaced, not leaked"""
+        def validate(connection):
+            if connection.number == 0:
+                raise IOError('dead socket')
+            return True
+
+        connections = pool.AsyncPool(self.backend.connect,
+                                     close=self.backend.close,
+                                     validate=validate, max_size=1)
+        yield connections.release((yield connections.acquire()))
+        connection = yield connections.acquire(timeout=0.05)
+        self.assertEqual(1, connection.number)
+        self.assertTrue(self.backend.opened[0].closed)
+        self.assertEqual(1, connections.stats()['in_use'])
+
+    @testing.gen_test
+    def test_timeout_and_checkout(self):
+        """Checkouts time out, and async with blocks return connections"""
+        connections = pool.AsyncPool(self.backend.connect, max_size=1)
+        checkout = connections.connection()
+        connection = yield checkout.__aenter__()
+        with self.assertRaises(pool.PoolTimeout):
+            yield connections.acquire(timeout=0.01)
+        yield checkout.__aexit__(None, None, None)
+        self.assertIs(connection, (yield connections.acquire()))
@@ -0,0 +1,189 @@
+"""Unit Test for chassis.services.write_buffer module"""
+# pylint: disable=invalid-name, protected-access
+import gc
+import threading
+import unittest
+import weakref
+
+from tornado import gen
+from tornado import testing
+
+from chassis.services import data_context
+from chassis.services import metrics
+from chassis.services import write_buffer
+
+
+class RecordingContext(data_context.DatasourceContext):
+    """DatasourceContext recording its bulk inserts"""
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingContext, self).__init__(*args, **kwargs)
+        self.batches = []
+        self.threads = set()
+        self.failing = False
+
+    def insert_many(self, query, list_of_params):
+        self.threads.add(threading.current_thread())
+        if self.failing:
+            raise IOError('database down')
+        self.batches.append((query, list(list_of_params)))
+
+
+class WriteBufferTest(testing.AsyncTestCase):
+    """WriteBuffer Unit Test"""
+
+    def setUp(self):
+        super(WriteBufferTest, self).setUp()
+        self.context = RecordingContext(metrics=metrics.Metrics())
+
+    def make_buffer(self, **kwargs):
+        """Return a write buffer over the recording context"""
+        kwargs.setdefault('max_delay', None)
+        return self.context.write_buffer(flush_at_exit=False, **kwargs)
+
+    def test_flush_by_count(self):
+        """A query's rows are flushed once max_rows are buffered"""
+        buffer_ = self.make_buffer(max_rows=3)
+        for number in range(4):
+            buffer_.insert('A', (number, ))
+        buffer_.insert('B', ('b', ))
+        self.assertEqual([('A', [(0, ), (1, ), (2, )])], self.context.batches)
+        self.assertEqual(2, len(buffer_))
+
+        self.assertEqual(2, buffer_.close())
+        self.assertEqual(3, len(self.context.batches))
+        with self.assertRaises(ValueError):
+            buffer_.insert('A', (5, ))
+        snapshot = self.context.metrics.snapshot()
+        self.assertEqual(3, snapshot['histograms']['batch_rows']['count'])
+        self.assertEqual(3, snapshot['histograms']['flush_seconds']['count'])
+
+    def test_flush_by_bytes(self):
+        """A query's rows are flushed once max_bytes are buffered"""
+        buffer_ = self.make_buffer(max_bytes=10)
+        buffer_.insert('A', ('12345', ))
+        self.assertEqual([], self.context.batches)
+        buffer_.insert('A', {'name': '67890'})
+        self.assertEqual([('A', [('12345', ), {'name': '67890'}])],
+                         self.context.batches)
+
+    def test_backpressure(self):
+        """Inserts flush everything once max_pending rows are buffered"""
+        buffer_ = self.make_buffer(max_pending=4)
+        for query in 'ABCD':
+            buffer_.insert(query, ())
+        self.assertEqual(4, len(self.context.batches))
+        self.assertEqual(0, len(buffer_))
+
+    @testing.gen_test
+    def test_flush_by_time(self):
+        """Rows are flushed from the IOLoop after max_delay"""
+        buffer_ = self.make_buffer(max_delay=0.01)
+        buffer_.insert('A', (1, ))
+        buffer_.insert('A', (2, ))
+        self.assertEqual([], self.context.batches)
+        yield gen.sleep(0.05)
+        self.assertEqual([('A', [(1, ), (2, )])], self.context.batches)
+        self.assertNotIn(threading.current_thread(), self.context.threads)
+
+        self.context.failing = True
+        buffer_.insert('A', (3, ))
+        yield gen.sleep(0.05)
+        self.assertEqual({'dropped_rows': 1},
+                         self.context.metrics.snapshot()['counters'])
+
+    @testing.gen_test
+    def test_aflush(self):
+        """aflush writes with ainsert_many and raises its errors"""
+        buffer_ = self.make_buffer()
+        buffer_.insert('A', (1, ))
+        self.assertEqual(1, (yield buffer_.aflush()))
+        self.assertEqual([('A', [(1, )])], self.context.batches)
+        self.assertNotIn(threading.current_thread(), self.context.threads)
+
+        buffer_.insert('A', (2, ))
+        self.context.failing = True
+        with self.assertRaises(IOError):
+            yield buffer_.aflush()
+        self.assertEqual(0, len(buffer_))
+
+    @testing.gen_test
+    def test_full_batches_on_io_loop(self):
+        """Inserts on the IOLoop flush full batches with ainsert_many"""
+        buffer_ = self.make_buffer(max_rows=2, max_pending=3)
+        self.assertIsNone(buffer_.insert('A', (1, )))
+        future = buffer_.insert('A', (2, ))
+        self.assertEqual(0, len(buffer_))
+        self.assertEqual(2, (yield future))
+        self.assertEqual([('A', [(1, ), (2, )])], self.context.batches)
+        self.assertNotIn(threading.current_thread(), self.context.threads)
+
+        for query in 'BCD':
+            future = buffer_.insert(query, ())
+        self.assertEqual(3, (yield future))
+        self.assertEqual(0, len(buffer_))
+        self.assertEqual(4, len(self.context.batches))
+
+        self.context.failing = True
+        buffer_.insert('E', ())
+        with self.assertRaises(IOError):
+            yield buffer_.insert('E', ())
+        self.assertEqual({'dropped_rows': 2},
+                         self.context.metrics.snapshot()['counters'])
+
+    def test_flush_at_exit(self):
+        """Only open buffers are flushed at exit, and are not kept alive"""
+        buffer_ = self.context.write_buffer(max_delay=None)
+        buffer_.insert('A', (1, ))
+        self.assertIn(buffer_, write_buffer._AT_EXIT)
+        write_buffer._flush_at_exit()
+        self.assertEqual([('A', [(1, )])], self.context.batches)
+        self.assertNotIn(buffer_, write_buffer._AT_EXIT)
+
+        buffer_ = weakref.ref(self.context.write_buffer(max_delay=None))
+        gc.collect()
+        self.assertIsNone(buffer_())
+
+    def test_failed_flush(self):
+        """Explicit flushes raise, and the failed rows are dropped"""
+        buffer_ = self.make_buffer()
+        buffer_.insert('A', (1, ))
+        self.context.failing = True
+        with self.assertRaises(IOError):
+            buffer_.flush()
+        self.assertEqual(0, len(buffer_))
+
+    def test_threads(self):
+        """Rows inserted from several threads are all written once"""
+        buffer_ = self.make_buffer(max_rows=7)
+
+        def work(thread):
+            for number in range(100):
+                buffer_.insert('A', (thread, number))
+
+        threads = [threading.Thread(target=work, args=(thread, ))
+                   for thread in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        buffer_.close()
+        rows = [row for (_, batch) in self.context.batches for row in batch]
+        self.assertEqual(500, len(rows))
+        self.assertEqual(500, len(set(rows)))
+
+    def test_insert_many_default(self):
+        """insert_many calls insert once per row by default"""
+        rows = []
+
+        class Context(data_context.DatasourceContext):
+            """Context recording its inserts"""
+            def insert(self, query, params):
+                rows.append((query, params))
+
+        Context().insert_many('A', [(1, ), (2, )])
+        self.assertEqual([('A', (1, )), ('A', (2, ))], rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
 """Test Parameter Parser."""
 # pylint: disable=missing-docstring
 
+import json
 import mock
 import unittest
+from tornado import testing
 from tornado import web
 
 from chassis.util import params
@@ -428,3 +430,222 @@ class TestParamParser(unittest.TestCase):
         self.assertRaises(web.HTTPError,
                           get,
                           self.handler)
+
+    def test_compiled_plan(self):
+        plan = params.compile_parameters([
+            ('foo', {'validators': self.bar_validator, 'required': True}),
+            ('spam', {'validators': [self.bat_validator, self.baz_validator],
+                      'default': 42}),
+            ('eggs', {})
+            ])
+
+        self.assertEqual(('foo', ), plan.required)
+        self.assertEqual(
+            (('foo', (self.bar_validator.validate, ), None),
+             ('spam', (self.bat_validator.validate,
+                       self.baz_validator.validate), 42),
+             ('eggs', (), None)),
+            plan.fields)
+        self.assertIs(plan, params.compile_parameters(plan))
+
+    def test_declarations_compiled_when_decorating(self):
+        parameters = [('foo', {'validators': self.bar_validator})]
+        get = params.parse_dict(parameters)(self.handler.get)
+
+        # Later changes to the declarations are not seen
+        parameters.append(('spam', {'required': True}))
+        get(self.handler)
+        self.handler.get.assert_called_with(self.handler, data={'foo': None})
+
+    def test_invalid_validator(self):
+        get = params.parse([
+            ('foo', {'validators': [object()]})
+            ])(self.handler.get)
+
+        self.handler.request.arguments['foo'] = 'Foobar'
+        with self.assertRaises(web.HTTPError) as context:
+            get(self.handler)
+        self.assertEqual(500, context.exception.status_code)
+
+    def test_collect_all_errors(self):
+        self.fail_validator.validate.side_effect = params.validators. \
+            ValidationError('Valid integer required.')
+        get = params.parse_dict([
+            ('foo', {'validators': self.bar_validator, 'required': True}),
+            ('spam', {'validators': self.fail_validator}),
+            ('eggs', {'validators': self.fail_validator, 'required': True})
+            ])(self.handler.get)
+
+        self.handler.request.arguments['spam'] = 'Canned Meat'
+        self.handler.request.arguments['eggs'] = 'Over Easy'
+        with self.assertRaises(params.ParameterError) as context:
+            get(self.handler)
+        self.assertEqual(400, context.exception.status_code)
+        self.assertEqual({'errors': [
+            {'parameter': 'foo', 'message': params.MISSING},
+            {'parameter': 'spam', 'message': 'Valid integer required.'},
+            {'parameter': 'eggs', 'message': 'Valid integer required.'}]},
+                         context.exception.body())
+        self.assertFalse(self.handler.get.called)
+
+    def test_fail_fast(self):
+        self.fail_validator.validate.side_effect = params.validators. \
+            ValidationError('Valid integer required.')
+        get = params.parse([
+            ('spam', {'validators': self.fail_validator}),
+            ('eggs', {'validators': self.bar_validator})
+            ], fail_fast=True)(self.handler.get)
+
+        self.handler.request.arguments['spam'] = 'Canned Meat'
+        self.handler.request.arguments['eggs'] = 'Over Easy'
+        with self.assertRaises(params.ParameterError) as context:
+            get(self.handler)
+        self.assertEqual([('spam', 'Valid integer required.')],
+                         context.exception.errors)
+        self.assertFalse(self.bar_validator.validate.called)
+
+        get = params.parse([
+            ('spam', {'validators': self.fail_validator, 'required': True}),
+            ('eggs', {'required': True})
+            ], fail_fast=True)(self.handler.get)
+        del self.handler.request.arguments['spam']
+        self.fail_validator.validate.reset_mock()
+        with self.assertRaises(params.ParameterError) as context:
+            get(self.handler)
+        self.assertEqual([('spam', params.MISSING)], context.exception.errors)
+        self.assertFalse(self.fail_validator.validate.called)
+
+    def test_nested_error_path(self):
+        get = params.parse([
+            ('ids', {'validators': params.validators.List(
+                params.validators.Integer())})
+            ])(self.handler.get)
+
+        self.handler.request.arguments['ids'] = '1,2'
+        get(self.handler)
+        self.handler.get.assert_called_with(self.handler, ids=[1, 2])
+
+        self.handler.request.arguments['ids'] = '1,x'
+        with self.assertRaises(params.ParameterError) as context:
+            get(self.handler)
+        self.assertEqual([('ids[1]', 'Valid integer required.')],
+                         context.exception.errors)
+
+
+class ParameterHandler(params.ParameterErrorMixin, web.RequestHandler):
+
+    @params.parse([
+        ('count', {'validators': params.validators.Integer(),
+                   'required': True}),
+        ('name', {'validators': params.validators.String(max_length=3)})
+        ])
+    def get(self, count=None, name=None):
+        self.finish({'count': count, 'name': name})
+
+
+class TestParameterErrorMixin(testing.AsyncHTTPTestCase):
+
+    def get_app(self):
+        return web.Application([('/', ParameterHandler)])
+
+    def test_error_body(self):
+        response = self.fetch('/?name=Spam')
+        self.assertEqual(400, response.code)
+        self.assertEqual({'errors': [
+            {'parameter': 'count', 'message': params.MISSING},
+            {'parameter': 'name', 'message': 'Valid string required.'}]},
+                         json.loads(response.body.decode('utf-8')))
+
+        response = self.fetch('/?count=3')
+        self.assertEqual(200, response.code)
+        self.assertEqual({'count': 3, 'name': None},
+                         json.loads(response.body.decode('utf-8')))
+
+        response = self.fetch('/missing')
+        self.assertEqual(404, response.code)
+
+
+class JSONHandler(web.RequestHandler):
+
+    @params.parse_dict([
+        ('count', {'validators': params.validators.Integer(),
+                   'required': True}),
+        ('tags', {'default': []})
+        ])
+    def post(self, data):
+        # Decoded once, by the decorator
+        self.finish({'data': data, 'cached': params.json_body(self) is
+                     params.json_body(self)})
+
+
+@web.stream_request_body
+class StreamedJSONHandler(params.ParameterErrorMixin, params.JSONStreamMixin,
+                          web.RequestHandler):
+
+    max_body_size = 64
+
+    @params.parse_dict([('count', {'required': True})])
+    def post(self, data):
+        self.finish({'data': data, 'chunks': len(self._chunks)})
+
+
+class IntegerJSONHandler(params.ParameterErrorMixin, web.RequestHandler):
+
+    @params.parse_dict([
+        ('count', {'validators': params.validators.Integer()})
+        ])
+    def post(self, data):
+        self.finish({'data': data})
+
+
+class TestJSONBody(testing.AsyncHTTPTestCase):
+
+    def get_app(self):
+        return web.Application([('/', JSONHandler),
+                                ('/streamed', StreamedJSONHandler),
+                                ('/integer', IntegerJSONHandler)])
+
+    def post(self, path, body, content_type='application/json', **kwargs):
+        response = self.fetch(path, method='POST', body=body,
+                              headers={'Content-Type': content_type},
+                              **kwargs)
+        return response.code, json.loads(response.body.decode('utf-8'))
+
+    def test_json_body(self):
+        self.assertEqual(
+            (200, {'data': {'count': 3, 'tags': ['a']}, 'cached': True}),
+            self.post('/', '{"count": "3", "tags": ["a"], "extra": 1}'))
+        self.assertEqual(
+            (200, {'data': {'count': 3, 'tags': []}, 'cached': True}),
+            self.post('/', '{"count": 3}',
+                      'application/vnd.api+json; charset=utf-8'))
+
+    def test_non_string_json_values(self):
+        for value in ('null', '[1]', '{}', '"x"'):
+            self.assertEqual(
+                (400, {'errors': [{'parameter': 'count',
+                                   'message': 'Valid integer required.'}]}),
+                self.post('/integer', '{"count": %s}' % value))
+
+    def test_invalid_json_body(self):
+        self.assertEqual(400, self.post('/streamed', '{"count":')[0])
+        self.assertEqual(
+            (400, {'errors': [{'parameter': 'body',
+                               'message': 'JSON object required.'}]}),
+            self.post('/streamed', '[1, 2]'))
+
+    def test_streamed_body(self):
+        def chunks(write):
+            write(b'{"count": ')
+            write(b'3}')
+
+        code, body = self.post('/streamed', None, body_producer=chunks,
+                               allow_nonstandard_methods=True)
+        self.assertEqual(200, code)
+        self.assertEqual({'count': 3}, body['data'])
+
+    def test_body_size_cap(self):
+        response = self.fetch('/streamed', method='POST',
+                              body='{"count": "%s"}' % ('x' * 100),
+                              headers={'Content-Type': 'application/json'})
+        self.assertEqual(413, response.code)
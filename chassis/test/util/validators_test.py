@@ -1,6 +1,12 @@
 """Test Utility Encoders."""
 # pylint: disable=missing-docstring
 
+import re
+import time
+import unittest
+
+import mock
+
 from chassis import test
 from chassis.util import validators
 
@@ -257,3 +263,281 @@ class TestNumber(test.TestCase):
         self.assertRaises(validators.ValidationError,
                           validator.validate,
                           42.91, None)
+
+
+class TestEnum(test.TestCase):
+
+    def test_choices(self):
+        validator = validators.Enum(['red', 'green', 3])
+
+        self.assertEqual('red', validator.validate('red', None))
+        self.assertEqual(3, validator.validate(3, None))
+
+        for value in ('blue', '3', None, [], {}):
+            self.assertRaises(validators.ValidationError,
+                              validator.validate,
+                              value, None)
+
+    def test_unhashable_choices(self):
+        validator = validators.Enum([[1, 2], {'a': 1}])
+
+        self.assertEqual([1, 2], validator.validate([1, 2], None))
+        self.assertRaises(validators.ValidationError,
+                          validator.validate,
+                          [2, 1], None)
+
+
+class TestList(test.TestCase):
+
+    def test_joined_string(self):
+        validator = validators.List(validators.Integer())
+
+        self.assertEqual([1, 2, 3], validator.validate('1,2,3', None))
+        self.assertEqual([], validator.validate('', None))
+        self.assertEqual([4], validator.validate([4.0], None))
+
+        self.assertRaises(validators.ValidationError,
+                          validator.validate,
+                          {'a': 1}, None)
+
+    def test_lengths(self):
+        validator = validators.List(min_length=1, max_length=2,
+                                    separator='|')
+
+        self.assertEqual(['a', 'b'], validator.validate('a|b', None))
+
+        self.assertRaises(validators.ValidationError,
+                          validator.validate,
+                          [], None)
+        self.assertRaises(validators.ValidationError,
+                          validator.validate,
+                          'a|b|c', None)
+
+    def test_invalid_item(self):
+        validator = validators.List([validators.String(),
+                                     validators.Integer(maximum=10)])
+
+        self.assertEqual([1, 10], validator.validate(['1', '10'], None))
+        try:
+            validator.validate(['1', '11', '2'], None)
+        except validators.ValidationError as err:
+            self.assertEqual((1, ), err.path)
+            self.assertEqual('Valid integer required.', err.args[0])
+        else:
+            self.fail('ValidationError not raised')
+
+
+class TestDict(test.TestCase):
+
+    def setUp(self):
+        self.validator = validators.Dict({
+            'name': validators.String(min_length=1),
+            'tags': validators.List(validators.Enum(['a', 'b'])),
+            'address': validators.Dict({'zip': validators.Regex(r'\d{5}')},
+                                       required=['zip'])
+            }, required=['name'])
+
+    def test_valid(self):
+        self.assertEqual(
+            {'name': 'Spam', 'tags': ['a'], 'address': {'zip': '10001'}},
+            self.validator.validate({'name': 'Spam', 'tags': 'a',
+                                     'address': {'zip': '10001'},
+                                     'extra': True}, None))
+        self.assertEqual({'name': 'Spam'},
+                         self.validator.validate({'name': 'Spam'}, None))
+
+    def test_invalid(self):
+        cases = (
+            ({'tags': []}, ('name', ), 'Required.'),
+            ({'name': 'Spam', 'tags': ['a', 'c']}, ('tags', 1),
+             'Valid choice required.'),
+            ({'name': 'Spam', 'address': {}}, ('address', 'zip'),
+             'Required.'),
+            ([], (), 'Valid object required.'))
+        for (value, path, message) in cases:
+            try:
+                self.validator.validate(value, None)
+            except validators.ValidationError as err:
+                self.assertEqual(path, err.path)
+                self.assertEqual(message, err.args[0])
+            else:
+                self.fail('ValidationError not raised for %r' % (value, ))
+
+    def test_format_path(self):
+        self.assertEqual('.tags[1].name',
+                         validators.format_path(('tags', 1, 'name')))
+
+
+class TestOneOf(test.TestCase):
+
+    def test_first_passing(self):
+        validator = validators.OneOf(validators.Integer(),
+                                     validators.Boolean())
+
+        self.assertEqual(3, validator.validate('3', None))
+        self.assertEqual(True, validator.validate('yes', None))
+
+        self.assertRaisesWithMessage(validators.ValidationError,
+                                     'Valid value required.',
+                                     validator.validate,
+                                     'maybe', None)
+
+    def test_compiled(self):
+        validator = validators.List(validators.OneOf(validators.Integer()))
+        compiled = validators.compile_validator(validator)
+
+        self.assertEqual([1, 2], compiled(['1', 2], None))
+        self.assertEqual(validator.validate('1', None), compiled('1', None))
+
+
+class TestValidateMany(test.TestCase):
+
+    def assertMatchesValidate(self, validator, values):
+        expected = []
+        failures = []
+        for index, value in enumerate(values):
+            try:
+                expected.append(validator.validate(value, None))
+            except validators.ValidationError:
+                expected.append(None)
+                failures.append(index)
+        self.assertEqual((expected, failures),
+                         validator.validate_many(values))
+
+    def test_scalar_validators(self):
+        cases = (
+            (validators.Boolean(), ['yes', 'N', 0, 'maybe', None]),
+            (validators.String(min_length=2, max_length=3),
+             ['a', 'ab', 'abcd', 3, u'abc']),
+            (validators.Regex(r'[a-z]+'), ['abc', 'ab1', 'x']),
+            (validators.Enum(['a', 1]), ['a', 1, 'b', [1]]),
+            (validators.Dict({'a': validators.Integer()}),
+             [{'a': '1'}, {'a': 'x'}, []]))
+        for (validator, values) in cases:
+            self.assertMatchesValidate(validator, values)
+
+    def test_subclasses_overriding_validate(self):
+        class Email(validators.String):
+            def validate(self, value, handler):
+                value = super(Email, self).validate(value, handler)
+                if '@' not in value:
+                    self.fail()
+                return value
+
+        class Short(validators.String):
+            pass
+
+        self.assertEqual((['a@b', None], [1]),
+                         Email().validate_many(['a@b', 'bob']))
+        self.assertRaises(validators.ValidationError,
+                          validators.List(Email()).validate, 'a@b,bob', None)
+        self.assertEqual((['ab', None], [1]),
+                         Short(max_length=2).validate_many(['ab', 'abc']))
+
+    def test_compiled_validators_are_not_recompiled(self):
+        validator = validators.Dict({'a': validators.Integer()})
+        validator.compile = lambda: self.fail('recompiled')
+        self.assertEqual(([{'a': 1}, None], [1]),
+                         validator.validate_many([{'a': '1'}, {'a': 'x'}]))
+
+    def test_numbers(self):
+        values = ['1', 2.5, '-3', 'x', 7, '1e3', 4.0]
+        for size in (1, validators.NUMPY_THRESHOLD):
+            batch = values * size
+            self.assertMatchesValidate(
+                validators.Number(minimum=-1, maximum=100), batch)
+            self.assertMatchesValidate(
+                validators.Integer(minimum=-3), batch)
+
+    def test_non_finite(self):
+        for size in (1, validators.NUMPY_THRESHOLD):
+            results, failures = validators.Integer().validate_many(
+                ['inf', 'nan', None, '2'] * size)
+            self.assertEqual([None, None, None, 2] * size, results)
+            self.assertEqual(3 * size, len(failures))
+
+    def test_regex_non_strings(self):
+        self.assertEqual(([None], [0]),
+                         validators.Regex('a').validate_many([1]))
+
+    def test_list_items_in_bulk(self):
+        validator = validators.List(validators.Integer(maximum=5))
+
+        self.assertEqual([1, 2], validator.validate('1,2', None))
+        try:
+            validator.validate(['1', '9', 'x'], None)
+        except validators.ValidationError as err:
+            self.assertEqual((1, ), err.path)
+            self.assertEqual('Valid integer required.', err.args[0])
+        else:
+            self.fail('ValidationError not raised')
+
+
+class TestRegexMatching(test.TestCase):
+
+    def test_fullmatch(self):
+        validator = validators.Regex('a|ab')
+
+        # match() would stop at 'a'
+        self.assertEqual('ab', validator.validate('ab', None))
+        self.assertRaises(validators.ValidationError,
+                          validator.validate,
+                          'abc', None)
+        self.assertRaises(validators.ValidationError,
+                          validator.validate,
+                          3, None)
+
+    def test_shared_patterns(self):
+        first = validators.Regex('[a-z]+', re.IGNORECASE)
+        second = validators.Regex('[a-z]+', re.IGNORECASE)
+
+        self.assertIs(first.fullmatch, second.fullmatch)
+        self.assertIsNot(first.fullmatch, validators.Regex('[a-z]+').fullmatch)
+        self.assertEqual('ABC', second.validate('ABC', None))
+
+    def test_max_length(self):
+        validator = validators.Regex('a+', max_length=3)
+
+        self.assertEqual('aaa', validator.validate('aaa', None))
+        self.assertRaises(validators.ValidationError,
+                          validator.validate,
+                          'aaaa', None)
+        self.assertEqual((['a', None], [1]),
+                         validator.validate_many(['a', 'aaaa']))
+
+    @unittest.skipIf(validators.re2 is None, 're2 unavailable')
+    def test_bounded(self):
+        validator = validators.Regex('(a+)+b', bounded=True)
+
+        # Backtracks exponentially with re: seconds on 26 characters
+        start = time.time()
+        self.assertRaises(validators.ValidationError,
+                          validator.validate,
+                          'a' * 5000 + 'c', None)
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual('aab', validator.validate('aab', None))
+
+        # re2 does not support backreferences
+        self.assertRaises(ValueError, validators.Regex, r'(a)\1',
+                          bounded=True)
+        self.assertRaises(ValueError, validators.Regex, 'a', re.I,
+                          bounded=True)
+
+    def test_bounded_requires_re2(self):
+        with mock.patch.object(validators, 're2', None):
+            self.assertRaises(ImportError, validators.Regex, 'a',
+                              bounded=True)
+
+
+class TestNonStringNumbers(test.TestCase):
+
+    def test_invalid_types(self):
+        for validator in (validators.Number(), validators.Integer()):
+            for value in (None, [1], {}, 10 ** 400):
+                self.assertRaises(validators.ValidationError,
+                                  validator.validate,
+                                  value, None)
+        for value in (float('inf'), float('nan')):
+            self.assertRaises(validators.ValidationError,
+                              validators.Integer().validate,
+                              value, None)
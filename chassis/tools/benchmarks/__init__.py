@@ -0,0 +1,44 @@
+"""Benchmarks for Chassis.
+
+Each module is a script. Run it from the repository root against a local
+Redis (or Redis stand-in) with:
+
+    python -m chassis.tools.benchmarks.<module> [--host HOST] [--port PORT]
+"""
+
+import argparse
+import timeit
+
+import six
+
+
+def argument_parser(description):
+    """Return an argument parser with the common Redis options."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=15,
+                        help='Redis database to use; it is flushed.')
+    parser.add_argument('-n', '--number', type=int, default=10000,
+                        help='Number of iterations per benchmark.')
+    return parser
+
+
+def redis_settings(arguments):
+    """Build Cache settings from parsed arguments."""
+    return {'host': arguments.host,
+            'port': arguments.port,
+            'db': arguments.db}
+
+
+def report(name, number, seconds, unit='ops'):
+    """Print one benchmark result line."""
+    six.print_('%-48s %10d %s %9.3fs %12.1f %s/s'
+               % (name, number, unit, seconds, number / seconds, unit))
+
+
+def run(name, func, number, unit='ops'):
+    """Time `number` calls of func and report the rate."""
+    seconds = timeit.timeit(func, number=number)
+    report(name, number, seconds, unit)
+    return seconds
@@ -0,0 +1,86 @@
+"""Requests/sec of handlers using the sync and async cache helpers.
+
+Starts a Tornado server with one handler per path and drives it with
+`--concurrency` simultaneous clients:
+
+    python -m chassis.tools.benchmarks.cache_async --concurrency 50
+"""
+# pylint: disable=abstract-method, arguments-differ
+
+import time
+
+from tornado import gen, httpclient, httpserver, ioloop, testing, web
+
+from chassis.services import cache
+from chassis.services.cache import asynchronous
+from chassis.tools import benchmarks
+
+KEY = 'benchmark:user:342:username'
+
+
+class SyncHandler(web.RequestHandler):
+    """Reads the key with the blocking helper."""
+
+    def get(self):
+        self.write(cache.get_value(self.application.settings['cache'], KEY))
+
+
+class AsyncHandler(web.RequestHandler):
+    """Reads the key with the coroutine helper."""
+
+    @gen.coroutine
+    def get(self):
+        value = yield asynchronous.get_value(
+            self.application.settings['async_cache'], KEY)
+        self.write(value)
+
+
+@gen.coroutine
+def drive(url, number, concurrency):
+    """Issue `number` GETs to url, `concurrency` at a time."""
+    client = httpclient.AsyncHTTPClient(max_clients=concurrency)
+    remaining = [number]
+
+    @gen.coroutine
+    def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            yield client.fetch(url)
+
+    yield [worker() for _ in range(concurrency)]
+
+
+@gen.coroutine
+def main(arguments):
+    """Run the sync and async handler benchmarks."""
+    settings = benchmarks.redis_settings(arguments)
+    sync_cache = cache.Cache(settings)
+    async_cache = asynchronous.AsyncCache(settings)
+    cache.set_value(sync_cache, KEY, 'bob')
+
+    application = web.Application([('/sync', SyncHandler),
+                                   ('/async', AsyncHandler)],
+                                  cache=sync_cache,
+                                  async_cache=async_cache)
+    sock, port = testing.bind_unused_port()
+    server = httpserver.HTTPServer(application)
+    server.add_sockets([sock])
+
+    for path in ('/sync', '/async'):
+        url = 'http://127.0.0.1:%d%s' % (port, path)
+        start = time.time()
+        yield drive(url, arguments.number, arguments.concurrency)
+        benchmarks.report('GET %s (concurrency %d)'
+                          % (path, arguments.concurrency),
+                          arguments.number, time.time() - start, 'req')
+
+    server.stop()
+    with sync_cache as redis_connection:
+        redis_connection.flushdb()
+
+
+if __name__ == '__main__':
+    PARSER = benchmarks.argument_parser(__doc__)
+    PARSER.add_argument('-c', '--concurrency', type=int, default=20)
+    PARSER.set_defaults(number=2000)
+    ioloop.IOLoop.current().run_sync(lambda: main(PARSER.parse_args()))
@@ -0,0 +1,62 @@
+"""Per-entity retrieve_object/set_object against the batched helpers.
+
+Reads and writes a page of `--objects` users the way a list endpoint does.
+The per-entity helpers make one round trip per user; the batched helpers
+make one per page:
+
+    python -m chassis.tools.benchmarks.cache_batch --objects 200
+"""
+
+from chassis.services import cache
+from chassis.tools import benchmarks
+
+TEMPLATE = {'username': 'benchmark:user:%(id)s:username',
+            'email': 'benchmark:user:%(id)s:email',
+            'phone': 'benchmark:user:%(id)s:phone'}
+
+
+def main(arguments):
+    """Run the per-entity and batched benchmarks."""
+    users = cache.Cache(benchmarks.redis_settings(arguments))
+    list_of_indexes = [{'id': user_id}
+                       for user_id in range(arguments.objects)]
+    list_of_data = [{'username': 'user%d' % user_id,
+                     'email': 'user%d@example.com' % user_id,
+                     'phone': '555-555-%04d' % user_id}
+                    for user_id in range(arguments.objects)]
+    pages = max(1, arguments.number // arguments.objects)
+
+    def set_each():
+        for (indexes, data) in zip(list_of_indexes, list_of_data):
+            cache.set_object(users, TEMPLATE, indexes, data)
+
+    def set_batched():
+        cache.set_objects(users, TEMPLATE, list_of_indexes, list_of_data,
+                          chunk_size=arguments.chunk_size)
+
+    def retrieve_each():
+        return [cache.retrieve_object(users, TEMPLATE, indexes)
+                for indexes in list_of_indexes]
+
+    def retrieve_batched():
+        return cache.retrieve_objects(users, TEMPLATE, list_of_indexes,
+                                      chunk_size=arguments.chunk_size)
+
+    name = '%%s (%d objects, %%d round trips)' % arguments.objects
+    benchmarks.run(name % ('set_object', arguments.objects),
+                   set_each, pages, 'pages')
+    benchmarks.run(name % ('set_objects', 1), set_batched, pages, 'pages')
+    benchmarks.run(name % ('retrieve_object', arguments.objects),
+                   retrieve_each, pages, 'pages')
+    benchmarks.run(name % ('retrieve_objects', 1),
+                   retrieve_batched, pages, 'pages')
+
+    with users as redis_connection:
+        redis_connection.flushdb()
+
+
+if __name__ == '__main__':
+    PARSER = benchmarks.argument_parser(__doc__)
+    PARSER.add_argument('--objects', type=int, default=200)
+    PARSER.add_argument('--chunk-size', type=int, default=None)
+    main(PARSER.parse_args())
@@ -0,0 +1,43 @@
+"""Key generation throughput of template dictionaries and CompiledTemplate.
+
+Times building the redis keys of an object (as retrieve_object and
+delete_object do) and its write items (as set_object does) for string and
+hash layouts. Redis is not used:
+
+    python -m chassis.tools.benchmarks.cache_keys --fields 5
+"""
+# pylint: disable=protected-access
+
+from chassis.services import cache
+from chassis.tools import benchmarks
+
+
+def main(arguments):
+    """Run the key generation benchmarks."""
+    fields = ['field%d' % number for number in range(arguments.fields)]
+    strings = dict((field, 'benchmark:user:%%(id)s:%s' % field)
+                   for field in fields)
+    hashed = cache.Template.hash('benchmark:user:%(id)s', fields)
+    data = dict((field, 'value') for field in fields)
+    indexes = {'id': 342}
+
+    templates = (('strings dict', strings),
+                 ('strings compiled', cache.CompiledTemplate(strings)),
+                 ('hash Template', hashed),
+                 ('hash compiled', cache.CompiledTemplate.compile(hashed)))
+    for (name, template) in templates:
+        def object_keys(template=template):
+            cache._object_keys(template, indexes)
+
+        def object_values(template=template):
+            cache._object_values(template, indexes, data)
+
+        benchmarks.run('%s keys' % name, object_keys, arguments.number)
+        benchmarks.run('%s values' % name, object_values, arguments.number)
+
+
+if __name__ == '__main__':
+    PARSER = benchmarks.argument_parser(__doc__)
+    PARSER.add_argument('--fields', type=int, default=5)
+    PARSER.set_defaults(number=200000)
+    main(PARSER.parse_args())
@@ -0,0 +1,79 @@
+"""Memory and latency of string-per-field and hash object layouts.
+
+Writes `--objects` users with each layout and reports the growth of Redis'
+used_memory, then times set_object and retrieve_object:
+
+    python -m chassis.tools.benchmarks.cache_layout --objects 10000
+"""
+
+import redis
+import six
+
+from chassis.services import cache
+from chassis.tools import benchmarks
+
+FIELDS = ('username', 'email', 'phone', 'created', 'status')
+
+LAYOUTS = (
+    ('strings', cache.Template(dict(
+        (field, 'benchmark:user:%%(id)s:%s' % field) for field in FIELDS))),
+    ('hash', cache.Template.hash('benchmark:user:%(id)s', FIELDS)),
+)
+
+
+def used_memory(users):
+    """Return Redis' used_memory in bytes, or None if not reported."""
+    with users as redis_connection:
+        try:
+            return redis_connection.info('memory').get('used_memory')
+        except redis.ResponseError:
+            # Redis stand-ins may not support INFO; start from fresh
+            # connections in case the error left one in a bad state.
+            redis_connection.connection_pool.disconnect()
+            return None
+
+
+def main(arguments):
+    """Run the layout benchmarks."""
+    users = cache.Cache(benchmarks.redis_settings(arguments))
+    list_of_indexes = [{'id': user_id}
+                       for user_id in range(arguments.objects)]
+    list_of_data = [dict((field, '%s-%d' % (field, user_id))
+                         for field in FIELDS)
+                    for user_id in range(arguments.objects)]
+
+    for (name, template) in LAYOUTS:
+        with users as redis_connection:
+            redis_connection.flushdb()
+        before = used_memory(users)
+        cache.set_objects(users, template, list_of_indexes, list_of_data,
+                          chunk_size=1000)
+        after = used_memory(users)
+        if before is None or after is None:
+            six.print_('%-48s used_memory not reported'
+                       % ('%s memory' % name))
+        else:
+            six.print_('%-48s %10d bytes/object'
+                       % ('%s memory' % name,
+                          (after - before) // arguments.objects))
+
+        def set_one(template=template):
+            cache.set_object(users, template, list_of_indexes[0],
+                             list_of_data[0])
+
+        def retrieve_one(template=template):
+            cache.retrieve_object(users, template, list_of_indexes[0])
+
+        benchmarks.run('%s set_object' % name, set_one, arguments.number)
+        benchmarks.run('%s retrieve_object' % name, retrieve_one,
+                       arguments.number)
+
+    with users as redis_connection:
+        redis_connection.flushdb()
+
+
+if __name__ == '__main__':
+    PARSER = benchmarks.argument_parser(__doc__)
+    PARSER.add_argument('--objects', type=int, default=10000)
+    PARSER.set_defaults(number=2000)
+    main(PARSER.parse_args())
@@ -0,0 +1,52 @@
+"""Overhead of Cache metrics.
+
+Times get_value and retrieve_object with and without a Metrics instance,
+then prints the collected metrics in the Prometheus text format:
+
+    python -m chassis.tools.benchmarks.cache_metrics
+"""
+
+import six
+
+from chassis.services import cache
+from chassis.services import metrics
+from chassis.tools import benchmarks
+
+TEMPLATE = {'username': 'benchmark:user:%(id)s:username',
+            'email': 'benchmark:user:%(id)s:email',
+            'phone': 'benchmark:user:%(id)s:phone'}
+
+INDEXES = {'id': 1}
+
+
+def main(arguments):
+    """Run the metrics overhead benchmarks."""
+    settings = benchmarks.redis_settings(arguments)
+    cache_metrics = metrics.Metrics()
+    caches = (('plain', cache.Cache(settings)),
+              ('instrumented', cache.Cache(settings, metrics=cache_metrics)))
+    cache.set_value(caches[0][1], 'benchmark:value', 'value')
+    cache.set_object(caches[0][1], TEMPLATE, INDEXES,
+                     {'username': 'Bob', 'email': 'bob@example.com',
+                      'phone': '555-555-5555'})
+
+    for (name, users) in caches:
+        def get_one(users=users):
+            cache.get_value(users, 'benchmark:value')
+
+        def retrieve_one(users=users):
+            cache.retrieve_object(users, TEMPLATE, INDEXES)
+
+        benchmarks.run('%s get_value' % name, get_one, arguments.number)
+        benchmarks.run('%s retrieve_object' % name, retrieve_one,
+                       arguments.number)
+
+    six.print_()
+    six.print_(metrics.prometheus_text(cache_metrics.snapshot(), 'cache'))
+
+    with caches[0][1] as redis_connection:
+        redis_connection.flushdb()
+
+
+if __name__ == '__main__':
+    main(benchmarks.argument_parser(__doc__).parse_args())
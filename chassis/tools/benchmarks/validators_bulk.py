@@ -0,0 +1,57 @@
+"""Batch validation with validate_many against one validate call per value.
+
+Times validating batches of query-string numbers and strings, a tenth of
+them invalid, by calling validate once per value and catching the
+ValidationErrors, as bulk endpoints did, and with validate_many. NumPy is
+used for Number and Integer batches when installed. Redis is not used:
+
+    python -m chassis.tools.benchmarks.validators_bulk --size 1000
+"""
+
+import timeit
+
+from chassis.tools import benchmarks
+from chassis.util import validators
+
+
+def per_value(validator, values):
+    """Validate values one call at a time, collecting failures."""
+    results = []
+    failures = []
+    for index, value in enumerate(values):
+        try:
+            results.append(validator.validate(value, None))
+        except validators.ValidationError:
+            results.append(None)
+            failures.append(index)
+    return results, failures
+
+
+def main(arguments):
+    """Run the batch validation benchmarks."""
+    size = arguments.size
+    numbers = [str(number) if number % 10 else 'x%d' % number
+               for number in range(size)]
+    strings = ['value%d' % number if number % 10 else 'x' * 100
+               for number in range(size)]
+    cases = (('Number', validators.Number(minimum=0), numbers),
+             ('Integer', validators.Integer(maximum=size), numbers),
+             ('String', validators.String(max_length=64), strings))
+    number = max(1, arguments.number // size)
+    for (name, validator, values) in cases:
+        for (mode, func) in (('validate', per_value),
+                             ('validate_many',
+                              lambda validator, values:
+                              validator.validate_many(values))):
+            seconds = timeit.timeit(
+                lambda func=func, validator=validator, values=values:
+                func(validator, values), number=number)
+            benchmarks.report('%s %s' % (name, mode), number * size,
+                              seconds, unit='values')
+
+
+if __name__ == '__main__':
+    PARSER = benchmarks.argument_parser(__doc__)
+    PARSER.add_argument('--size', type=int, default=1000)
+    PARSER.set_defaults(number=500000)
+    main(PARSER.parse_args())
@@ -0,0 +1,71 @@
+"""Throughput of the nested validators of chassis.util.validators.
+
+Times validating wide payloads (lists of 10, 100 and 1000 objects of a few
+fields each) and deep payloads (objects nested 5, 20 and 50 levels) with
+compiled List and Dict schemas, reporting items validated per second so
+that the cost per item can be compared across sizes. Redis is not used:
+
+    python -m chassis.tools.benchmarks.validators_nested --widths 10 1000
+"""
+
+import timeit
+
+from chassis.tools import benchmarks
+from chassis.util import validators
+
+
+def wide(width):
+    """Return a schema of a list of width objects, and a payload."""
+    schema = validators.List(validators.Dict({
+        'id': validators.Integer(minimum=0),
+        'name': validators.String(max_length=64),
+        'kind': validators.Enum(['user', 'group']),
+        'active': validators.Boolean(),
+        'score': validators.OneOf(validators.Number(), validators.Enum([''])),
+        }, required=['id', 'name']), max_length=width)
+    payload = [{'id': number, 'name': 'name%d' % number, 'kind': 'user',
+                'active': 'true', 'score': '1.5'}
+               for number in range(width)]
+    return schema, payload
+
+
+def deep(depth):
+    """Return a schema of objects nested depth levels, and a payload."""
+    schema = validators.Dict({'value': validators.Integer()})
+    payload = {'value': '1'}
+    for _ in range(depth - 1):
+        schema = validators.Dict({'value': validators.Integer(),
+                                  'child': schema})
+        payload = {'value': '1', 'child': payload}
+    return schema, payload
+
+
+def main(arguments):
+    """Run the nested validator benchmarks."""
+    for width in arguments.widths:
+        schema, payload = wide(width)
+        number = max(1, arguments.number // width)
+        benchmarks.report(
+            'wide %d objects' % width, number * width,
+            timeit.timeit(
+                lambda schema=schema, payload=payload:
+                schema.validate(payload, None), number=number),
+            unit='items')
+    for depth in arguments.depths:
+        schema, payload = deep(depth)
+        number = max(1, arguments.number // depth)
+        benchmarks.report(
+            'deep %d levels' % depth, number * depth,
+            timeit.timeit(
+                lambda schema=schema, payload=payload:
+                schema.validate(payload, None), number=number),
+            unit='items')
+
+
+if __name__ == '__main__':
+    PARSER = benchmarks.argument_parser(__doc__)
+    PARSER.add_argument('--widths', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    PARSER.add_argument('--depths', type=int, nargs='+', default=[5, 20, 50])
+    PARSER.set_defaults(number=200000)
+    main(PARSER.parse_args())
@@ -1,11 +1,57 @@
 """Utility Parameter Tools for Chassis Applications."""
 
+import json
+
 import six
 from tornado import web
 
 from chassis.util import decorators
 from chassis.util import validators
 
+try:
+    import orjson as fast_json
+except ImportError:
+    try:
+        import ujson as fast_json
+    except ImportError:
+        fast_json = None
+
+# Decodes JSON request bodies: orjson or ujson when installed.
+json_loads = json.loads if fast_json is None else fast_json.loads
+
+
+def is_json(handler):
+    """Return whether the request's body is JSON, by its content type."""
+    media_type = handler.request.headers.get('Content-Type', '')
+    media_type = media_type.split(';', 1)[0].strip().lower()
+    return media_type == 'application/json' or media_type.endswith('+json')
+
+
+def json_body(handler):
+    """Return the decoded JSON body of the handler's request.
+
+    The body is decoded once per request and cached on the handler, so
+    handlers calling this after parse or parse_dict do not decode it again.
+    Handlers streaming their body with JSONStreamMixin are decoded from the
+    streamed chunks. Raises a ParameterError if the body is not a JSON
+    object.
+    """
+    # pylint: disable=protected-access
+    body = getattr(handler, '_json_body', None)
+    if body is None:
+        if isinstance(handler, JSONStreamMixin):
+            raw = handler.streamed_body()
+        else:
+            raw = handler.request.body
+        try:
+            body = json_loads(raw) if raw else {}
+        except ValueError:
+            raise ParameterError([('body', 'Valid JSON required.')])
+        if not isinstance(body, dict):
+            raise ParameterError([('body', 'JSON object required.')])
+        handler._json_body = body
+    return body
+
 
 def _fetch_arguments(handler, method):
     """Get the arguments depending on the type of HTTP method."""
@@ -17,72 +63,219 @@ def _fetch_arguments(handler, method):
             # parameters. We're undoing that here, and if a list
             # is expected the _validate method can handle it.
             if isinstance(value, list):
-                arguments[key] = ','.join(value)
+                arguments[key] = ','.join(
+                    handler.decode_argument(item, key)
+                    if isinstance(item, six.binary_type) else item
+                    for item in value)
             else:
                 arguments[key] = value
+    elif is_json(handler):
+        arguments = json_body(handler)
     else:  # post, put, patch, delete?
         arguments = handler.get_post_arguments()
 
     return arguments
 
 
-def _apply_validator_chain(chain, value, handler):
-    """Apply validators in sequence to a value."""
+def _invalid_validator(unused_value, unused_handler):
+    """Stand in for a declared validator lacking a validate method."""
+    raise web.HTTPError(500)
+
+
+def _compile_chain(chain):
+    """Return the compiled validators of a validator, or list of
+    validators, as a tuple applied in sequence."""
 
     if hasattr(chain, 'validate'):  # not a list
         chain = [chain, ]
 
-    for validator in chain:
-        if hasattr(validator, 'validate'):
-            value = validator.validate(value, handler)
+    return tuple(validators.compile_validator(validator)
+                 if hasattr(validator, 'validate')
+                 else _invalid_validator for validator in chain)
+
+
+MISSING = 'Missing required parameter'
+
+
+class ParameterError(web.HTTPError):
+    """Raised with a 400 status when parameters are missing or invalid.
+
+    Attributes:
+        errors: list of (parameter name, message) tuples.
+
+    """
+
+    def __init__(self, errors):
+        super(ParameterError, self).__init__(
+            400, 'Invalid parameters: %s',
+            ', '.join('%s (%s)' % error for error in errors))
+        self.errors = errors
+
+    def body(self):
+        """Return the JSON-serializable body describing the errors."""
+        return {'errors': [{'parameter': name, 'message': message}
+                           for (name, message) in self.errors]}
+
+
+class ParameterErrorMixin(object):
+    """RequestHandler mixin rendering ParameterErrors as JSON bodies:
+
+        {"errors": [{"parameter": "email", "message": "..."}]}
+
+    Other errors are rendered by the next write_error in line.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def write_error(self, status_code, **kwargs):
+        """Write the body of a ParameterError, or defer to the handler."""
+        error = kwargs.get('exc_info', (None, None))[1]
+        if isinstance(error, ParameterError):
+            self.finish(error.body())
         else:
-            raise web.HTTPError(500)
-    return value
+            super(ParameterErrorMixin, self).write_error(status_code,
+                                                         **kwargs)
+
+
+class JSONStreamMixin(object):
+    """RequestHandler mixin receiving a JSON body in chunks.
+
+    Use it with tornado.web.stream_request_body so that large uploads are
+    not buffered by Tornado before the handler runs:
+
+        @web.stream_request_body
+        class Upload(JSONStreamMixin, web.RequestHandler):
+            max_body_size = 10 * 1024 * 1024
+
+            @params.parse_dict([('items', {'required': True})])
+            def post(self, data):
+                ...
+
+    Chunks are kept as they arrive and decoded once, by json_body, when
+    the handler method parses its parameters. A request whose
+    Content-Length, or whose body as received, exceeds max_body_size bytes
+    is refused with a 413 as soon as that is known.
+    """
+
+    max_body_size = 1024 * 1024
+
+    _chunks = None
+
+    _received = 0
+
+    def prepare(self):
+        """Refuse bodies announced as too large, and let Tornado accept
+        bodies up to max_body_size."""
+        length = self.request.headers.get('Content-Length')
+        if length is not None and int(length) > self.max_body_size:
+            raise web.HTTPError(413, 'Request body too large')
+        self.request.connection.set_max_body_size(self.max_body_size)
+        self._chunks = []
+        self._received = 0
+
+    def data_received(self, chunk):
+        """Keep a chunk of the body."""
+        self._received += len(chunk)
+        if self._received > self.max_body_size:
+            raise web.HTTPError(413, 'Request body too large')
+        self._chunks.append(chunk)
+
+    def streamed_body(self):
+        """Return the body received so far."""
+        return b''.join(self._chunks or ())
+
+
+class ParameterPlan(object):
+    """A list of parameter declarations compiled for parsing.
+
+    parse and parse_dict compile their declarations once, when decorating
+    a method, so that parsing a request only walks flat tuples.
+
+    Attributes:
+        fields: tuple of (name, compiled validators, default) per parameter,
+            in declaration order.
+        required: tuple of the names of the required parameters.
+        fail_fast: whether parsing stops at the first error instead of
+            collecting the errors of every parameter.
+
+    """
+    # pylint: disable=too-few-public-methods
+
+    __slots__ = ('fields', 'required', 'fail_fast')
+
+    def __init__(self, parameters, fail_fast=False):
+        self.fields = tuple(
+            (key, _compile_chain(properties.get('validators', [])),
+             properties.get('default'))
+            for key, properties in parameters)
+        self.required = tuple(key for key, properties in parameters
+                              if properties.get('required', False))
+        self.fail_fast = fail_fast
+
+
+def compile_parameters(parameters, fail_fast=False):
+    """Return the ParameterPlan of a list of parameter declarations."""
+    if isinstance(parameters, ParameterPlan):
+        return parameters
+    return ParameterPlan(parameters, fail_fast)
 
 
 def _parse_arguments(self, method, parameters):
-    """Parse arguments to method, returning a dictionary."""
+    """Parse arguments to method, returning a dictionary.
+
+    parameters is a ParameterPlan, or a list of declarations to compile.
+    Raises a ParameterError listing the missing and invalid parameters, or
+    only the first of them when the plan fails fast.
+    """
 
     # TODO: Consider raising an exception if there are extra arguments.
 
+    plan = compile_parameters(parameters)
     arguments = _fetch_arguments(self, method)
 
-    arg_dict = {}
     errors = []
-    for key, properties in parameters:
+    for key in plan.required:
+        if key not in arguments:
+            errors.append((key, MISSING))
+            if plan.fail_fast:
+                raise ParameterError(errors)
+
+    arg_dict = {}
+    for key, chain, default in plan.fields:
         if key in arguments:
             value = arguments[key]
             try:
-                arg_dict[key] = _apply_validator_chain(
-                    properties.get('validators', []), value, self)
+                for validate in chain:
+                    value = validate(value, self)
             except validators.ValidationError as err:
-                errors.append(err)
-        else:
-            if properties.get('required', False):
-                raise web.HTTPError(
-                    400,
-                    ('Missing required parameter: %s'
-                     % (key, ))
-                    )
+                errors.append((key + validators.format_path(err.path),
+                               err.args[0] if err.args
+                               else 'Validation failed.'))
+                if plan.fail_fast:
+                    break
             else:
-                if properties.get('default', None) is not None:
-                    arg_dict[key] = properties['default']
-                else:
-                    arg_dict[key] = None
+                arg_dict[key] = value
+        else:
+            arg_dict[key] = default
     if errors:
-        raise web.HTTPError(400, 'There were %s errors' % len(errors))
+        raise ParameterError(errors)
 
     return arg_dict
 
 
-def parse(parameters):
+def parse(parameters, fail_fast=False):
     """Decorator to parse parameters according to a set of criteria.
 
-    This outer method is called to set up the decorator.
+    This outer method is called to set up the decorator. Parameters are
+    read from the query string of GET requests, and from the body of other
+    requests, decoded as JSON when its content type is JSON (see
+    json_body).
 
     Arguments:
         parameters: An array of parameter declarations tuples in the format:
         ('<param_name>', {'validate': [<ValidatorClass>,...], <options...>})
+        fail_fast: stop at the first missing or invalid parameter, rather
+        than reporting all of them in the ParameterError (see
+        ParameterErrorMixin).
 
     Usage:
 
@@ -99,10 +292,12 @@ def parse(parameters):
     def decorate(method):
         """Setup returns this decorator, which is called on the method."""
 
+        plan = compile_parameters(parameters, fail_fast)
+
         def call(self, *args):
             """This is called whenever the decorated method is invoked."""
 
-            kwargs = _parse_arguments(self, method, parameters)
+            kwargs = _parse_arguments(self, method, plan)
             return method(self, *args, **kwargs)
 
         # TODO: Autogenerate documentation data for parameters.
@@ -111,14 +306,20 @@ def parse(parameters):
     return decorate
 
 
-def parse_dict(parameters):
+def parse_dict(parameters, fail_fast=False):
     """Decorator to parse parameters as a dict according to a set of criteria.
 
-    This outer method is called to set up the decorator.
+    This outer method is called to set up the decorator. Parameters are
+    read from the query string of GET requests, and from the body of other
+    requests, decoded as JSON when its content type is JSON (see
+    json_body).
 
     Arguments:
         parameters: An array of parameter declarations tuples in the format:
         ('<param_name>', {'validate': [<ValidatorClass>,...], <options...>})
+        fail_fast: stop at the first missing or invalid parameter, rather
+        than reporting all of them in the ParameterError (see
+        ParameterErrorMixin).
 
     Usage:
 
@@ -136,10 +337,12 @@ def parse_dict(parameters):
     def decorate(method):
         """Setup returns this decorator, which is called on the method."""
 
+        plan = compile_parameters(parameters, fail_fast)
+
         def call(self, *args):
             """This is called whenever the decorated method is invoked."""
 
-            arg_dict = _parse_arguments(self, method, parameters)
+            arg_dict = _parse_arguments(self, method, plan)
             return method(self, *args, data=arg_dict)
 
         # TODO: Autogenerate documentation data for parameters.
@@ -1,11 +1,44 @@
 """Parameter Parsing and Validation for Chassis Applications."""
 
+import functools
 import re
 import six
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# Batches from which Number and Integer.validate_many use NumPy, if
+# installed; below it the conversion costs more than it saves.
+NUMPY_THRESHOLD = 64
+
 
 class ValidationError(Exception):
-    """Raised when validation fails."""
+    """Raised when validation fails.
+
+    path holds the keys and indexes leading to the invalid value when it
+    is nested in lists and dictionaries; see format_path.
+    """
+
+    path = ()
+
+
+def format_path(path):
+    """Format the path of a ValidationError, e.g. "[3].name"."""
+    return ''.join('[%d]' % step if isinstance(step, int) else '.%s' % step
+                   for step in path)
+
+
+def _nested(err, step):
+    """Prepend a step to the path of err and return it."""
+    err.path = (step, ) + err.path
+    return err
 
 
 class BaseValidator(object):
@@ -27,6 +60,114 @@ class BaseValidator(object):
         """
         raise NotImplementedError
 
+    def compile(self):
+        """Return a callable(value, handler) validating like validate.
+
+        Validators nesting other validators override this to compile their
+        children once, into a single callable.
+        """
+        return self.validate
+
+    def validate_many(self, values, handler=None):
+        """Validate several values at once, without raising per value.
+
+        Returns (results, failures): the validated values, with None in
+        place of the invalid ones, and the ascending indexes of the invalid
+        values. Built-in validators override this with a loop that does not
+        raise at all, or bulk operations; their subclasses overriding
+        validate get this generic loop back, so that their checks run.
+        """
+        check = getattr(self, '_compiled', None) or self.compile()
+        results = []
+        failures = []
+        for index, value in enumerate(values):
+            try:
+                results.append(check(value, handler))
+            except ValidationError:
+                results.append(None)
+                failures.append(index)
+        return results, failures
+
+
+def _mirrors_validate(cls):
+    """Return whether the validate_many of a validator class was written
+    along with its validate: the first class of the MRO defining either
+    defines both."""
+    for klass in cls.__mro__:
+        if 'validate' in vars(klass) or 'validate_many' in vars(klass):
+            return 'validate' in vars(klass) and 'validate_many' in vars(klass)
+    return False
+
+
+def _bulk(validate_many):
+    """Decorate the validate_many of a built-in validator, which mirrors
+    its validate rather than calling it: instances of subclasses
+    overriding validate alone are validated by BaseValidator.validate_many
+    instead."""
+    @functools.wraps(validate_many)
+    def wrapper(self, values, handler=None):
+        if not _mirrors_validate(type(self)):
+            return BaseValidator.validate_many(self, values, handler)
+        return validate_many(self, values, handler)
+    return wrapper
+
+
+def _bulk_range(floats, failures, minimum, maximum, integral):
+    """Range check floats (None where conversion failed) for validate_many,
+    with NumPy on large batches when available. Returns (results,
+    failures); integral results are ints."""
+    if numpy is not None and len(floats) >= NUMPY_THRESHOLD:
+        array = numpy.array(floats, dtype=float)  # None becomes NaN
+        invalid = numpy.zeros(len(floats), dtype=bool)
+        invalid[failures] = True
+        if minimum is not None:
+            invalid |= array < minimum
+        if maximum is not None:
+            invalid |= array > maximum
+        if integral:
+            invalid |= ~numpy.isfinite(array)
+            invalid |= array != numpy.trunc(array)
+        failures = numpy.flatnonzero(invalid).tolist()
+        results = array.tolist()
+    else:
+        results = floats
+        failed = set(failures)
+        for index, value in enumerate(floats):
+            if index in failed:
+                continue
+            if ((minimum is not None and value < minimum) or
+                    (maximum is not None and value > maximum) or
+                    (integral and (value != value or
+                                   value in (float('inf'), float('-inf')) or
+                                   value != int(value)))):
+                failed.add(index)
+        failures = sorted(failed)
+    for index in failures:
+        results[index] = None
+    if integral:
+        results = [None if value is None else int(value)
+                   for value in results]
+    return results, failures
+
+
+def compile_validator(spec):
+    """Compile a validator, or a list of validators applied in sequence,
+    into a single callable(value, handler)."""
+    if isinstance(spec, BaseValidator):
+        return spec.compile()
+    if hasattr(spec, 'validate'):
+        return spec.validate
+    chain = tuple(compile_validator(validator) for validator in spec)
+    if len(chain) == 1:
+        return chain[0]
+
+    def check(value, handler):
+        """Apply the chain in sequence."""
+        for validate in chain:
+            value = validate(value, handler)
+        return value
+    return check
+
 
 class Boolean(BaseValidator):
     """Validates Boolean inputs for truthiness."""
@@ -51,6 +192,22 @@ class Boolean(BaseValidator):
 
         self.fail()
 
+    @_bulk
+    def validate_many(self, values, handler=None):
+        results = []
+        failures = []
+        for index, value in enumerate(values):
+            if isinstance(value, six.string_types):
+                value = value.lower()
+            if value in self.truthy:
+                results.append(True)
+            elif value in self.falsy:
+                results.append(False)
+            else:
+                results.append(None)
+                failures.append(index)
+        return results, failures
+
 
 class String(BaseValidator):
     """Validates strings with optional length requirements."""
@@ -81,25 +238,108 @@ class String(BaseValidator):
 
         return value
 
+    @_bulk
+    def validate_many(self, values, handler=None):
+        min_length = self.min_length or 0
+        max_length = self.max_length
+        results = []
+        failures = []
+        for index, value in enumerate(values):
+            if (isinstance(value, six.string_types) and
+                    len(value) >= min_length and
+                    (max_length is None or len(value) <= max_length)):
+                results.append(value)
+            else:
+                results.append(None)
+                failures.append(index)
+        return results, failures
+
+
+# (regex, flags, engine name) -> compiled pattern, shared by Regex validators.
+_PATTERNS = {}
+
+# Patterns cached at most; the cache is emptied when it grows beyond this.
+MAX_PATTERNS = 512
+
+
+def _compile_pattern(regex, flags, engine):
+    """Return the compiled fullmatch method of a regular expression, from
+    the process-wide cache."""
+    key = (regex, flags, engine.__name__)
+    fullmatch = _PATTERNS.get(key)
+    if fullmatch is None:
+        pattern = (engine.compile(regex, flags) if flags
+                   else engine.compile(regex))
+        fullmatch = getattr(pattern, 'fullmatch', None)
+        if fullmatch is None:  # Python < 3.4
+            fullmatch = engine.compile('(?:%s)\\Z' % regex, flags).match
+        if len(_PATTERNS) >= MAX_PATTERNS:
+            _PATTERNS.clear()
+        fullmatch = _PATTERNS.setdefault(key, fullmatch)
+    return fullmatch
+
 
 class Regex(BaseValidator):
-    """Validates a string agains a regular expression."""
+    """Validates a string matching a regular expression in full.
+
+    Compiled patterns are shared by every Regex validator in the process.
+    Values longer than max_length fail without being matched; capping the
+    length does not protect against patterns that backtrack exponentially,
+    which take seconds on a few dozen characters. With bounded=True, the
+    pattern is matched in linear time with the re2 module (google-re2),
+    which must be installed (raises ImportError otherwise), and must
+    support the pattern, without flags (raises ValueError otherwise, e.g.
+    for backreferences).
+    """
 
 
-    def __init__(self, regex):
+    def __init__(self, regex, flags=0, max_length=None, bounded=False):
         super(Regex, self).__init__()
         self.documentation = "Regex."
         self.message = "String matching regular expression required."
-        self.pattern = re.compile(regex)
+        self.regex = regex
+        self.flags = flags
+        self.max_length = max_length
+        if not bounded:
+            self.fullmatch = _compile_pattern(regex, flags, re)
+        elif re2 is None:
+            raise ImportError('bounded Regex validators require re2 '
+                              '(google-re2)')
+        elif flags:
+            raise ValueError('bounded Regex validators take no flags')
+        else:
+            try:
+                self.fullmatch = _compile_pattern(regex, flags, re2)
+            except re2.error as err:
+                raise ValueError('re2 does not support %r: %s'
+                                 % (regex, err))
+        self.pattern = getattr(self.fullmatch, '__self__', None)
+
+    def _matches(self, value):
+        """Return whether value is a string matching in full."""
+        return (isinstance(value, six.string_types) and
+                (self.max_length is None or len(value) <= self.max_length)
+                and self.fullmatch(value) is not None)
 
     def validate(self, value, unused_handler):
-        match = self.pattern.match(value)
-
-        if match and value == match.group():
+        if self._matches(value):
             return value
 
         self.fail()
 
+    @_bulk
+    def validate_many(self, values, handler=None):
+        matches = self._matches
+        results = []
+        failures = []
+        for index, value in enumerate(values):
+            if matches(value):
+                results.append(value)
+            else:
+                results.append(None)
+                failures.append(index)
+        return results, failures
+
 
 class Number(BaseValidator):
     """Validates floating point numbers with optional length requirements."""
@@ -115,7 +355,7 @@ class Number(BaseValidator):
     def validate(self, value, unused_handler):
         try:
             value = float(value)
-        except ValueError:
+        except (TypeError, ValueError, OverflowError):
             self.fail()
 
         if self.minimum is not None and value < self.minimum:
@@ -126,6 +366,26 @@ class Number(BaseValidator):
 
         return value
 
+    def _floats(self, values):
+        """Convert values to floats for validate_many. Returns the floats,
+        None where conversion failed, and the indexes of those failures."""
+        # pylint: disable=no-self-use
+        floats = []
+        failures = []
+        for index, value in enumerate(values):
+            try:
+                floats.append(float(value))
+            except (TypeError, ValueError, OverflowError):
+                floats.append(None)
+                failures.append(index)
+        return floats, failures
+
+    @_bulk
+    def validate_many(self, values, handler=None):
+        floats, failures = self._floats(values)
+        return _bulk_range(floats, failures, self.minimum, self.maximum,
+                           integral=False)
+
 
 class Integer(Number):
     """Validates integers with optional length requirements."""
@@ -140,9 +400,197 @@ class Integer(Number):
         # Do the Number validation first
         float_value = super(Integer, self).validate(value, handler)
 
-        int_value = int(float_value)
+        try:
+            int_value = int(float_value)
+        except (ValueError, OverflowError):  # NaN and infinities
+            self.fail()
 
         if int_value == float_value:
             return int_value
         else:
             self.fail()
+
+    @_bulk
+    def validate_many(self, values, handler=None):
+        floats, failures = self._floats(values)
+        return _bulk_range(floats, failures, self.minimum, self.maximum,
+                           integral=True)
+
+
+class Enum(BaseValidator):
+    """Validates values belonging to a set of choices."""
+
+    def __init__(self, choices):
+        super(Enum, self).__init__()
+        self.documentation = "One of: %s." % ', '.join(
+            six.text_type(choice) for choice in choices)
+        self.message = "Valid choice required."
+        try:
+            self.choices = frozenset(choices)
+        except TypeError:  # unhashable choices
+            self.choices = tuple(choices)
+
+    def validate(self, value, unused_handler):
+        try:
+            if value in self.choices:
+                return value
+        except TypeError:  # unhashable value
+            pass
+
+        self.fail()
+
+    @_bulk
+    def validate_many(self, values, handler=None):
+        choices = self.choices
+        results = []
+        failures = []
+        for index, value in enumerate(values):
+            try:
+                valid = value in choices
+            except TypeError:  # unhashable value
+                valid = False
+            results.append(value if valid else None)
+            if not valid:
+                failures.append(index)
+        return results, failures
+
+
+class CompiledValidator(BaseValidator):
+    """Base class for validators nesting other validators.
+
+    Subclasses implement compile, and store its result as _compiled once
+    initialized; validate runs it.
+    """
+
+    _compiled = None
+
+    def validate(self, value, handler):
+        return self._compiled(value, handler)
+
+    def compile(self):
+        raise NotImplementedError
+
+
+class List(CompiledValidator):
+    """Validates lists, or strings of items joined by separator (as query
+    arguments arrive), validating every item with item_validator."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, item_validator=None, min_length=None, max_length=None,
+                 separator=','):
+        super(List, self).__init__()
+        self.documentation = "List."
+        self.message = "Valid list required."
+        self.item_validator = item_validator
+        self.min_length = min_length
+        self.max_length = max_length
+        self.separator = separator
+        self._compiled = self.compile()
+
+    def compile(self):
+        fail = self.fail
+        min_length = self.min_length
+        max_length = self.max_length
+        separator = self.separator
+        check_item = (None if self.item_validator is None
+                      else compile_validator(self.item_validator))
+        item_validator = self.item_validator
+        many = None
+        if (isinstance(item_validator, BaseValidator) and
+                _mirrors_validate(type(item_validator)) and
+                six.get_unbound_function(type(item_validator).validate_many)
+                is not six.get_unbound_function(BaseValidator.validate_many)):
+            # Validated in bulk, raising at most once.
+            many = item_validator.validate_many
+
+        def check(value, handler):
+            """Validate a list and its items."""
+            if isinstance(value, six.string_types):
+                value = value.split(separator) if value else []
+            elif not isinstance(value, (list, tuple)):
+                fail()
+            length = len(value)
+            if min_length is not None and length < min_length:
+                fail()
+            if max_length is not None and length > max_length:
+                fail()
+            if check_item is None:
+                return list(value)
+            if many is not None:
+                result, failures = many(value, handler)
+                if failures:
+                    raise _nested(ValidationError(item_validator.message),
+                                  failures[0])
+                return result
+            result = []
+            append = result.append
+            for index, item in enumerate(value):
+                try:
+                    append(check_item(item, handler))
+                except ValidationError as err:
+                    raise _nested(err, index)
+            return result
+        return check
+
+
+class Dict(CompiledValidator):
+    """Validates dictionaries against a schema mapping keys to validators,
+    or lists of validators. Keys absent from the schema are dropped, and
+    keys in required must be present."""
+
+    def __init__(self, schema, required=()):
+        super(Dict, self).__init__()
+        self.documentation = "Object."
+        self.message = "Valid object required."
+        self.schema = schema
+        self.required = frozenset(required)
+        self._compiled = self.compile()
+
+    def compile(self):
+        fail = self.fail
+        required = self.required
+        fields = tuple((key, compile_validator(spec))
+                       for (key, spec) in self.schema.items())
+
+        def check(value, handler):
+            """Validate a dictionary and its values."""
+            if not isinstance(value, dict):
+                fail()
+            result = {}
+            for key, check_value in fields:
+                if key in value:
+                    try:
+                        result[key] = check_value(value[key], handler)
+                    except ValidationError as err:
+                        raise _nested(err, key)
+                elif key in required:
+                    raise _nested(ValidationError('Required.'), key)
+            return result
+        return check
+
+
+class OneOf(CompiledValidator):
+    """Validates values passing any of several validators, tried in order;
+    returns the value as validated by the first to pass."""
+
+    def __init__(self, *validators):
+        super(OneOf, self).__init__()
+        self.documentation = "One of several formats."
+        self.message = "Valid value required."
+        self.validators = validators
+        self._compiled = self.compile()
+
+    def compile(self):
+        fail = self.fail
+        checks = tuple(compile_validator(validator)
+                       for validator in self.validators)
+
+        def check(value, handler):
+            """Return the value as validated by the first check to pass."""
+            for validate in checks:
+                try:
+                    return validate(value, handler)
+                except ValidationError:
+                    pass
+            fail()
+        return check
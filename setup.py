@@ -31,9 +31,12 @@ setup(
         'Topic :: Software Development :: Libraries :: Application Frameworks'
     ],
     install_requires=[
-        'tornado',
+        'tornado>=4.3',
         'six'
     ],
+    extras_require={
+        'cache': ['redis>=3.5'],
+    },
     long_description="""\
 Chassis is Refinery29's framework layer on top of Tornado for rapidly
 building performant, self-documenting JSON-based REST APIs.